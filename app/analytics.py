@@ -0,0 +1,375 @@
+"""Trade performance statistics over a user's closed trades.
+
+The closed trades are read with one query into columnar NumPy arrays
+(TradeArrays) and every statistic is computed on those arrays, so the cost
+is one pass over the rows plus vectorised math. Results are cached per user
+and keyed by a cheap revision of the closed trades, like the mark-to-market
+valuation: any close, edit or delete changes the key.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+import numpy as np
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.cache import TTLCache
+from app.models.models import Trade, Settings, LedgerSummary
+
+# julianday() of the Unix epoch; SQLite hands timestamps back as day numbers,
+# which skips parsing 100k datetime strings in Python
+UNIX_EPOCH_JULIAN = 2440587.5
+IST_OFFSET_SECONDS = 5.5 * 3600
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+@dataclass
+class TradeArrays:
+    closed_at: np.ndarray  # epoch seconds, float64
+    opened_at: np.ndarray
+    pnl: np.ndarray
+    returns: np.ndarray  # per-trade return as a fraction
+    symbol: np.ndarray  # object arrays of strings
+    instrument_type: np.ndarray
+    against_trend: np.ndarray  # bool
+
+    def __len__(self):
+        return len(self.pnl)
+
+def load_closed_trades(db: Session, user_id: int) -> TradeArrays:
+    """One query, converted column by column and put in close-time order"""
+    closed_at = func.coalesce(Trade.exit_datetime, Trade.updated_at)
+    rows = db.execute(
+        select(
+            Trade.id,
+            (func.julianday(closed_at) - UNIX_EPOCH_JULIAN) * 86400,
+            (func.julianday(Trade.created_at) - UNIX_EPOCH_JULIAN) * 86400,
+            func.coalesce(Trade.return_amount, 0.0),
+            func.coalesce(Trade.return_percent, 0.0),
+            func.coalesce(Trade.symbol, ""),
+            func.coalesce(Trade.instrument_type, ""),
+            func.coalesce(Trade.against_trend, False)
+        )
+        .where(Trade.user_id == user_id, Trade.status == "CLOSED")
+    ).all()
+    columns = list(zip(*rows)) if rows else [()] * 8
+    closed = np.array(columns[1], dtype=np.float64)
+    # Sorting here is cheaper than an ORDER BY on an unindexed expression
+    order = np.lexsort((np.array(columns[0], dtype=np.int64), closed))
+    return TradeArrays(
+        closed_at=closed[order],
+        opened_at=np.array(columns[2], dtype=np.float64)[order],
+        pnl=np.array(columns[3], dtype=np.float64)[order],
+        returns=np.array(columns[4], dtype=np.float64)[order] / 100,
+        symbol=np.array(columns[5], dtype=object)[order],
+        instrument_type=np.array(columns[6], dtype=object)[order],
+        against_trend=np.array(columns[7], dtype=bool)[order]
+    )
+
+def _ratio(numerator: float, denominator: float) -> Optional[float]:
+    return float(numerator / denominator) if denominator else None
+
+def _iso(epoch_seconds: float) -> str:
+    return datetime.fromtimestamp(round(epoch_seconds), timezone.utc).replace(tzinfo=None).isoformat()
+
+def equity_curve(pnl: np.ndarray, closed_at: np.ndarray, start: float, points: int) -> dict:
+    equity = start + np.cumsum(pnl)
+    peak = np.maximum.accumulate(np.concatenate(([start], equity)))[1:]
+    drawdown = equity - peak
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown_pct = np.where(peak > 0, drawdown / peak * 100, 0.0)
+
+    worst = int(np.argmin(drawdown)) if len(drawdown) else None
+    # Downsample for the chart, always keeping the last point and the deepest drawdown
+    if len(equity) > points:
+        keep = np.unique(np.concatenate((np.linspace(0, len(equity) - 1, points).astype(int), [worst])))
+    else:
+        keep = np.arange(len(equity))
+    return {
+        "start": start,
+        "end": float(equity[-1]) if len(equity) else start,
+        "max_drawdown": float(-drawdown[worst]) if worst is not None else 0.0,
+        "max_drawdown_percent": float(-drawdown_pct.min()) if len(drawdown_pct) else 0.0,
+        "max_drawdown_at": _iso(closed_at[worst]) if worst is not None else None,
+        "curve": [
+            {"trade": i + 1, "time": _iso(t), "equity": round(e, 2), "drawdown": round(d, 2), "pnl": p}
+            for i, t, e, d, p in zip(keep.tolist(), closed_at[keep].tolist(), equity[keep].tolist(),
+                                     drawdown[keep].tolist(), pnl[keep].tolist())
+        ]
+    }
+
+def streaks(pnl: np.ndarray) -> dict:
+    """Longest and current runs of wins (pnl > 0) and losses (pnl <= 0)"""
+    if not len(pnl):
+        return {"longest_win": 0, "longest_loss": 0, "current": 0, "current_type": None}
+    wins = pnl > 0
+    # Run boundaries: every index where the outcome flips
+    starts = np.concatenate(([0], np.flatnonzero(wins[1:] != wins[:-1]) + 1))
+    lengths = np.diff(np.concatenate((starts, [len(wins)])))
+    run_wins = wins[starts]
+    return {
+        "longest_win": int(lengths[run_wins].max()) if run_wins.any() else 0,
+        "longest_loss": int(lengths[~run_wins].max()) if (~run_wins).any() else 0,
+        "current": int(lengths[-1]),
+        "current_type": "WIN" if run_wins[-1] else "LOSS"
+    }
+
+def ratios(returns: np.ndarray) -> dict:
+    """Per-trade Sharpe and Sortino (risk-free rate 0, not annualised)"""
+    if len(returns) < 2:
+        return {"sharpe": None, "sortino": None}
+    mean = returns.mean()
+    std = returns.std(ddof=1)
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2))
+    return {"sharpe": _ratio(mean, std), "sortino": _ratio(mean, downside)}
+
+def breakdown(keys: np.ndarray, pnl: np.ndarray, labels: Optional[List[str]] = None) -> List[dict]:
+    """Count, wins and P&L per distinct key, by total P&L descending"""
+    if not len(pnl):
+        return []
+    if labels is None:
+        values, index = np.unique(keys, return_inverse=True)
+        values = [str(v) for v in values]
+    else:
+        values, index = labels, keys
+    size = len(values)
+    count = np.bincount(index, minlength=size)
+    wins = np.bincount(index, weights=(pnl > 0).astype(np.float64), minlength=size)
+    total = np.bincount(index, weights=pnl, minlength=size)
+    rows = [
+        {
+            "key": values[i],
+            "trades": int(count[i]),
+            "wins": int(wins[i]),
+            "win_rate": float(wins[i] / count[i] * 100),
+            "pnl": float(total[i]),
+            "avg_pnl": float(total[i] / count[i])
+        }
+        for i in np.flatnonzero(count)
+    ]
+    if labels is None:
+        rows.sort(key=lambda r: r["pnl"], reverse=True)
+    return rows
+
+def compute_analytics(trades: TradeArrays, initial_capital: float, points: int = 500) -> dict:
+    pnl = trades.pnl
+    wins = pnl > 0
+    gross_profit = float(pnl[wins].sum())
+    gross_loss = float(-pnl[~wins].sum())
+    count = len(trades)
+    win_count = int(wins.sum())
+
+    # Weekday and hour of entry on the exchange's clock
+    local = (trades.opened_at + IST_OFFSET_SECONDS).astype(np.int64)
+    weekday = ((local // 86400) + 3) % 7  # 1970-01-01 was a Thursday
+    hour = (local % 86400) // 3600
+    # Month of exit, in date order
+    months, month = np.unique((trades.closed_at + IST_OFFSET_SECONDS).astype("datetime64[s]").astype("datetime64[M]"),
+                              return_inverse=True)
+
+    return {
+        "trades": count,
+        "wins": win_count,
+        "losses": count - win_count,
+        "win_rate": win_count / count * 100 if count else 0,
+        "total_pl": float(pnl.sum()),
+        "gross_profit": gross_profit,
+        "gross_loss": gross_loss,
+        "profit_factor": _ratio(gross_profit, gross_loss),
+        "expectancy": float(pnl.mean()) if count else 0.0,
+        "avg_win": float(pnl[wins].mean()) if win_count else 0.0,
+        "avg_loss": float(pnl[~wins].mean()) if count - win_count else 0.0,
+        "avg_return_percent": float(trades.returns.mean() * 100) if count else 0.0,
+        "best_trade": float(pnl.max()) if count else None,
+        "worst_trade": float(pnl.min()) if count else None,
+        **ratios(trades.returns),
+        "streaks": streaks(pnl),
+        "equity": equity_curve(pnl, trades.closed_at, initial_capital, points),
+        "by_symbol": breakdown(trades.symbol, pnl),
+        "by_instrument_type": breakdown(trades.instrument_type, pnl),
+        "by_against_trend": breakdown(trades.against_trend.astype(np.int64), pnl, ["with trend", "against trend"]),
+        "by_weekday": breakdown(weekday, pnl, WEEKDAYS),
+        "by_hour": breakdown(hour, pnl, [f"{h:02d}:00" for h in range(24)]),
+        "by_month": breakdown(month, pnl, [str(m) for m in months])
+    }
+
+async def closed_trades_revision(db: AsyncSession, user_id: int) -> tuple:
+    """Changes whenever a trade is closed, edited or deleted. Closing or editing moves
+    the newest updated_at (a single seek on ix_trades_user_status_updated); deleting
+    changes the ledger's closed_count. Counting the closed trades would scan them all."""
+    return tuple((await db.execute(select(
+        select(func.max(Trade.updated_at))
+            .where(Trade.user_id == user_id, Trade.status == "CLOSED").scalar_subquery(),
+        select(LedgerSummary.closed_count).where(LedgerSummary.user_id == user_id).scalar_subquery()
+    ))).one())
+
+class AnalyticsCache:
+    """Per-user results, keyed by a revision of the closed trades and the curve
+    resolution. Computing runs on a sync session in a worker thread."""
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory
+        self._cache: Dict[int, tuple] = {}
+        self.computations = 0
+
+    def compute(self, user_id: int, points: int) -> dict:
+        from app.database import SessionLocal
+        db = (self.session_factory or SessionLocal)()
+        try:
+            initial_capital = db.scalar(select(Settings.initial_capital).where(Settings.user_id == user_id)) or 0
+            trades = load_closed_trades(db, user_id)
+        finally:
+            db.close()
+        self.computations += 1
+        return compute_analytics(trades, float(initial_capital), points)
+
+    async def get(self, db: AsyncSession, user_id: int, points: int = 500) -> dict:
+        revision = await closed_trades_revision(db, user_id)
+        capital = await db.scalar(select(Settings.initial_capital).where(Settings.user_id == user_id))
+        key = (revision, capital, points)
+        cached = self._cache.get(user_id)
+        if cached and cached[0] == key:
+            return cached[1]
+        result = await run_in_threadpool(self.compute, user_id, points)
+        self._cache[user_id] = (key, result)
+        return result
+
+analytics_cache = AnalyticsCache()
+
+# P&L series: closed trades summed per local day, week (from Monday) or month
+BUCKETS = ("day", "week", "month")
+DEFAULT_BUCKET_COUNT = {"day": 30, "week": 12, "month": 12}
+MAX_BUCKETS = 1000
+
+def bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+def next_bucket(start: date, bucket: str) -> date:
+    if bucket == "week":
+        return start + timedelta(days=7)
+    if bucket == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+def bucket_starts(first: date, last: date, bucket: str) -> List[date]:
+    starts, day = [], bucket_start(first, bucket)
+    while day <= last:
+        starts.append(day)
+        day = next_bucket(day, bucket)
+    return starts
+
+def local_midnight_utc(day: date, tz: ZoneInfo) -> datetime:
+    """Naive UTC, the way timestamps are stored"""
+    return datetime.combine(day, time(), tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+
+def _offset(instant: datetime, tz: ZoneInfo) -> int:
+    return int(instant.replace(tzinfo=timezone.utc).astimezone(tz).utcoffset().total_seconds())
+
+def offset_segments(start: datetime, end: datetime, tz: ZoneInfo) -> List[Tuple[datetime, datetime, int]]:
+    """Split [start, end) (naive UTC) into spans with a constant UTC offset in `tz`"""
+    segments = []
+    seg_start, offset = start, _offset(start, tz)
+    probe = start
+    while probe < end:
+        step = min(probe + timedelta(days=1), end)
+        edge = step if step < end else end - timedelta(seconds=1)
+        if _offset(edge, tz) != offset:
+            # Narrow the transition down to the second
+            lo, hi = 0, int((step - probe).total_seconds())
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if _offset(probe + timedelta(seconds=mid), tz) == offset:
+                    lo = mid
+                else:
+                    hi = mid
+            change = probe + timedelta(seconds=hi)
+            segments.append((seg_start, change, offset))
+            seg_start, offset = change, _offset(change, tz)
+        probe = step
+    segments.append((seg_start, end, offset))
+    return segments
+
+def bucket_expression(bucket: str, offset_seconds: int):
+    """The local bucket start as 'YYYY-MM-DD', computed by SQLite from the exit time"""
+    shift = f"{offset_seconds:+d} seconds"
+    if bucket == "week":
+        return func.date(Trade.exit_datetime, shift, "weekday 0", "-6 days")
+    if bucket == "month":
+        return func.strftime("%Y-%m-01", Trade.exit_datetime, shift)
+    return func.date(Trade.exit_datetime, shift)
+
+def sum_buckets(db: Session, user_id: int, bucket: str, tz: ZoneInfo,
+                start: datetime, end: datetime) -> Dict[str, Tuple[float, int]]:
+    """{bucket start: (P&L, trades)} for trades closed in [start, end), naive UTC.
+    One GROUP BY per UTC-offset segment, each a range scan of ix_trades_user_status_exit."""
+    sums: Dict[str, Tuple[float, int]] = {}
+    for seg_start, seg_end, offset in offset_segments(start, end, tz):
+        key = bucket_expression(bucket, offset)
+        rows = db.execute(
+            select(key, func.coalesce(func.sum(Trade.return_amount), 0), func.count(Trade.id))
+            .where(Trade.user_id == user_id, Trade.status == "CLOSED",
+                   Trade.exit_datetime >= seg_start, Trade.exit_datetime < seg_end)
+            .group_by(key)
+        ).all()
+        for day, amount, count in rows:
+            previous = sums.get(day, (0.0, 0))
+            sums[day] = (previous[0] + amount, previous[1] + count)
+    return sums
+
+# (revision, sums) for the finished part of recently requested ranges
+pnl_cache = TTLCache(ttl=86400, max_entries=256)
+
+async def pnl_series(db: AsyncSession, user_id: int, bucket: str, first: Optional[date],
+                     last: Optional[date], tz_name: str) -> dict:
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    try:
+        tz = ZoneInfo(tz_name)
+    except (ValueError, KeyError):
+        raise ValueError(f"Unknown timezone {tz_name!r}")
+    today = datetime.now(tz).date()
+    last = last or today
+    if first is None:
+        first = bucket_start(last, bucket)
+        for _ in range(DEFAULT_BUCKET_COUNT[bucket] - 1):
+            first = bucket_start(first - timedelta(days=1), bucket)
+    if first > last:
+        raise ValueError("start must not be after end")
+    starts = bucket_starts(first, last, bucket)
+    if len(starts) > MAX_BUCKETS:
+        raise ValueError(f"At most {MAX_BUCKETS} buckets per request")
+
+    # Trades closed before the current bucket began can only change through an
+    # edit, import or delete, so that part of the range is cached under the revision
+    cutoff = min(bucket_start(today, bucket), last + timedelta(days=1))
+    sums: Dict[str, Tuple[float, int]] = {}
+    if first < cutoff:
+        revision = await closed_trades_revision(db, user_id)
+        key = (user_id, bucket, tz_name, first, cutoff)
+        cached = pnl_cache.get(key)
+        if cached and cached[0] == revision:
+            sums.update(cached[1])
+        else:
+            closed = await db.run_sync(sum_buckets, user_id, bucket, tz,
+                                       local_midnight_utc(first, tz), local_midnight_utc(cutoff, tz))
+            pnl_cache.set(key, (revision, closed))
+            sums.update(closed)
+    if last >= cutoff:
+        for day, (amount, count) in (await db.run_sync(
+            sum_buckets, user_id, bucket, tz, local_midnight_utc(max(first, cutoff), tz),
+            local_midnight_utc(last + timedelta(days=1), tz)
+        )).items():
+            previous = sums.get(day, (0.0, 0))
+            sums[day] = (previous[0] + amount, previous[1] + count)
+
+    series = []
+    for day in starts:
+        amount, count = sums.get(day.isoformat(), (0.0, 0))
+        series.append({"start": day.isoformat(), "amount": amount, "trades": count})
+    return {"bucket": bucket, "timezone": tz_name, "start": first.isoformat(), "end": last.isoformat(),
+            "series": series}
@@ -1,3 +1,7 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -7,12 +11,15 @@ import pyotp
 import qrcode
 import io
 import base64
+import time
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
 from app.database import get_db
 from app.models.models import User
+from app.cache import TTLCache
 
 security = HTTPBearer(auto_error=False)
 
@@ -30,6 +37,66 @@ def get_password_hash(password: str) -> str:
     hash_value = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000).hex()
     return f"{salt}${hash_value}"
 
+# PBKDF2 (hashlib releases the GIL) and QR rendering run here instead of on the event loop
+auth_executor = ThreadPoolExecutor(max_workers=settings.AUTH_WORKERS, thread_name_prefix="auth")
+auth_slots = asyncio.Semaphore(settings.AUTH_WORKERS * 2)
+
+async def run_auth_task(func, *args):
+    """Run a CPU-bound auth primitive on the auth pool; at most 2x workers queued at once"""
+    async with auth_slots:
+        return await asyncio.get_running_loop().run_in_executor(auth_executor, func, *args)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_auth_task(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await run_auth_task(get_password_hash, password)
+
+async def generate_qr_code_async(uri: str) -> str:
+    return await run_auth_task(generate_qr_code, uri)
+
+class LoginThrottle:
+    """Counts failed logins per key in a sliding window; a key over its limit is refused
+    before any password hashing happens"""
+
+    def __init__(self, window: float, max_keys: int = 10000):
+        self.window = window
+        self.max_keys = max_keys
+        self._failures = {}
+
+    def _recent(self, key, now):
+        failures = self._failures.get(key)
+        if failures is None:
+            return None
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+            return None
+        return failures
+
+    def retry_after(self, key, limit: int) -> int:
+        """Seconds until `key` may try again, 0 if it is under `limit`"""
+        now = time.monotonic()
+        failures = self._recent(key, now)
+        if not failures or len(failures) < limit:
+            return 0
+        return max(1, int(failures[-limit] + self.window - now) + 1)
+
+    def record_failure(self, key):
+        now = time.monotonic()
+        if key not in self._failures and len(self._failures) >= self.max_keys:
+            for stale in list(self._failures):
+                self._recent(stale, now)
+            if len(self._failures) >= self.max_keys:
+                self._failures.pop(next(iter(self._failures)))
+        self._failures.setdefault(key, deque()).append(now)
+
+    def reset(self, key):
+        self._failures.pop(key, None)
+
+login_throttle = LoginThrottle(settings.LOGIN_FAILURE_WINDOW_SECONDS)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -63,11 +130,40 @@ def verify_totp(secret: str, code: str) -> bool:
     totp = pyotp.TOTP(secret)
     return totp.verify(code)
 
+@dataclass(frozen=True)
+class CurrentUser:
+    """What most endpoints need from the logged-in user, safe to cache between requests"""
+    id: int
+    username: str
+    mfa_enabled: bool
+    created_at: datetime
+
+# token -> username, so a repeat request skips the JWT decode
+token_cache = TTLCache(settings.AUTH_CACHE_TTL_SECONDS, settings.AUTH_CACHE_MAX_ENTRIES)
+# username -> CurrentUser, so a repeat request skips the users lookup
+user_cache = TTLCache(settings.AUTH_CACHE_TTL_SECONDS, settings.AUTH_CACHE_MAX_ENTRIES)
+
+def invalidate_user(username: str):
+    """Call after changing anything about a user that authentication depends on"""
+    user_cache.pop(username)
+
+def token_username(token: str) -> Optional[str]:
+    username = token_cache.get(token)
+    if username is not None:
+        return username
+
+    payload = verify_token(token)
+    username = payload.get("sub") if payload else None
+    if username:
+        # Never keep a token cached past its own expiry
+        token_cache.set(token, username, ttl=payload["exp"] - time.time() if "exp" in payload else None)
+    return username
+
 async def get_current_user(
     request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
+    db: AsyncSession = Depends(get_db)
+) -> CurrentUser:
     token = None
     
     # Check Authorization header
@@ -84,25 +180,39 @@ async def get_current_user(
             detail="Not authenticated"
         )
     
-    payload = verify_token(token)
-    if not payload:
+    username = token_username(token)
+    if not username:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token"
         )
     
-    username = payload.get("sub")
-    if not username:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
+    current = user_cache.get(username)
+    if current is None:
+        user = await db.scalar(select(User).where(User.username == username))
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found"
+            )
+        current = CurrentUser(
+            id=user.id, username=user.username,
+            mfa_enabled=user.mfa_enabled, created_at=user.created_at
         )
+        user_cache.set(username, current)
     
-    user = db.query(User).filter(User.username == username).first()
+    return current
+
+async def get_current_user_model(
+    current: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """The ORM row for the logged-in user, for endpoints that read secrets or modify it"""
+    user = await db.get(User, current.id)
     if not user:
+        invalidate_user(current.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
-    
     return user
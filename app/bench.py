@@ -0,0 +1,340 @@
+"""Benchmarks run through python -m app.cli bench-*; they never touch DATABASE_URL."""
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app.database import Base, create_db_engine
+from app.models.models import User, Trade
+
+def seed_trades(session, user_id: int, count: int):
+    now = datetime.utcnow()
+    session.bulk_insert_mappings(Trade, [
+        {
+            "user_id": user_id,
+            "trade_number": i + 1,
+            "symbol": random.choice(["NIFTY", "BANKNIFTY", "FINNIFTY", "RELIANCE"]),
+            "instrument_type": "NIFTY_OPTION",
+            "lot_size": 65,
+            "avg_price": 100.0,
+            "exit_price": exit_price,
+            "return_amount": (exit_price - 100.0) * 65,
+            "return_percent": exit_price - 100.0,
+            "against_trend": random.random() < 0.2,
+            "status": "CLOSED",
+            "created_at": now - timedelta(minutes=count - i),
+            "exit_datetime": now - timedelta(minutes=count - i),
+            "updated_at": now - timedelta(minutes=count - i)
+        }
+        for i, exit_price in ((i, 100.0 + random.uniform(-20, 25)) for i in range(count))
+    ])
+    session.commit()
+
+def temp_database(profile: str, seed: int = 0, password_hash: str = "x"):
+    """A throwaway file database with one user and `seed` closed trades"""
+    path = os.path.join(tempfile.mkdtemp(prefix="trade-diary-bench-"), "bench.db")
+    engine = create_db_engine(f"sqlite:///{path}", profile=profile)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autoflush=False, bind=engine)
+    session = Session()
+    user = User(username="bench", password_hash=password_hash)
+    session.add(user)
+    session.commit()
+    user_id = user.id
+    if seed:
+        seed_trades(session, user_id, seed)
+    session.close()
+    return engine, Session, user_id
+
+def run_read_write(profile: str, readers: int, writers: int, seconds: float, seed: int) -> dict:
+    """Readers run dashboard-style aggregates while writers insert and commit trades"""
+    engine, Session, user_id = temp_database(profile, seed)
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def reader():
+        session = Session()
+        while time.perf_counter() < deadline:
+            try:
+                session.query(func.count(Trade.id), func.sum(Trade.return_amount)).filter(
+                    Trade.user_id == user_id, Trade.status == "CLOSED"
+                ).one()
+                session.rollback()
+                bump("reads")
+            except OperationalError:
+                session.rollback()
+                bump("errors")
+        session.close()
+
+    def writer():
+        session = Session()
+        while time.perf_counter() < deadline:
+            try:
+                session.add(Trade(user_id=user_id, symbol="NIFTY", instrument_type="NIFTY_OPTION",
+                                  lot_size=65, avg_price=100.0, status="OPEN"))
+                session.commit()
+                bump("writes")
+            except OperationalError:
+                session.rollback()
+                bump("errors")
+        session.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+    return {k: v / seconds for k, v in counts.items()}
+
+def bench_db(readers: int = 8, writers: int = 2, seconds: float = 5.0, seed: int = 5000):
+    print(f"{readers} readers, {writers} writers, {seconds:.0f}s per profile, {seed} seeded trades")
+    for profile in ("default", "wal"):
+        result = run_read_write(profile, readers, writers, seconds, seed)
+        print(f"{profile:>8}: {result['reads']:9.1f} reads/s {result['writes']:8.1f} writes/s "
+              f"{result['errors']:6.1f} lock errors/s")
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+LOAD_MIX = [
+    ("dashboard", "/api/dashboard", 3),
+    ("trades page", "/api/trades?fields=summary", 3),
+    ("weekly chart", "/api/dashboard/weekly-chart", 2),
+    ("settings", "/api/settings", 2),
+    ("auth me", "/api/auth/me", 2),
+]
+
+def start_server(db_path: str, port: int, workers: int = 1):
+    import subprocess
+    import sys
+    import httpx
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", MARKET_PROVIDER="fake",
+               BLOB_DIR=os.path.join(os.path.dirname(db_path), "blobs"))
+    if workers > 1:
+        # Seed once up front; workers starting together would race to create the default rows
+        subprocess.run([sys.executable, "-c", "from app.main import init_db; init_db()"], env=env, check=True)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning",
+         "--workers", str(workers)],
+        env=env
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/auth/me", timeout=1.0)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("Server did not start")
+
+async def drive_load(base_url: str, token: str, concurrency: int, seconds: float) -> dict:
+    import asyncio
+    import httpx
+    latencies = {name: [] for name, _, _ in LOAD_MIX}
+    latencies["errors"] = []
+    weighted = [(name, path) for name, path, weight in LOAD_MIX for _ in range(weight)]
+    deadline = time.perf_counter() + seconds
+
+    async def worker(client):
+        while time.perf_counter() < deadline:
+            name, path = random.choice(weighted)
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies[name if ok else "errors"].append((time.perf_counter() - start) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, cookies={"access_token": token},
+                                 limits=limits, timeout=30.0) as client:
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+    return latencies
+
+def bench_load(concurrency: int = 32, seconds: float = 10.0, seed: int = 20000, port: int = 8765):
+    """Mixed concurrent traffic against a real uvicorn server on a seeded throwaway database"""
+    import asyncio
+    from app.auth import create_access_token
+    engine, Session, user_id = temp_database("wal", seed)
+    db_path = engine.url.database
+    engine.dispose()
+
+    proc = start_server(db_path, port)
+    try:
+        token = create_access_token({"sub": "bench"})
+        latencies = asyncio.run(drive_load(f"http://127.0.0.1:{port}", token, concurrency, seconds))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    errors = latencies.pop("errors")
+    total = sum(len(v) for v in latencies.values())
+    print(f"{concurrency} clients, {seconds:.0f}s, {seed} seeded trades: {total / seconds:.1f} req/s, {len(errors)} errors")
+    for name, values in latencies.items():
+        print(f"{name:>14}: n={len(values):6d}  p50={percentile(values, 50):8.1f}ms  p99={percentile(values, 99):8.1f}ms")
+    everything = [v for values in latencies.values() for v in values]
+    print(f"{'all':>14}: n={len(everything):6d}  p50={percentile(everything, 50):8.1f}ms  p99={percentile(everything, 99):8.1f}ms")
+
+async def drive_groups(base_url: str, token: str, groups, seconds: float) -> dict:
+    """Each group is (name, workers, method, path, json); every worker repeats its request"""
+    import asyncio
+    import httpx
+    results = {name: {"ok": [], "throttled": 0, "errors": 0} for name, *_ in groups}
+    deadline = time.perf_counter() + seconds
+
+    async def worker(client, name, method, path, body):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+            except httpx.HTTPError:
+                results[name]["errors"] += 1
+                continue
+            if response.status_code == 429:
+                results[name]["throttled"] += 1
+            elif response.status_code < 400 or path.endswith("/login"):
+                results[name]["ok"].append((time.perf_counter() - start) * 1000)
+            else:
+                results[name]["errors"] += 1
+
+    workers = sum(count for _, count, *_ in groups)
+    async with httpx.AsyncClient(base_url=base_url, cookies={"access_token": token},
+                                 limits=httpx.Limits(max_connections=workers), timeout=30.0) as client:
+        await asyncio.gather(*[
+            worker(client, name, method, path, body)
+            for name, count, method, path, body in groups
+            for _ in range(count)
+        ])
+    return results
+
+def bench_auth(readers: int = 8, logins: int = 8, seconds: float = 10.0, seed: int = 5000, port: int = 8766):
+    """Dashboard latency on its own, during a burst of valid logins and during a burst of bad ones"""
+    import asyncio
+    from app.auth import create_access_token, get_password_hash
+    engine, Session, user_id = temp_database("wal", seed, password_hash=get_password_hash("bench"))
+    db_path = engine.url.database
+    engine.dispose()
+
+    dashboard = ("dashboard", readers, "GET", "/api/dashboard", None)
+    good = ("login", logins, "POST", "/api/auth/login", {"username": "bench", "password": "bench"})
+    bad = ("bad login", logins, "POST", "/api/auth/login", {"username": "bench", "password": "wrong"})
+    phases = [("idle", [dashboard]), ("logins", [dashboard, good]), ("bad logins", [dashboard, bad])]
+
+    proc = start_server(db_path, port)
+    try:
+        token = create_access_token({"sub": "bench"})
+        print(f"{readers} dashboard clients, {logins} login clients, {seconds:.0f}s per phase, {seed} seeded trades")
+        for phase, groups in phases:
+            results = asyncio.run(drive_groups(f"http://127.0.0.1:{port}", token, groups, seconds))
+            for name, result in results.items():
+                values = result["ok"]
+                print(f"{phase:>10} {name:>10}: {len(values) / seconds:7.1f} req/s  p50={percentile(values, 50):8.1f}ms  "
+                      f"p99={percentile(values, 99):8.1f}ms  throttled={result['throttled']}  errors={result['errors']}")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def bench_trade_numbers(clients: int = 16, trades: int = 25, workers: int = 2, seed: int = 100, port: int = 8767) -> int:
+    """Create trades in parallel from several uvicorn workers, with deletes mixed in, and
+    check every trade got its own number. Returns 1 on a duplicate or failed create."""
+    import asyncio
+    import httpx
+    from app.auth import create_access_token
+    engine, Session, user_id = temp_database("wal", seed)
+    db_path = engine.url.database
+
+    body = {"symbol": "NIFTY", "instrument_type": "NIFTY_OPTION", "lot_size": 65,
+            "entries": [{"price": 100.0, "lots": 1, "quantity": 65}]}
+    failures = []
+
+    async def client_run(client, index):
+        for i in range(trades):
+            try:
+                response = await client.post("/api/trades", json=body)
+            except httpx.HTTPError as e:
+                failures.append(repr(e))
+                continue
+            if response.status_code != 200:
+                failures.append(response.status_code)
+            elif (index + i) % 5 == 0:
+                # Deletes used to hand the same number out again
+                await client.delete(f"/api/trades/{response.json()['id']}")
+
+    async def drive(base_url, token):
+        async with httpx.AsyncClient(base_url=base_url, cookies={"access_token": token},
+                                     limits=httpx.Limits(max_connections=clients), timeout=60.0) as client:
+            await asyncio.gather(*[client_run(client, index) for index in range(clients)])
+
+    proc = start_server(db_path, port, workers)
+    try:
+        start = time.perf_counter()
+        asyncio.run(drive(f"http://127.0.0.1:{port}", create_access_token({"sub": "bench"})))
+        elapsed = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    session = Session()
+    numbers = [n for (n,) in session.query(Trade.trade_number).filter(Trade.user_id == user_id)]
+    session.close()
+    engine.dispose()
+    created = [n for n in numbers if n > seed]
+    duplicates = len(numbers) - len(set(numbers))
+    print(f"{clients} clients x {trades} trades on {workers} workers in {elapsed:.1f}s "
+          f"({clients * trades / elapsed:.1f} creates/s): {len(created)} kept, numbers "
+          f"{min(created, default=0)}..{max(created, default=0)}, {duplicates} duplicates, "
+          f"{len(failures)} failed creates")
+    return 1 if duplicates or failures else 0
+
+def bench_analytics(trades: int = 100000, repeats: int = 50):
+    """Cold and cached /api/analytics computation on `trades` seeded closed trades"""
+    import asyncio
+    from app.analytics import AnalyticsCache, load_closed_trades, compute_analytics
+    from app.database import create_async_db_engine
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    engine, Session, user_id = temp_database("wal", trades)
+
+    session = Session()
+    start = time.perf_counter()
+    arrays = load_closed_trades(session, user_id)
+    load_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    result = compute_analytics(arrays, 40000.0)
+    compute_ms = (time.perf_counter() - start) * 1000
+    session.close()
+
+    async def through_cache():
+        async_engine = create_async_db_engine(str(engine.url), profile="wal")
+        AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+        cache = AnalyticsCache(Session)
+        timings = []
+        async with AsyncSession() as db:
+            for _ in range(repeats + 1):
+                start = time.perf_counter()
+                await cache.get(db, user_id)
+                timings.append((time.perf_counter() - start) * 1000)
+                await db.rollback()
+        await async_engine.dispose()
+        return timings, cache.computations
+
+    timings, computations = asyncio.run(through_cache())
+    engine.dispose()
+    print(f"{len(arrays)} closed trades: load {load_ms:.1f}ms, compute {compute_ms:.1f}ms "
+          f"(profit factor {result['profit_factor']:.2f}, max drawdown {result['equity']['max_drawdown']:.0f})")
+    print(f"through the cache: cold {timings[0]:.1f}ms, cached p50={percentile(timings[1:], 50):.2f}ms "
+          f"p99={percentile(timings[1:], 99):.2f}ms over {repeats} requests, {computations} computation")
@@ -0,0 +1,140 @@
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+import tempfile
+from typing import List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models.models import Blob, Trade
+
+DATA_URL_RE = re.compile(r"^data:(?P<mime>[\w.+-]+/[\w.+-]+)?(?:;[^,]*)?;base64,(?P<data>.*)$", re.DOTALL)
+BLOB_URL_PREFIX = "/api/blobs/"
+# Blobs are served back same-origin, so only image types are accepted
+IMAGE_TYPES = ("image/png", "image/jpeg", "image/gif", "image/webp")
+
+def blob_path(blob_hash: str) -> str:
+    # Two-level fan-out keeps directory listings small
+    return os.path.join(settings.BLOB_DIR, blob_hash[:2], blob_hash)
+
+def blob_url(blob_hash: Optional[str]) -> Optional[str]:
+    return f"{BLOB_URL_PREFIX}{blob_hash}" if blob_hash else None
+
+def decode_data_url(data_url: str) -> Tuple[bytes, str]:
+    match = DATA_URL_RE.match(data_url.strip())
+    if not match:
+        raise ValueError("Screenshot must be a base64 data URL")
+    try:
+        data = base64.b64decode(match.group("data"), validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Screenshot is not valid base64")
+    if not data:
+        raise ValueError("Screenshot is empty")
+    if match.group("mime") not in IMAGE_TYPES:
+        raise ValueError("Screenshot must be a PNG, JPEG, GIF or WebP image")
+    return data, match.group("mime")
+
+def write_blob(data: bytes) -> str:
+    blob_hash = hashlib.sha256(data).hexdigest()
+    path = blob_path(blob_hash)
+
+    # Identical pastes hash to the same file, so only the first one is written
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A temp file of its own per write, so two threads saving the same paste
+        # don't share one; whichever replace lands last wins with identical bytes
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return blob_hash
+
+def register_blobs(db: Session, blobs: List[Tuple[str, str, int]]):
+    # Two trades saving the same image at once both insert its row; keep the first
+    db.execute(
+        insert(Blob).on_conflict_do_nothing(index_elements=["hash"]),
+        [{"hash": blob_hash, "mime_type": mime_type, "size": size} for blob_hash, mime_type, size in blobs]
+    )
+
+def make_thumbnail(data: bytes) -> Tuple[str, bytes]:
+    """The image's MIME type as PIL reads it and a JPEG thumbnail. Raises ValueError
+    unless the bytes really are an image of one of IMAGE_TYPES."""
+    from PIL import Image
+    try:
+        img = Image.open(io.BytesIO(data))
+        mime_type = Image.MIME.get(img.format)
+        if mime_type not in IMAGE_TYPES:
+            raise ValueError(f"unsupported format {img.format}")
+        img.thumbnail((settings.THUMBNAIL_SIZE, settings.THUMBNAIL_SIZE))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=80)
+    except Exception:
+        raise ValueError("Screenshot is not a readable PNG, JPEG, GIF or WebP image")
+    return mime_type, buffer.getvalue()
+
+def write_screenshot(data_url: str) -> List[Tuple[str, str, int]]:
+    """Decode a pasted data URL once and write the image and its thumbnail to disk.
+    Returns (hash, mime type, size) for the image, then for the thumbnail."""
+    data, _ = decode_data_url(data_url)
+    # Nothing is written unless PIL can read the image; store the type it found,
+    # not the one the data URL claimed
+    mime_type, thumb = make_thumbnail(data)
+    return [(write_blob(data), mime_type, len(data)), (write_blob(thumb), "image/jpeg", len(thumb))]
+
+def store_screenshot(db: Session, data_url: str) -> Tuple[str, str]:
+    """Write a screenshot and return (image hash, thumbnail hash)"""
+    blobs = write_screenshot(data_url)
+    register_blobs(db, blobs)
+    return blobs[0][0], blobs[1][0]
+
+async def set_trade_screenshot(db: AsyncSession, trade: Trade, screenshot: Optional[str]):
+    """Apply a screenshot value from the client: a new data URL, or the existing blob URL"""
+    if not screenshot:
+        trade.screenshot_hash = None
+        trade.screenshot_thumb_hash = None
+        return
+    if screenshot.startswith(BLOB_URL_PREFIX):
+        if screenshot != blob_url(trade.screenshot_hash):
+            raise ValueError("Unknown screenshot reference")
+        return
+    # Decoding, hashing and thumbnailing are CPU and disk work, keep them off the event loop
+    blobs = await run_in_threadpool(write_screenshot, screenshot)
+    await db.run_sync(register_blobs, blobs)
+    trade.screenshot_hash = blobs[0][0]
+    trade.screenshot_thumb_hash = blobs[1][0]
+    trade.screenshot = None
+
+def migrate_screenshots(db: Session, batch_size: int = 20) -> int:
+    """Move inline base64 screenshots out of the trades table into the blob store"""
+    ids = [row[0] for row in db.query(Trade.id).filter(Trade.screenshot.isnot(None)).all()]
+    moved = 0
+    for start in range(0, len(ids), batch_size):
+        rows = db.query(Trade.id, Trade.screenshot).filter(Trade.id.in_(ids[start:start + batch_size])).all()
+        for trade_id, screenshot in rows:
+            try:
+                image_hash, thumb_hash = store_screenshot(db, screenshot)
+            except ValueError as e:
+                print(f"Skipping screenshot of trade {trade_id}: {e}")
+                continue
+            # Keep updated_at as-is, the dashboard uses it as the close time
+            db.query(Trade).filter(Trade.id == trade_id).update({
+                Trade.screenshot: None,
+                Trade.screenshot_hash: image_hash,
+                Trade.screenshot_thumb_hash: thumb_hash,
+                Trade.updated_at: Trade.updated_at
+            }, synchronize_session=False)
+            moved += 1
+        db.commit()
+    return moved
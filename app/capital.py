@@ -0,0 +1,222 @@
+"""Capital over time: deposits, withdrawals and realized P&L as one cash-flow stream.
+
+Each source is read in date order through its (user_id, date) index:
+investments, withdrawals, and closed trades by exit time. The three sorted
+lists are k-way merged with heapq.merge. The stream gives the daily capital
+curve, a time-weighted return that ignores when money was added or taken
+out, a money-weighted return (XIRR) that does not, and how much of the
+reserve fund has been drawn.
+
+Results are cached per user. Every source has its own cheap revision, so a
+new withdrawal reloads only the withdrawals before the stream is merged
+again.
+"""
+import heapq
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, List, Optional
+import numpy as np
+from sqlalchemy import case, select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.models.models import Investment, Withdrawal, Trade, Settings
+from app.ticks import IST
+
+SOURCES = ("investments", "withdrawals", "trades")
+RESERVE_TYPE = "RESERVE"
+DAYS_PER_YEAR = 365.25
+
+@dataclass(frozen=True)
+class Flow:
+    at: datetime  # naive IST
+    kind: str  # INVESTMENT, WITHDRAWAL or TRADE
+    amount: float  # signed change to capital
+    id: int
+    reserve: bool = False
+
+def investment_flows(db: Session, user_id: int) -> List[Flow]:
+    rows = db.execute(
+        select(Investment.id, Investment.date, Investment.amount, Investment.type)
+        .where(Investment.user_id == user_id, Investment.date.is_not(None))
+        .order_by(Investment.date, Investment.id)
+    ).all()
+    return [Flow(at, "INVESTMENT", amount or 0, i, kind == RESERVE_TYPE) for i, at, amount, kind in rows]
+
+def withdrawal_flows(db: Session, user_id: int) -> List[Flow]:
+    rows = db.execute(
+        select(Withdrawal.id, Withdrawal.date, Withdrawal.amount)
+        .where(Withdrawal.user_id == user_id, Withdrawal.date.is_not(None))
+        .order_by(Withdrawal.date, Withdrawal.id)
+    ).all()
+    return [Flow(at, "WITHDRAWAL", -(amount or 0), i) for i, at, amount in rows]
+
+def trade_flows(db: Session, user_id: int) -> List[Flow]:
+    # Exit times are UTC; deposits are dated in IST
+    offset = IST.utcoffset(None)
+    rows = db.execute(
+        select(Trade.id, Trade.exit_datetime, Trade.return_amount)
+        .where(Trade.user_id == user_id, Trade.status == "CLOSED", Trade.exit_datetime.is_not(None))
+        .order_by(Trade.exit_datetime, Trade.id)
+    ).all()
+    return [Flow(at + offset, "TRADE", amount or 0, i) for i, at, amount in rows]
+
+LOADERS = {"investments": investment_flows, "withdrawals": withdrawal_flows, "trades": trade_flows}
+
+def merge_flows(sources: Dict[str, List[Flow]]) -> List[Flow]:
+    """One stream ordered by time; on a tie, deposits and withdrawals come first"""
+    return list(heapq.merge(*sources.values(), key=lambda f: (f.at, f.kind == "TRADE", f.id)))
+
+def xirr(days: np.ndarray, amounts: np.ndarray) -> Optional[float]:
+    """Annual rate where the flows' net present value is zero. `amounts` are from
+    the investor's side: deposits negative, withdrawals and the final balance positive."""
+    if not (amounts > 0).any() or not (amounts < 0).any():
+        return None
+    years = (days - days.min()) / DAYS_PER_YEAR
+
+    def npv(rate):
+        return float(np.sum(amounts / (1 + rate) ** years))
+
+    # Newton from 10%, then bisection if it wanders off
+    rate = 0.1
+    for _ in range(50):
+        value = npv(rate)
+        slope = float(np.sum(-years * amounts / (1 + rate) ** (years + 1)))
+        if not slope:
+            break
+        step = value / slope
+        rate -= step
+        if rate <= -1 or not np.isfinite(rate):
+            break
+        if abs(step) < 1e-10:
+            return rate
+    low, high = -0.9999, 1.0
+    while npv(high) > 0 and high < 1e6:
+        high *= 2
+    if npv(low) * npv(high) > 0:
+        return None
+    for _ in range(200):
+        middle = (low + high) / 2
+        if npv(low) * npv(middle) <= 0:
+            high = middle
+        else:
+            low = middle
+    return (low + high) / 2
+
+def compute_capital(flows: List[Flow], today: date, reserve_amount: float) -> dict:
+    reserve_drawn = sum(f.amount for f in flows if f.reserve)
+    reserve = {
+        "budget": reserve_amount,
+        "drawn": reserve_drawn,
+        "remaining": reserve_amount - reserve_drawn,
+        "used_percent": reserve_drawn / reserve_amount * 100 if reserve_amount else None,
+        "draws": [{"date": f.at.date().isoformat(), "amount": f.amount} for f in flows if f.reserve]
+    }
+    if not flows:
+        return {"current_capital": 0.0, "flows": 0, "curve": [],
+                "time_weighted_return": None, "time_weighted_return_annualized": None,
+                "money_weighted_return": None, "simple_return": None, "reserve": reserve}
+
+    first = flows[0].at.date()
+    last = max(today, flows[-1].at.date())
+    day_count = (last - first).days + 1
+    day = np.array([(f.at.date() - first).days for f in flows], dtype=np.int64)
+    amount = np.array([f.amount for f in flows], dtype=np.float64)
+    is_trade = np.array([f.kind == "TRADE" for f in flows])
+
+    external = np.zeros(day_count)
+    pnl = np.zeros(day_count)
+    np.add.at(external, day[~is_trade], amount[~is_trade])
+    np.add.at(pnl, day[is_trade], amount[is_trade])
+    capital = np.cumsum(external + pnl)
+
+    # Daily returns on the capital at work that day: yesterday's close plus the
+    # day's deposits and withdrawals. Chaining them cancels out the flows.
+    opening = np.concatenate(([0.0], capital[:-1])) + external
+    active = opening > 0
+    daily = np.zeros(day_count)
+    daily[active] = pnl[active] / opening[active]
+    twr = float(np.prod(1 + daily) - 1) if active.any() else None
+    span_years = day_count / DAYS_PER_YEAR
+    twr_annualized = (float((1 + twr) ** (1 / span_years) - 1)
+                      if twr is not None and twr > -1 and day_count >= 2 else None)
+
+    # Investor side for XIRR: the closing balance counts as withdrawn today
+    flow_days = np.concatenate((day[~is_trade], [day_count - 1]))
+    flow_amounts = np.concatenate((-amount[~is_trade], [capital[-1]]))
+    deposited = float(amount[(~is_trade) & (amount > 0)].sum())
+
+    dates = np.datetime64(first, "D") + np.arange(day_count)
+    return {
+        "current_capital": float(capital[-1]),
+        "flows": len(flows),
+        "start": first.isoformat(),
+        "curve": [
+            {"date": str(d), "capital": c, "external_flow": e, "pnl": p}
+            for d, c, e, p in zip(dates, capital.tolist(), external.tolist(), pnl.tolist())
+        ],
+        "time_weighted_return": twr,
+        "time_weighted_return_annualized": twr_annualized,
+        "money_weighted_return": xirr(flow_days.astype(np.float64), flow_amounts),
+        "simple_return": float(pnl.sum() / deposited) if deposited else None,
+        "reserve": reserve
+    }
+
+class CapitalEngine:
+    """Per-user flow lists and results. Each source is reloaded only when its own
+    revision moves; merging and the metrics run on a worker thread."""
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory
+        self._sources: Dict[int, Dict[str, tuple]] = {}
+        self._results: Dict[int, tuple] = {}
+        self.loads = {source: 0 for source in SOURCES}
+
+    async def revisions(self, db: AsyncSession, user_id: int) -> tuple:
+        def fingerprint(model, *columns):
+            # Neither table has updated_at; any insert, delete, or edit of an
+            # amount, date or investment type changes one of these
+            columns = (func.count(model.id), func.total(model.amount),
+                       func.total(func.julianday(model.date))) + columns
+            return [select(column).where(model.user_id == user_id).scalar_subquery() for column in columns]
+
+        is_closed = (Trade.user_id == user_id) & (Trade.status == "CLOSED")
+        row = (await db.execute(select(
+            *fingerprint(Investment, func.total(case((Investment.type == RESERVE_TYPE, Investment.amount)))),
+            *fingerprint(Withdrawal),
+            select(func.max(Trade.updated_at)).where(is_closed).scalar_subquery(),
+            select(func.count(Trade.id)).where(is_closed).scalar_subquery(),
+            select(Settings.reserve_amount).where(Settings.user_id == user_id).scalar_subquery()
+        ))).one()
+        return {"investments": tuple(row[0:4]), "withdrawals": tuple(row[4:7]),
+                "trades": tuple(row[7:9])}, row[9] or 0
+
+    def compute(self, user_id: int, stale: List[str], revisions: Dict[str, tuple],
+                reserve_amount: float, today: date) -> dict:
+        sources = self._sources.setdefault(user_id, {})
+        if stale:
+            from app.database import SessionLocal
+            db = (self.session_factory or SessionLocal)()
+            try:
+                for source in stale:
+                    sources[source] = (revisions[source], LOADERS[source](db, user_id))
+                    self.loads[source] += 1
+            finally:
+                db.close()
+        flows = merge_flows({source: sources[source][1] for source in SOURCES})
+        return compute_capital(flows, today, reserve_amount)
+
+    async def get(self, db: AsyncSession, user_id: int) -> dict:
+        revisions, reserve_amount = await self.revisions(db, user_id)
+        today = datetime.now(IST).date()
+        key = (tuple(revisions.values()), reserve_amount, today)
+        cached = self._results.get(user_id)
+        if cached and cached[0] == key:
+            return cached[1]
+        sources = self._sources.get(user_id, {})
+        stale = [s for s in SOURCES if s not in sources or sources[s][0] != revisions[s]]
+        result = await run_in_threadpool(self.compute, user_id, stale, revisions, reserve_amount, today)
+        self._results[user_id] = (key, result)
+        return result
+
+capital_engine = CapitalEngine()
@@ -0,0 +1,249 @@
+"""Maintenance commands: python -m app.cli <command>"""
+import argparse
+from sqlalchemy import text
+from app.database import engine, SessionLocal
+from app.models.models import Base, User
+from app.blobs import migrate_screenshots
+from app.ledger import ledger_drift, rebuild_ledger, trade_totals_drift, rebuild_trade_totals
+from app.migrations import run_migrations, current_version, check_query_plans
+from app.export import DATASETS, FORMATS, COMPRESSIONS
+
+def prepare_db():
+    Base.metadata.create_all(bind=engine)
+    return run_migrations(engine)
+
+def cmd_migrate(args):
+    applied = prepare_db()
+    with engine.connect() as conn:
+        version = current_version(conn)
+    print(f"Applied {applied or 'no'} migrations, schema version {version}")
+
+def cmd_check_indexes(args):
+    prepare_db()
+    failures = 0
+    for name, details, uses_index in check_query_plans(engine):
+        failures += not uses_index
+        print(f"{'ok  ' if uses_index else 'SCAN'} {name}: {' | '.join(details)}")
+    return 1 if failures else 0
+
+def cmd_migrate_screenshots(args):
+    prepare_db()
+    db = SessionLocal()
+    try:
+        moved = migrate_screenshots(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"Moved {moved} screenshots to the blob store")
+
+    if moved and not args.no_vacuum:
+        # Give the freed pages back to the filesystem
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+        print("Database vacuumed")
+
+def cmd_reconcile_ledger(args):
+    prepare_db()
+    db = SessionLocal()
+    drifted = 0
+    try:
+        for user_id, username in db.query(User.id, User.username).order_by(User.id).all():
+            # Running entry totals on each trade
+            totals = trade_totals_drift(db, user_id)
+            for trade_id, (stored, actual) in totals.items():
+                print(f"{username}: trade {trade_id} total_qty/total_value stored={stored} actual={actual}")
+            if totals:
+                rebuild_trade_totals(db, totals)
+
+            drift = ledger_drift(db, user_id)
+            if drift or totals:
+                drifted += 1
+            for field, (stored, actual) in drift.items():
+                print(f"{username}: {field} stored={stored} actual={actual}")
+            if drift or args.rebuild:
+                rebuild_ledger(db, user_id)
+        if args.dry_run:
+            db.rollback()
+        else:
+            db.commit()
+    finally:
+        db.close()
+    print(f"{drifted} users with drift" + (" (not fixed, dry run)" if args.dry_run and drifted else ""))
+    return 1 if drifted and args.dry_run else 0
+
+def cmd_import_trades(args):
+    from app.trade_import import import_trades
+    prepare_db()
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == args.user).first()
+        if not user:
+            print(f"No user named {args.user}")
+            return 1
+        with open(args.csv, newline="", encoding="utf-8-sig") as f:
+            report = import_trades(db, user.id, f, chunk_size=args.chunk_size).as_dict()
+    finally:
+        db.close()
+    for error in report["errors"]:
+        print(f"row {error['row']}: {error['error']}")
+    print(f"{report['rows']} rows in {report['seconds']}s ({report['rows_per_second']} rows/s): "
+          f"{report['imported']} imported, {report['duplicates']} duplicates, {report['error_count']} errors; "
+          f"{report['trades_created']} trades created, {report['trades_closed']} closed, "
+          f"{report['open_positions']} left open")
+    return 1 if report["error_count"] else 0
+
+def cmd_export(args):
+    import sys
+    from app.export import Export
+    prepare_db()
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == args.user).first()
+        if not user:
+            print(f"No user named {args.user}")
+            return 1
+        export = Export(args.dataset, args.format, args.compression)
+        output = open(args.output, "wb") if args.output else sys.stdout.buffer
+        try:
+            for chunk in export.iterate(db, user.id, args.batch_size):
+                output.write(chunk)
+        finally:
+            if args.output:
+                output.close()
+    finally:
+        db.close()
+    if args.output:
+        print(f"Wrote {args.dataset} to {args.output}")
+
+def cmd_compact_ticks(args):
+    from datetime import datetime
+    from app.config import settings
+    from app.ticks import tick_store, IST
+    counts = tick_store.maintain(
+        datetime.now(IST).date(),
+        settings.TICK_COMPACT_AFTER_DAYS if args.after_days is None else args.after_days,
+        settings.TICK_RETENTION_DAYS if args.retention_days is None else args.retention_days
+    )
+    print(f"Compacted {counts['compacted']} and deleted {counts['deleted']} symbol-days in {tick_store.root}")
+
+def cmd_load_holidays(args):
+    from app.config import settings
+    from app.holiday_import import load_calendars, calendar_files
+    prepare_db()
+    paths = args.files or calendar_files(args.dir or settings.HOLIDAY_CALENDAR_DIR)
+    db = SessionLocal()
+    try:
+        report = load_calendars(db, paths)
+    finally:
+        db.close()
+    for error in report.errors:
+        print(f"error: {error}")
+    print(f"Loaded {report.holidays} holidays for {', '.join(map(str, report.years)) or 'no years'} "
+          f"from {len(report.files)} files")
+    return 1 if report.errors else 0
+
+def cmd_bench_db(args):
+    from app.bench import bench_db
+    bench_db(readers=args.readers, writers=args.writers, seconds=args.seconds, seed=args.seed)
+
+def cmd_bench_load(args):
+    from app.bench import bench_load
+    bench_load(concurrency=args.concurrency, seconds=args.seconds, seed=args.seed, port=args.port)
+
+def cmd_bench_auth(args):
+    from app.bench import bench_auth
+    bench_auth(readers=args.readers, logins=args.logins, seconds=args.seconds, seed=args.seed, port=args.port)
+
+def cmd_bench_trade_numbers(args):
+    from app.bench import bench_trade_numbers
+    return bench_trade_numbers(clients=args.clients, trades=args.trades, workers=args.workers,
+                               seed=args.seed, port=args.port)
+
+def cmd_bench_analytics(args):
+    from app.bench import bench_analytics
+    bench_analytics(trades=args.trades, repeats=args.repeats)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Trade Diary maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("migrate", help="Apply pending schema migrations")
+    p.set_defaults(func=cmd_migrate)
+
+    p = subparsers.add_parser("check-indexes", help="EXPLAIN QUERY PLAN the hot queries and flag full table scans")
+    p.set_defaults(func=cmd_check_indexes)
+
+    p = subparsers.add_parser("migrate-screenshots", help="Move inline screenshots into the blob store")
+    p.add_argument("--batch-size", type=int, default=20)
+    p.add_argument("--no-vacuum", action="store_true", help="Skip VACUUM after moving rows")
+    p.set_defaults(func=cmd_migrate_screenshots)
+
+    p = subparsers.add_parser("reconcile-ledger", help="Rebuild user_ledger_summary and trade entry totals from the raw tables and report drift")
+    p.add_argument("--dry-run", action="store_true", help="Report drift without fixing it")
+    p.add_argument("--rebuild", action="store_true", help="Rebuild every user, not only drifted ones")
+    p.set_defaults(func=cmd_reconcile_ledger)
+
+    p = subparsers.add_parser("import-trades", help="Import a broker tradebook CSV")
+    p.add_argument("csv")
+    p.add_argument("--user", default="admin")
+    p.add_argument("--chunk-size", type=int, default=5000)
+    p.set_defaults(func=cmd_import_trades)
+
+    p = subparsers.add_parser("export", help="Stream one dataset of a user's journal to a file or stdout")
+    p.add_argument("dataset", choices=list(DATASETS))
+    p.add_argument("--user", default="admin")
+    p.add_argument("--format", choices=list(FORMATS), default="csv")
+    p.add_argument("--compression", choices=COMPRESSIONS, default="none")
+    p.add_argument("--output", "-o", help="Defaults to stdout")
+    p.add_argument("--batch-size", type=int, help="Override EXPORT_BATCH_SIZE")
+    p.set_defaults(func=cmd_export)
+
+    p = subparsers.add_parser("compact-ticks", help="Compact old intraday tick files to 1-minute bars and apply retention")
+    p.add_argument("--after-days", type=int, help="Override TICK_COMPACT_AFTER_DAYS")
+    p.add_argument("--retention-days", type=int, help="Override TICK_RETENTION_DAYS")
+    p.set_defaults(func=cmd_compact_ticks)
+
+    p = subparsers.add_parser("load-holidays", help="Upsert exchange holiday calendars (CSV or .ics)")
+    p.add_argument("files", nargs="*", help="Calendar files; defaults to every file in the calendar directory")
+    p.add_argument("--dir", help="Override HOLIDAY_CALENDAR_DIR")
+    p.set_defaults(func=cmd_load_holidays)
+
+    p = subparsers.add_parser("bench-db", help="Concurrent read/write throughput, default vs WAL engine profile")
+    p.add_argument("--readers", type=int, default=8)
+    p.add_argument("--writers", type=int, default=2)
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.add_argument("--seed", type=int, default=5000, help="Closed trades to seed before measuring")
+    p.set_defaults(func=cmd_bench_db)
+
+    p = subparsers.add_parser("bench-load", help="p50/p99 latency under mixed concurrent traffic against uvicorn")
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--seed", type=int, default=20000)
+    p.add_argument("--port", type=int, default=8765)
+    p.set_defaults(func=cmd_bench_load)
+
+    p = subparsers.add_parser("bench-auth", help="Login throughput and dashboard latency during login bursts")
+    p.add_argument("--readers", type=int, default=8, help="Concurrent dashboard clients")
+    p.add_argument("--logins", type=int, default=8, help="Concurrent login clients")
+    p.add_argument("--seconds", type=float, default=10.0, help="Duration of each phase")
+    p.add_argument("--seed", type=int, default=5000)
+    p.add_argument("--port", type=int, default=8766)
+    p.set_defaults(func=cmd_bench_auth)
+
+    p = subparsers.add_parser("bench-trade-numbers", help="Create trades in parallel and check every number is unique")
+    p.add_argument("--clients", type=int, default=16)
+    p.add_argument("--trades", type=int, default=25, help="Trades created per client")
+    p.add_argument("--workers", type=int, default=2, help="uvicorn worker processes")
+    p.add_argument("--seed", type=int, default=100)
+    p.add_argument("--port", type=int, default=8767)
+    p.set_defaults(func=cmd_bench_trade_numbers)
+
+    p = subparsers.add_parser("bench-analytics", help="Cold and cached analytics latency on seeded closed trades")
+    p.add_argument("--trades", type=int, default=100000)
+    p.add_argument("--repeats", type=int, default=50)
+    p.set_defaults(func=cmd_bench_analytics)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
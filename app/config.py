@@ -7,10 +7,64 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 1440  # 24 hours
     
+    # In-process cache of decoded tokens and user snapshots; 0 disables it.
+    # Each worker has its own cache, so changes made through another worker
+    # are picked up after at most AUTH_CACHE_TTL_SECONDS.
+    AUTH_CACHE_TTL_SECONDS: int = 60
+    AUTH_CACHE_MAX_ENTRIES: int = 1024
+    
+    # Threads for password hashing and QR codes, and the failed-login throttle
+    AUTH_WORKERS: int = 2
+    LOGIN_FAILURE_WINDOW_SECONDS: int = 300
+    LOGIN_MAX_FAILURES_PER_USER: int = 5
+    LOGIN_MAX_FAILURES_PER_IP: int = 20
+    
+    # SQLite engine profile: "wal" applies the pragmas below, "default" keeps SQLite defaults
+    SQLITE_PROFILE: str = "wal"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_MMAP_SIZE: int = 268435456  # 256 MB
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    DB_POOL_SIZE: int = 10  # roughly the number of requests served concurrently per worker
+    DB_MAX_OVERFLOW: int = 10
+    
     # Default user credentials
     DEFAULT_USERNAME: str = "admin"
     DEFAULT_PASSWORD: str = "admin"
     
+    # Screenshot blob storage
+    BLOB_DIR: str = "./blobs"
+    THUMBNAIL_SIZE: int = 320
+    
+    # Login page index ticker: "yahoo", or "fake" for offline development and tests
+    MARKET_PROVIDER: str = "yahoo"
+    MARKET_REFRESH_SECONDS: int = 30
+    MARKET_TIMEOUT_SECONDS: float = 5.0
+    MARKET_BREAKER_THRESHOLD: int = 3  # consecutive failed refreshes before backing off
+    MARKET_BREAKER_BACKOFF_SECONDS: float = 30.0
+    MARKET_BREAKER_MAX_BACKOFF_SECONDS: float = 600.0
+    MARKET_STREAM_QUEUE_SIZE: int = 8  # ticks buffered per SSE client before the oldest are dropped
+    MARKET_STREAM_KEEPALIVE_SECONDS: float = 15.0
+    
+    # Prices for unrealized P&L: "market", or "replay:<path.jsonl>[@<seconds per tick>]"
+    MTM_PRICE_FEED: str = "market"
+    
+    # Intraday index history written by the market poller
+    TICK_DIR: str = "./ticks"
+    TICK_COMPACT_AFTER_DAYS: int = 2  # older days keep only 1-minute bars
+    TICK_RETENTION_DAYS: int = 90  # 0 keeps everything
+    
+    # Exchange holiday calendars (CSV or .ics), upserted at startup; empty disables.
+    # The files are the source of truth: a holiday deleted through the API but
+    # still in a file comes back on the next start.
+    HOLIDAY_CALENDAR_DIR: str = "./calendars"
+    
+    # How often overdue auto-renew expenses are rolled to their next due date; 0 disables
+    EXPENSE_ROLLOVER_INTERVAL_SECONDS: int = 3600
+    
+    # Rows fetched per server-side cursor batch (and per Parquet row group) when exporting
+    EXPORT_BATCH_SIZE: int = 1000
+    
     class Config:
         env_file = ".env"
 
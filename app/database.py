@@ -1,18 +1,66 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL, 
-    connect_args={"check_same_thread": False}
-)
+def sqlite_pragmas(profile: str) -> dict:
+    if profile != "wal":
+        return {}
+    return {
+        "journal_mode": "WAL",
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "cache_size": -settings.SQLITE_CACHE_SIZE_KB,  # negative means KiB, not pages
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "temp_store": "MEMORY"
+    }
+
+def engine_options(url: str) -> dict:
+    if not url.startswith("sqlite"):
+        return {"pool_size": settings.DB_POOL_SIZE, "max_overflow": settings.DB_MAX_OVERFLOW}
+    options = {"connect_args": {"check_same_thread": False}}
+    if ":memory:" not in url:
+        options.update(pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW)
+    return options
+
+def apply_pragmas(engine, profile: str):
+    pragmas = sqlite_pragmas(profile)
+    if pragmas:
+        @event.listens_for(engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+def create_db_engine(url: str, profile: str = settings.SQLITE_PROFILE):
+    engine = create_engine(url, **engine_options(url))
+    if url.startswith("sqlite"):
+        apply_pragmas(engine, profile)
+    return engine
+
+def async_database_url(url: str) -> str:
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    return url
+
+def create_async_db_engine(url: str, profile: str = settings.SQLITE_PROFILE):
+    async_url = async_database_url(url)
+    engine = create_async_engine(async_url, **engine_options(url))
+    if url.startswith("sqlite"):
+        apply_pragmas(engine.sync_engine, profile)
+    return engine
+
+# Startup tasks and CLI commands use the synchronous engine
+engine = create_db_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+# Request handlers use the async engine so queries don't block the event loop
+async_engine = create_async_db_engine(settings.DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
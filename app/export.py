@@ -0,0 +1,251 @@
+"""Streaming export of a user's journal.
+
+Each dataset is a plain column select read through a server-side cursor
+(`yield_per`), encoded one partition at a time and, for CSV and JSON Lines,
+compressed as it goes, so memory stays at one batch whatever the size of the
+journal. Screenshots are never inlined: trades carry the blob hashes, which
+resolve through /api/blobs/<hash>.
+"""
+import csv
+import io
+import json
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Sequence
+from sqlalchemy import select, Boolean, DateTime, Float, Integer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from app.config import settings
+from app.models.models import Trade, TradeEntry, Investment, Withdrawal, Expense, ExpensePayment
+
+@dataclass
+class Dataset:
+    name: str
+    columns: Sequence
+    query: Callable[[int], Select]
+
+    @property
+    def names(self) -> List[str]:
+        return [column.key for column in self.columns]
+
+def _owned(model, *columns):
+    return lambda user_id: select(*columns).where(model.user_id == user_id).order_by(model.id)
+
+# The inline `screenshot` column is left out; the hashes reference the blob store
+TRADE_COLUMNS = [c for c in Trade.__table__.columns if c.key not in ("screenshot", "user_id")]
+ENTRY_COLUMNS = list(TradeEntry.__table__.columns)
+INVESTMENT_COLUMNS = [c for c in Investment.__table__.columns if c.key != "user_id"]
+WITHDRAWAL_COLUMNS = [c for c in Withdrawal.__table__.columns if c.key != "user_id"]
+EXPENSE_COLUMNS = [c for c in Expense.__table__.columns if c.key != "user_id"]
+PAYMENT_COLUMNS = list(ExpensePayment.__table__.columns)
+
+DATASETS = {
+    "trades": Dataset("trades", TRADE_COLUMNS, _owned(Trade, *TRADE_COLUMNS)),
+    "entries": Dataset("entries", ENTRY_COLUMNS, lambda user_id: (
+        select(*ENTRY_COLUMNS).join(Trade, Trade.id == TradeEntry.trade_id)
+        .where(Trade.user_id == user_id).order_by(TradeEntry.id)
+    )),
+    "investments": Dataset("investments", INVESTMENT_COLUMNS, _owned(Investment, *INVESTMENT_COLUMNS)),
+    "withdrawals": Dataset("withdrawals", WITHDRAWAL_COLUMNS, _owned(Withdrawal, *WITHDRAWAL_COLUMNS)),
+    "expenses": Dataset("expenses", EXPENSE_COLUMNS, _owned(Expense, *EXPENSE_COLUMNS)),
+    "expense_payments": Dataset("expense_payments", PAYMENT_COLUMNS, lambda user_id: (
+        select(*PAYMENT_COLUMNS).join(Expense, Expense.id == ExpensePayment.expense_id)
+        .where(Expense.user_id == user_id).order_by(ExpensePayment.id)
+    )),
+}
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+class CsvEncoder:
+    def __init__(self, names: List[str]):
+        self.names = names
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def _drain(self) -> bytes:
+        data = self.buffer.getvalue().encode()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+    def begin(self) -> bytes:
+        self.writer.writerow(self.names)
+        return self._drain()
+
+    def encode(self, rows) -> bytes:
+        self.writer.writerows([[_value(v) for v in row] for row in rows])
+        return self._drain()
+
+    def end(self) -> bytes:
+        return b""
+
+class JsonLinesEncoder:
+    def __init__(self, names: List[str]):
+        self.names = names
+
+    def begin(self) -> bytes:
+        return b""
+
+    def encode(self, rows) -> bytes:
+        return "".join(
+            json.dumps(dict(zip(self.names, [_value(v) for v in row]))) + "\n" for row in rows
+        ).encode()
+
+    def end(self) -> bytes:
+        return b""
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+class ParquetEncoder:
+    """One row group per partition. Compression is Parquet's own per-column codec."""
+
+    def __init__(self, names: List[str], columns: Sequence, compression: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Parquet export needs pyarrow installed")
+        self.pa = pa
+        types = []
+        for column in columns:
+            if isinstance(column.type, Boolean):
+                types.append(pa.bool_())
+            elif isinstance(column.type, Integer):
+                types.append(pa.int64())
+            elif isinstance(column.type, Float):
+                types.append(pa.float64())
+            elif isinstance(column.type, DateTime):
+                types.append(pa.timestamp("us"))
+            else:
+                types.append(pa.string())
+        self.schema = pa.schema(list(zip(names, types)))
+        self.sink = _Sink()
+        self.writer = pq.ParquetWriter(self.sink, self.schema, compression=compression)
+
+    def begin(self) -> bytes:
+        return self.sink.drain()
+
+    def encode(self, rows) -> bytes:
+        table = self.pa.Table.from_arrays(
+            [self.pa.array(values, type=field.type) for values, field in zip(zip(*rows), self.schema)],
+            schema=self.schema
+        )
+        self.writer.write_table(table)
+        return self.sink.drain()
+
+    def end(self) -> bytes:
+        self.writer.close()
+        return self.sink.drain()
+
+def _compressor(compression: str):
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression needs zstandard installed")
+        return zstandard.ZstdCompressor().compressobj()
+    return None
+
+class Export:
+    """Encodes one dataset partition by partition: begin(), encode(rows)..., end()"""
+
+    def __init__(self, dataset: str, fmt: str = "csv", compression: str = "none"):
+        if dataset not in DATASETS:
+            raise ValueError(f"dataset must be one of {', '.join(DATASETS)}")
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"compression must be one of {', '.join(COMPRESSIONS)}")
+        self.dataset = DATASETS[dataset]
+        self.format = fmt
+        self.compression = compression
+        names = self.dataset.names
+        if fmt == "parquet":
+            self.encoder = ParquetEncoder(names, self.dataset.columns, compression)
+            self.compressor = None
+        else:
+            self.encoder = CsvEncoder(names) if fmt == "csv" else JsonLinesEncoder(names)
+            self.compressor = _compressor(compression)
+
+    @property
+    def media_type(self) -> str:
+        if self.compressor is not None:
+            return "application/gzip" if self.compression == "gzip" else "application/zstd"
+        return FORMATS[self.format][0]
+
+    @property
+    def filename(self) -> str:
+        name = f"{self.dataset.name}.{FORMATS[self.format][1]}"
+        if self.compressor is not None:
+            name += ".gz" if self.compression == "gzip" else ".zst"
+        return name
+
+    def _out(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) if self.compressor is not None and data else data
+
+    def begin(self) -> bytes:
+        return self._out(self.encoder.begin())
+
+    def encode(self, rows) -> bytes:
+        return self._out(self.encoder.encode(rows))
+
+    def end(self) -> bytes:
+        data = self._out(self.encoder.end())
+        if self.compressor is not None:
+            data += self.compressor.flush()
+        return data
+
+    def statement(self, user_id: int, batch_size: Optional[int] = None) -> Select:
+        return self.dataset.query(user_id).execution_options(
+            yield_per=batch_size or settings.EXPORT_BATCH_SIZE
+        )
+
+    async def stream(self, db: AsyncSession, user_id: int, batch_size: Optional[int] = None) -> AsyncIterator[bytes]:
+        yield self.begin()
+        result = await db.stream(self.statement(user_id, batch_size))
+        async for rows in result.partitions():
+            data = self.encode(rows)
+            if data:
+                yield data
+        yield self.end()
+
+    def iterate(self, db: Session, user_id: int, batch_size: Optional[int] = None) -> Iterator[bytes]:
+        yield self.begin()
+        for rows in db.execute(self.statement(user_id, batch_size)).partitions():
+            data = self.encode(rows)
+            if data:
+                yield data
+        yield self.end()
@@ -0,0 +1,152 @@
+"""Exchange holiday calendars loaded from files.
+
+A calendar directory holds any number of CSV (date, description, optional
+type) or iCalendar (.ics) files, typically one per exchange year. Every file
+is parsed first and the holidays are then upserted with a single batched
+INSERT ... ON CONFLICT (date, type), so loading the same files again only
+refreshes descriptions. Adding next year's holidays is a new file, not a
+code change.
+"""
+import csv
+import os
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from app.models.models import Holiday
+
+HOLIDAY_TYPES = ("TRADING", "CLEARING")
+CALENDAR_SUFFIXES = (".csv", ".ics")
+
+# NSE circulars write dates as 26-Jan-2026
+DATE_FORMATS = ("%Y-%m-%d", "%d-%b-%Y", "%d-%B-%Y", "%d/%m/%Y", "%d-%m-%Y", "%Y%m%d")
+
+@dataclass
+class CalendarReport:
+    files: List[str] = field(default_factory=list)
+    holidays: int = 0
+    years: List[int] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return {"files": self.files, "holidays": self.holidays, "years": self.years, "errors": self.errors}
+
+def parse_date(value: str) -> date:
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date {value!r}")
+
+def parse_type(value: Optional[str]) -> str:
+    holiday_type = (value or "TRADING").strip().upper() or "TRADING"
+    if holiday_type not in HOLIDAY_TYPES:
+        raise ValueError(f"Unknown holiday type {value!r}")
+    return holiday_type
+
+def read_csv(path: str) -> List[Tuple[date, str, str]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        columns = {name.strip().lower(): name for name in reader.fieldnames or []}
+        if "date" not in columns:
+            raise ValueError(f"{path}: missing a date column")
+        description = columns.get("description") or columns.get("holiday") or columns.get("name")
+        holiday_type = columns.get("type")
+        rows = []
+        for row in reader:
+            if not (row.get(columns["date"]) or "").strip():
+                continue
+            try:
+                rows.append((
+                    parse_date(row[columns["date"]]),
+                    (row.get(description) or "").strip() if description else "",
+                    parse_type(row.get(holiday_type) if holiday_type else None)
+                ))
+            except ValueError as e:
+                raise ValueError(f"{path}:{reader.line_num}: {e}")
+        return rows
+
+def read_ics(path: str) -> List[Tuple[date, str, str]]:
+    """All-day VEVENTs; CATEGORIES names the holiday type, TRADING by default"""
+    with open(path, encoding="utf-8-sig") as f:
+        lines = []
+        for line in f.read().splitlines():
+            # Folded lines continue with a leading space or tab
+            if line[:1] in (" ", "\t") and lines:
+                lines[-1] += line[1:]
+            else:
+                lines.append(line)
+
+    rows = []
+    event: Optional[Dict[str, str]] = None
+    for line in lines:
+        name, _, value = line.partition(":")
+        name = name.split(";")[0].upper()
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            event = {}
+        elif name == "END" and value.upper() == "VEVENT" and event is not None:
+            if "DTSTART" not in event:
+                raise ValueError(f"{path}: event without DTSTART")
+            start = parse_date(event["DTSTART"][:8])
+            end = parse_date(event["DTEND"][:8]) if "DTEND" in event else start + timedelta(days=1)
+            categories = [c.strip().upper() for c in event.get("CATEGORIES", "").split(",")]
+            holiday_type = next((c for c in categories if c in HOLIDAY_TYPES), "TRADING")
+            description = event.get("SUMMARY", "").replace("\\,", ",").replace("\\;", ";")
+            day = start
+            while day < max(end, start + timedelta(days=1)):
+                rows.append((day, description, holiday_type))
+                day += timedelta(days=1)
+            event = None
+        elif event is not None:
+            event[name] = value
+    return rows
+
+def calendar_files(directory: str) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(CALENDAR_SUFFIXES)
+    )
+
+def read_calendar(path: str) -> List[Tuple[date, str, str]]:
+    return read_ics(path) if path.lower().endswith(".ics") else read_csv(path)
+
+def load_calendars(db: Session, paths: List[str]) -> CalendarReport:
+    """Upsert the holidays in `paths` and commit. A file that fails to parse is
+    reported and skipped; the rest still load."""
+    report = CalendarReport()
+    holidays: Dict[Tuple[date, str], str] = {}
+    for path in paths:
+        try:
+            rows = read_calendar(path)
+        except (OSError, ValueError) as e:
+            report.errors.append(str(e))
+            continue
+        report.files.append(path)
+        for day, description, holiday_type in rows:
+            holidays[(day, holiday_type)] = description
+
+    if holidays:
+        statement = insert(Holiday)
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[Holiday.date, Holiday.type],
+                set_={"description": statement.excluded.description}
+            ),
+            [
+                {"date": datetime.combine(day, datetime.min.time()), "description": description,
+                 "type": holiday_type, "created_at": datetime.utcnow()}
+                for (day, holiday_type), description in sorted(holidays.items())
+            ]
+        )
+        db.commit()
+    report.holidays = len(holidays)
+    report.years = sorted({day.year for day, _ in holidays})
+    return report
+
+def load_calendar_dir(db: Session, directory: str) -> CalendarReport:
+    return load_calendars(db, calendar_files(directory))
@@ -0,0 +1,185 @@
+from typing import Dict, Optional
+from sqlalchemy import func, case, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from app.recurrence import monthly_amount, monthly_amount_expression
+from app.models.models import LedgerSummary, TradeNumberSequence, Trade, TradeEntry, Investment, Withdrawal, Expense
+
+LEDGER_FIELDS = [
+    "total_invested", "total_withdrawn", "total_pl", "trade_count", "open_count",
+    "closed_count", "win_count", "monthly_expenses", "active_subscriptions"
+]
+
+# Floats are summed incrementally, so allow for rounding when checking drift
+DRIFT_TOLERANCE = 0.01
+
+def trade_state(trade: Optional[Trade]) -> Dict[str, float]:
+    """A trade's contribution to the ledger; diff two states to get the delta"""
+    if trade is None:
+        return {}
+    closed = trade.status == "CLOSED"
+    return {
+        "trade_count": 1,
+        "open_count": 1 if trade.status == "OPEN" else 0,
+        "closed_count": 1 if closed else 0,
+        "win_count": 1 if closed and (trade.return_amount or 0) > 0 else 0,
+        "total_pl": (trade.return_amount or 0) if closed else 0
+    }
+
+def investment_state(investment: Optional[Investment]) -> Dict[str, float]:
+    return {"total_invested": investment.amount or 0} if investment else {}
+
+def withdrawal_state(withdrawal: Optional[Withdrawal]) -> Dict[str, float]:
+    return {"total_withdrawn": withdrawal.amount or 0} if withdrawal else {}
+
+def expense_state(expense: Optional[Expense]) -> Dict[str, float]:
+    if expense is None or not expense.is_active:
+        return {}
+    return {
+        "monthly_expenses": monthly_amount(expense.amount, expense.billing_cycle),
+        "active_subscriptions": 1
+    }
+
+def compute_ledger(db: Session, user_id: int) -> Dict[str, float]:
+    """Recompute the summary from the raw tables"""
+    is_closed = Trade.status == "CLOSED"
+    trades = db.query(
+        func.count(Trade.id),
+        func.sum(case((Trade.status == "OPEN", 1), else_=0)),
+        func.sum(case((is_closed, 1), else_=0)),
+        func.sum(case((is_closed & (Trade.return_amount > 0), 1), else_=0)),
+        func.sum(case((is_closed, func.coalesce(Trade.return_amount, 0)), else_=0))
+    ).filter(Trade.user_id == user_id).one()
+
+    money = db.query(
+        select(func.coalesce(func.sum(Investment.amount), 0))
+            .where(Investment.user_id == user_id).scalar_subquery(),
+        select(func.coalesce(func.sum(Withdrawal.amount), 0))
+            .where(Withdrawal.user_id == user_id).scalar_subquery(),
+        select(func.coalesce(func.sum(monthly_amount_expression()), 0))
+            .where(Expense.user_id == user_id, Expense.is_active == True).scalar_subquery(),
+        select(func.count(Expense.id))
+            .where(Expense.user_id == user_id, Expense.is_active == True).scalar_subquery()
+    ).one()
+
+    return {
+        "total_invested": money[0],
+        "total_withdrawn": money[1],
+        "total_pl": trades[4] or 0,
+        "trade_count": trades[0] or 0,
+        "open_count": trades[1] or 0,
+        "closed_count": trades[2] or 0,
+        "win_count": trades[3] or 0,
+        "monthly_expenses": money[2],
+        "active_subscriptions": money[3]
+    }
+
+def rebuild_ledger(db: Session, user_id: int) -> LedgerSummary:
+    values = compute_ledger(db, user_id)
+    ledger = db.get(LedgerSummary, user_id)
+    if ledger is None:
+        ledger = LedgerSummary(user_id=user_id)
+        db.add(ledger)
+    for field, value in values.items():
+        setattr(ledger, field, value)
+    return ledger
+
+def get_ledger(db: Session, user_id: int) -> LedgerSummary:
+    ledger = db.get(LedgerSummary, user_id)
+    if ledger is None:
+        # A concurrent request may build it first; keep theirs rather than
+        # rolling back, which would expire everything else in the session
+        db.execute(insert(LedgerSummary).values(user_id=user_id, **compute_ledger(db, user_id))
+                   .on_conflict_do_nothing(index_elements=["user_id"]))
+        db.commit()
+        ledger = db.get(LedgerSummary, user_id)
+    return ledger
+
+def apply_ledger_delta(db: Session, user_id: int, before: Dict[str, float], after: Dict[str, float]):
+    """Add (after - before) to the user's summary inside the caller's transaction"""
+    db.flush()
+    if db.get(LedgerSummary, user_id) is None:
+        # First write for this user: the flushed raw tables already include the change
+        rebuild_ledger(db, user_id)
+        return
+
+    delta = {}
+    for field in set(before) | set(after):
+        change = after.get(field, 0) - before.get(field, 0)
+        if change:
+            delta[getattr(LedgerSummary, field)] = getattr(LedgerSummary, field) + change
+    if delta:
+        db.query(LedgerSummary).filter(LedgerSummary.user_id == user_id).update(delta, synchronize_session="fetch")
+
+def ledger_drift(db: Session, user_id: int) -> Dict[str, tuple]:
+    """Fields where the stored summary differs from the raw tables, as (stored, actual)"""
+    ledger = db.get(LedgerSummary, user_id)
+    actual = compute_ledger(db, user_id)
+    drift = {}
+    for field in LEDGER_FIELDS:
+        stored = getattr(ledger, field) if ledger else None
+        if stored is None or abs(stored - actual[field]) > DRIFT_TOLERANCE:
+            drift[field] = (stored, actual[field])
+    return drift
+
+def reserve_trade_numbers(db: Session, user_id: int, count: int = 1) -> int:
+    """Reserve `count` consecutive trade numbers inside the caller's transaction and
+    return the first. The UPDATE takes SQLite's write lock, so concurrent creates
+    queue behind it until this transaction commits or rolls back."""
+    bump = (update(TradeNumberSequence)
+            .where(TradeNumberSequence.user_id == user_id)
+            .values(last_number=TradeNumberSequence.last_number + count)
+            .returning(TradeNumberSequence.last_number)
+            .execution_options(synchronize_session=False))
+    last = db.execute(bump).scalar()
+    if last is None:
+        # First trade since the sequence was introduced: start after the highest number in use
+        highest = select(func.coalesce(func.max(Trade.trade_number), 0)).where(Trade.user_id == user_id)
+        db.execute(insert(TradeNumberSequence).values(user_id=user_id, last_number=highest.scalar_subquery())
+                   .on_conflict_do_nothing(index_elements=["user_id"]))
+        last = db.execute(bump).scalar_one()
+    return last - count + 1
+
+def next_trade_number(db: Session, user_id: int) -> int:
+    """The number the user's next trade will get, without reserving it"""
+    last = db.scalar(select(TradeNumberSequence.last_number).where(TradeNumberSequence.user_id == user_id))
+    if last is None:
+        last = db.scalar(select(func.coalesce(func.max(Trade.trade_number), 0)).where(Trade.user_id == user_id))
+    return last + 1
+
+def add_fill(trade: Trade, price: float, quantity: int):
+    """Fold one entry into a trade loaded in this session: O(1), no entry query"""
+    trade.total_qty = (trade.total_qty or 0) + quantity
+    trade.total_value = (trade.total_value or 0) + price * quantity
+    trade.avg_price = trade.total_value / trade.total_qty if trade.total_qty > 0 else 0
+
+def trade_totals_drift(db: Session, user_id: int) -> Dict[int, tuple]:
+    """Trades whose running totals differ from their entries, as
+    {trade_id: ((stored qty, stored value), (actual qty, actual value))}"""
+    rows = db.execute(
+        select(Trade.id, Trade.total_qty, Trade.total_value,
+               func.coalesce(func.sum(TradeEntry.quantity), 0),
+               func.coalesce(func.sum(TradeEntry.quantity * TradeEntry.price), 0))
+        .outerjoin(TradeEntry, TradeEntry.trade_id == Trade.id)
+        .where(Trade.user_id == user_id)
+        .group_by(Trade.id)
+    ).all()
+    drift = {}
+    for trade_id, stored_qty, stored_value, qty, value in rows:
+        if stored_qty != qty or stored_value is None or abs(stored_value - value) > DRIFT_TOLERANCE:
+            drift[trade_id] = ((stored_qty, stored_value), (qty, value))
+    return drift
+
+def rebuild_trade_totals(db: Session, trade_ids) -> int:
+    """Recompute total_qty, total_value and avg_price of the given trades from their entries"""
+    count = 0
+    for trade in db.scalars(select(Trade).where(Trade.id.in_(list(trade_ids)))):
+        qty, value = db.execute(select(
+            func.coalesce(func.sum(TradeEntry.quantity), 0),
+            func.coalesce(func.sum(TradeEntry.quantity * TradeEntry.price), 0)
+        ).where(TradeEntry.trade_id == trade.id)).one()
+        trade.total_qty, trade.total_value = qty, value
+        if qty:
+            trade.avg_price = value / qty
+        count += 1
+    return count
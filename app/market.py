@@ -0,0 +1,324 @@
+"""Index quotes for the login page ticker.
+
+One MarketService per process holds the last known quotes and refreshes them
+through a MarketProvider. Refreshes are single-flight (concurrent requests
+share one in-progress fetch), stale quotes are served while a refresh runs
+in the background, and a circuit breaker backs off when the provider keeps
+failing.
+
+During NSE trading hours a MarketPoller refreshes on a schedule and
+publishes every update to a MarketHub, which fans it out to the
+/api/market/stream subscribers, and records the prices in the tick store.
+"""
+import asyncio
+import json
+import random
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timezone, time as dtime
+from typing import Dict, Optional, Set
+import httpx
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.ticks import tick_store, IST
+from app.trading_calendar import trading_calendar, TradingCalendar
+
+# Response key -> provider symbol
+INDICES = {"sensex": "^BSESN", "nifty": "^NSEI", "banknifty": "^NSEBANK"}
+
+@dataclass
+class Quote:
+    price: float
+    prev: float
+
+# Shown until the first successful fetch
+DEFAULT_QUOTES = {
+    "sensex": Quote(81234.50, 80900),
+    "nifty": Quote(24856.50, 24600),
+    "banknifty": Quote(52340.25, 52000),
+}
+
+class MarketProvider(ABC):
+    """Fetches one quote; raise on failure"""
+
+    @abstractmethod
+    async def fetch(self, symbol: str) -> Quote:
+        ...
+
+    async def close(self):
+        pass
+
+class YahooProvider(MarketProvider):
+    URL = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    async def fetch(self, symbol: str) -> Quote:
+        response = await self.client.get(
+            self.URL.format(symbol=symbol),
+            params={"interval": "1d", "range": "1d"},
+            headers={"User-Agent": "Mozilla/5.0"}
+        )
+        response.raise_for_status()
+        result = (response.json().get("chart", {}).get("result") or [{}])[0]
+        meta = result.get("meta", {})
+        price = meta.get("regularMarketPrice")
+        prev = meta.get("previousClose", meta.get("chartPreviousClose"))
+        if price is None or prev is None:
+            raise ValueError(f"No quote in response for {symbol}")
+        return Quote(price, prev)
+
+    async def close(self):
+        await self.client.aclose()
+
+class FakeProvider(MarketProvider):
+    """Offline provider for development and tests: a small random walk around the defaults"""
+
+    def __init__(self, quotes: Optional[Dict[str, Quote]] = None, delay: float = 0.0):
+        symbols = {symbol: key for key, symbol in INDICES.items()}
+        self.quotes = quotes or {symbol: DEFAULT_QUOTES[key] for symbol, key in symbols.items()}
+        self.delay = delay
+        self.calls = 0
+
+    async def fetch(self, symbol: str) -> Quote:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        base = self.quotes[symbol]
+        return Quote(round(base.price * (1 + random.uniform(-0.002, 0.002)), 2), base.prev)
+
+def create_provider(name: str) -> MarketProvider:
+    if name == "fake":
+        return FakeProvider()
+    if name == "yahoo":
+        client = httpx.AsyncClient(
+            timeout=settings.MARKET_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=len(INDICES), max_keepalive_connections=len(INDICES))
+        )
+        return YahooProvider(client)
+    raise ValueError(f"Unknown market provider: {name}")
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; each time it opens the wait doubles,
+    up to `max_backoff`. After the wait one trial call is let through."""
+
+    def __init__(self, threshold: int, base_backoff: float, max_backoff: float):
+        self.threshold = threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.opened = 0
+        self.open_until = 0.0
+
+    def allow(self) -> bool:
+        return time.monotonic() >= self.open_until
+
+    def record_success(self):
+        self.failures = 0
+        self.opened = 0
+        self.open_until = 0.0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** self.opened)
+            self.opened += 1
+            self.open_until = time.monotonic() + backoff
+
+class MarketService:
+    def __init__(self, provider: Optional[MarketProvider] = None):
+        self.provider = provider
+        self.quotes = dict(DEFAULT_QUOTES)
+        self.updated: Optional[float] = None
+        self.breaker = CircuitBreaker(
+            settings.MARKET_BREAKER_THRESHOLD,
+            settings.MARKET_BREAKER_BACKOFF_SECONDS,
+            settings.MARKET_BREAKER_MAX_BACKOFF_SECONDS
+        )
+        self._refresh: Optional[asyncio.Task] = None
+
+    def start(self, provider: Optional[MarketProvider] = None):
+        if provider is not None or self.provider is None:
+            self.provider = provider or create_provider(settings.MARKET_PROVIDER)
+
+    async def close(self):
+        if self._refresh and not self._refresh.done():
+            self._refresh.cancel()
+        self._refresh = None
+        if self.provider:
+            await self.provider.close()
+            self.provider = None
+
+    def is_fresh(self) -> bool:
+        return self.updated is not None and time.monotonic() - self.updated < settings.MARKET_REFRESH_SECONDS
+
+    def _shared_refresh(self) -> asyncio.Task:
+        if self._refresh is None or self._refresh.done():
+            self.start()
+            self._refresh = asyncio.create_task(self.refresh())
+        return self._refresh
+
+    async def get_quotes(self) -> Dict[str, Quote]:
+        if self.is_fresh() or not self.breaker.allow():
+            return self.quotes
+
+        refresh = self._shared_refresh()
+        if self.updated is None:
+            # Nothing fetched yet: wait for the shared refresh, but don't let a
+            # disconnecting client cancel it for everyone else
+            try:
+                await asyncio.shield(refresh)
+            except Exception:
+                pass
+        return self.quotes
+
+    async def update(self) -> Dict[str, Quote]:
+        """Refresh now (joining one already in flight) unless the breaker is open"""
+        if self.breaker.allow():
+            try:
+                await asyncio.shield(self._shared_refresh())
+            except Exception:
+                pass
+        return self.quotes
+
+    async def refresh(self):
+        symbols = list(INDICES.items())
+        results = await asyncio.gather(*[self.provider.fetch(symbol) for _, symbol in symbols],
+                                       return_exceptions=True)
+        fetched = 0
+        for (key, symbol), result in zip(symbols, results):
+            if isinstance(result, Exception):
+                print(f"Market fetch error for {symbol}: {result!r}")
+            else:
+                self.quotes[key] = result
+                fetched += 1
+
+        if fetched:
+            self.updated = time.monotonic()
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+def format_quote(quote: Quote) -> dict:
+    change = quote.price - quote.prev
+    pct = (change / quote.prev) * 100 if quote.prev else 0
+    return {
+        "price": round(quote.price, 2),
+        "change": round(change, 2),
+        "change_percent": round(pct, 2),
+        "is_up": change >= 0
+    }
+
+def format_quotes(quotes: Dict[str, Quote]) -> dict:
+    return {key: format_quote(quotes[key]) for key in INDICES}
+
+class MarketHub:
+    """Fans published ticks out to subscriber queues. Queues are bounded: a slow
+    client loses its oldest ticks rather than making the hub buffer without limit."""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.last: Optional[dict] = None
+
+    def publish(self, payload: dict):
+        self.last = payload
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(payload)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        if self.last is not None:
+            # Replay the latest tick so a new client renders immediately
+            queue.put_nowait(self.last)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+# NSE cash market session
+MARKET_OPEN = dtime(9, 15)
+MARKET_CLOSE = dtime(15, 30)
+
+def is_market_open(now: datetime, calendar: TradingCalendar) -> bool:
+    """`now` is an aware datetime"""
+    local = now.astimezone(IST)
+    return calendar.is_trading_day(local.date()) and MARKET_OPEN <= local.time() < MARKET_CLOSE
+
+def seconds_until_open(now: datetime, calendar: TradingCalendar) -> float:
+    local = now.astimezone(IST)
+    day = local.date()
+    if local.time() >= MARKET_OPEN or not calendar.is_trading_day(day):
+        day = calendar.next_trading_day(day)
+    opens = datetime.combine(day, MARKET_OPEN, tzinfo=IST)
+    return max(0.0, (opens - local).total_seconds())
+
+async def reload_trading_calendar():
+    """Pick up holidays added through other workers"""
+    from app.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        # run_sync keeps the swap on the event loop, between requests
+        await db.run_sync(trading_calendar.load)
+
+class MarketPoller:
+    """One upstream fetch loop shared by every stream subscriber"""
+
+    def __init__(self, service: MarketService, hub: MarketHub):
+        self.service = service
+        self.hub = hub
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        calendar_loaded = None
+        # Publish the latest quotes once so subscribers have something outside trading hours
+        self.hub.publish(format_quotes(await self.service.update()))
+        while True:
+            try:
+                now = datetime.now(timezone.utc)
+                today = now.astimezone(IST).date()
+                if calendar_loaded != today:
+                    await reload_trading_calendar()
+                    calendar_loaded = today
+                    await run_in_threadpool(tick_store.maintain, today, settings.TICK_COMPACT_AFTER_DAYS,
+                                            settings.TICK_RETENTION_DAYS)
+
+                if is_market_open(now, trading_calendar):
+                    before = self.service.updated
+                    quotes = await self.service.update()
+                    if self.service.updated != before:
+                        await run_in_threadpool(tick_store.append_quotes,
+                                                {key: quote.price for key, quote in quotes.items()})
+                    self.hub.publish(format_quotes(quotes))
+                    delay = settings.MARKET_REFRESH_SECONDS
+                else:
+                    # Wake for the next session, but at least daily to reload holidays
+                    delay = min(seconds_until_open(now, trading_calendar), 86400)
+            except Exception as e:
+                print(f"Market poller error: {e!r}")
+                delay = settings.MARKET_REFRESH_SECONDS
+            await asyncio.sleep(max(1.0, delay))
+
+market_service = MarketService()
+market_hub = MarketHub(settings.MARKET_STREAM_QUEUE_SIZE)
+market_poller = MarketPoller(market_service, market_hub)
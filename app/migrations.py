@@ -0,0 +1,193 @@
+"""Versioned schema migrations for existing databases.
+
+create_all() only creates missing tables, so every change to an existing
+table (new columns, new indexes) is added here as a numbered step. Steps
+must be idempotent: on a fresh database create_all() has already built the
+latest schema and the runner only records the versions.
+"""
+from datetime import datetime, timedelta
+from typing import Callable, List, Tuple
+from sqlalchemy import inspect, text, select, func
+from sqlalchemy.engine import Connection, Engine
+from app.models.models import (
+    SchemaMigration, Trade, TradeEntry, Expense, ExpensePayment, Investment,
+    Withdrawal, Settings, LedgerSummary, TradeNumberSequence
+)
+
+def add_column(conn: Connection, table: str, column: str, ddl: str):
+    columns = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+def create_index(conn: Connection, name: str, table: str, *columns: str):
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+def m001_screenshot_blobs(conn: Connection):
+    add_column(conn, "trades", "screenshot_hash", "VARCHAR(64)")
+    add_column(conn, "trades", "screenshot_thumb_hash", "VARCHAR(64)")
+
+def m002_hot_path_indexes(conn: Connection):
+    create_index(conn, "ix_trades_user_created", "trades", "user_id", "created_at")
+    create_index(conn, "ix_trades_user_status_created", "trades", "user_id", "status", "created_at")
+    create_index(conn, "ix_trades_user_status_updated", "trades", "user_id", "status", "updated_at")
+    create_index(conn, "ix_trade_entries_trade_id", "trade_entries", "trade_id")
+    create_index(conn, "ix_expenses_user_created", "expenses", "user_id", "created_at")
+    create_index(conn, "ix_expenses_user_active", "expenses", "user_id", "is_active")
+    create_index(conn, "ix_expense_payments_expense_id", "expense_payments", "expense_id")
+    create_index(conn, "ix_investments_user_date", "investments", "user_id", "date")
+    create_index(conn, "ix_withdrawals_user_date", "withdrawals", "user_id", "date")
+    create_index(conn, "ix_holidays_date", "holidays", "date")
+
+def m003_unique_trade_numbers(conn: Connection):
+    # Numbers used to be count(*) + 1, which repeats after a delete or when two
+    # creates race. Keep the oldest trade on each number and move the rest (and
+    # any unnumbered ones) past the user's highest number, in creation order.
+    highest = dict(conn.execute(select(Trade.user_id, func.max(Trade.trade_number)).group_by(Trade.user_id)).all())
+    taken = set()
+    renumbered = 0
+    for trade_id, user_id, number in conn.execute(
+        select(Trade.id, Trade.user_id, Trade.trade_number).order_by(Trade.user_id, Trade.id)
+    ).all():
+        if number is not None and (user_id, number) not in taken:
+            taken.add((user_id, number))
+            continue
+        highest[user_id] = (highest.get(user_id) or 0) + 1
+        conn.execute(Trade.__table__.update().where(Trade.id == trade_id).values(trade_number=highest[user_id]))
+        renumbered += 1
+    if renumbered:
+        print(f"Renumbered {renumbered} trades with duplicate or missing numbers")
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_trades_user_trade_number ON trades (user_id, trade_number)"))
+
+    sequences = TradeNumberSequence.__table__
+    existing = set(conn.execute(select(sequences.c.user_id)).scalars())
+    for user_id, number in highest.items():
+        if user_id is not None and user_id not in existing:
+            conn.execute(sequences.insert().values(user_id=user_id, last_number=number or 0))
+
+def m004_trade_running_totals(conn: Connection):
+    add_column(conn, "trades", "total_qty", "INTEGER DEFAULT 0")
+    add_column(conn, "trades", "total_value", "FLOAT DEFAULT 0")
+    conn.execute(text(
+        "UPDATE trades SET "
+        "total_qty = (SELECT COALESCE(SUM(quantity), 0) FROM trade_entries WHERE trade_id = trades.id), "
+        "total_value = (SELECT COALESCE(SUM(quantity * price), 0) FROM trade_entries WHERE trade_id = trades.id)"
+    ))
+
+def m005_trade_exit_index(conn: Connection):
+    # P&L is bucketed by when a trade closed; older rows may have been closed
+    # without an exit time, and updated_at is the best record of it
+    conn.execute(text(
+        "UPDATE trades SET exit_datetime = updated_at WHERE status = 'CLOSED' AND exit_datetime IS NULL"
+    ))
+    create_index(conn, "ix_trades_user_status_exit", "trades", "user_id", "status", "exit_datetime")
+
+def m006_unique_holidays(conn: Connection):
+    # Keep the first row for each (date, type) so calendar files can upsert on it
+    conn.execute(text(
+        "DELETE FROM holidays WHERE id NOT IN (SELECT MIN(id) FROM holidays GROUP BY date, type)"
+    ))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_holidays_date_type ON holidays (date, type)"))
+
+def m007_expense_due_day(conn: Connection):
+    add_column(conn, "expenses", "due_day", "INTEGER")
+    conn.execute(text(
+        "UPDATE expenses SET due_day = CAST(strftime('%d', next_due_date) AS INTEGER) "
+        "WHERE due_day IS NULL AND next_due_date IS NOT NULL"
+    ))
+    # Quarterly and yearly plans now count towards monthly_expenses, prorated
+    conn.execute(text(
+        "UPDATE user_ledger_summary SET monthly_expenses = ("
+        "SELECT COALESCE(SUM(CASE billing_cycle WHEN 'MONTHLY' THEN amount WHEN 'QUARTERLY' THEN amount / 3.0 "
+        "WHEN 'YEARLY' THEN amount / 12.0 ELSE 0 END), 0) "
+        "FROM expenses WHERE expenses.user_id = user_ledger_summary.user_id AND is_active = 1)"
+    ))
+
+def m008_expense_listing_indexes(conn: Connection):
+    create_index(conn, "ix_expenses_user_category", "expenses", "user_id", "category", "created_at")
+    create_index(conn, "ix_expense_payments_expense_date", "expense_payments", "expense_id", "payment_date")
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "trade screenshot blob columns", m001_screenshot_blobs),
+    (2, "composite indexes for hot query paths", m002_hot_path_indexes),
+    (3, "unique per-user trade numbers and their sequence", m003_unique_trade_numbers),
+    (4, "running entry totals on trades", m004_trade_running_totals),
+    (5, "index closed trades by exit time", m005_trade_exit_index),
+    (6, "unique holidays per date and type", m006_unique_holidays),
+    (7, "expense due day and prorated monthly expenses", m007_expense_due_day),
+    (8, "indexes for expense filters and payment history", m008_expense_listing_indexes),
+]
+
+def current_version(conn: Connection) -> int:
+    return conn.execute(select(func.coalesce(func.max(SchemaMigration.version), 0))).scalar()
+
+def run_migrations(engine: Engine) -> List[int]:
+    """Apply pending migrations in order, each in its own transaction"""
+    SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+    applied = []
+    with engine.connect() as conn:
+        version = current_version(conn)
+    for number, name, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(
+                version=number, name=name, applied_at=datetime.utcnow()
+            ))
+        applied.append(number)
+    return applied
+
+def hot_queries(user_id: int = 1):
+    """Representative versions of the router queries, for EXPLAIN QUERY PLAN"""
+    now = datetime.utcnow()
+    return [
+        ("trades list", select(Trade.id).where(Trade.user_id == user_id)
+            .order_by(Trade.created_at.desc(), Trade.id.desc()).limit(50)),
+        ("trades by status", select(Trade.id).where(Trade.user_id == user_id, Trade.status == "OPEN")
+            .order_by(Trade.created_at.asc()).limit(5)),
+        ("recent closed trades", select(Trade.id).where(Trade.user_id == user_id, Trade.status == "CLOSED")
+            .order_by(Trade.updated_at.desc()).limit(5)),
+        ("weekly closed trades", select(func.sum(Trade.return_amount)).where(
+            Trade.user_id == user_id, Trade.status == "CLOSED", Trade.updated_at >= now - timedelta(days=7))),
+        ("pnl series", select(func.date(Trade.exit_datetime, "+19800 seconds"), func.sum(Trade.return_amount))
+            .where(Trade.user_id == user_id, Trade.status == "CLOSED",
+                   Trade.exit_datetime >= now - timedelta(days=30), Trade.exit_datetime < now)
+            .group_by(func.date(Trade.exit_datetime, "+19800 seconds"))),
+        ("capital flows: trades", select(Trade.id, Trade.exit_datetime, Trade.return_amount)
+            .where(Trade.user_id == user_id, Trade.status == "CLOSED", Trade.exit_datetime.is_not(None))
+            .order_by(Trade.exit_datetime, Trade.id)),
+        ("trade entries", select(TradeEntry.id).where(TradeEntry.trade_id.in_([1, 2, 3]))),
+        ("investments", select(Investment.id).where(Investment.user_id == user_id)
+            .order_by(Investment.date.desc())),
+        ("withdrawals", select(Withdrawal.id).where(Withdrawal.user_id == user_id)
+            .order_by(Withdrawal.date.desc())),
+        ("capital flows: investments", select(Investment.id, Investment.amount).where(Investment.user_id == user_id)
+            .order_by(Investment.date, Investment.id)),
+        ("capital flows: withdrawals", select(Withdrawal.id, Withdrawal.amount).where(Withdrawal.user_id == user_id)
+            .order_by(Withdrawal.date, Withdrawal.id)),
+        ("expenses", select(Expense.id).where(Expense.user_id == user_id)
+            .order_by(Expense.created_at.desc())),
+        ("active expenses", select(func.count(Expense.id)).where(
+            Expense.user_id == user_id, Expense.is_active == True)),
+        ("expenses by category", select(Expense.id).where(Expense.user_id == user_id, Expense.category == "OTHER")
+            .order_by(Expense.created_at.desc())),
+        ("expense payment summaries", select(ExpensePayment.expense_id, func.count(ExpensePayment.id))
+            .where(ExpensePayment.expense_id.in_([1, 2, 3])).group_by(ExpensePayment.expense_id)),
+        ("expense payments page", select(ExpensePayment.id).where(ExpensePayment.expense_id == 1)
+            .order_by(ExpensePayment.payment_date.desc(), ExpensePayment.id.desc()).limit(50)),
+        ("settings", select(Settings.id).where(Settings.user_id == user_id)),
+        ("ledger summary", select(LedgerSummary.total_pl).where(LedgerSummary.user_id == user_id)),
+    ]
+
+def check_query_plans(engine: Engine) -> List[Tuple[str, List[str], bool]]:
+    """Run EXPLAIN QUERY PLAN on each hot query; a plain SCAN means a full table scan"""
+    results = []
+    with engine.connect() as conn:
+        for name, stmt in hot_queries():
+            compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+            params = tuple(compiled.params[key] for key in compiled.positiontup)
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+            details = [row[-1] for row in rows]
+            full_scan = any(d.startswith("SCAN ") and "INDEX" not in d for d in details)
+            results.append((name, details, not full_scan))
+    return results
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -45,6 +45,9 @@ class Trade(Base):
     instrument_type = Column(String(50))
     lot_size = Column(Integer)
     avg_price = Column(Float, nullable=True)
+    # Running sums over the entries, kept up to date on every fill
+    total_qty = Column(Integer, default=0)
+    total_value = Column(Float, default=0)
     exit_price = Column(Float, nullable=True)
     exit_datetime = Column(DateTime, nullable=True)
     return_percent = Column(Float, nullable=True)
@@ -55,11 +58,21 @@ class Trade(Base):
     learnings = Column(Text, nullable=True)
     feedback = Column(Text, nullable=True)
     screenshot = Column(Text, nullable=True)
+    screenshot_hash = Column(String(64), ForeignKey("blobs.hash"), nullable=True)
+    screenshot_thumb_hash = Column(String(64), ForeignKey("blobs.hash"), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     user = relationship("User", back_populates="trades")
     entries = relationship("TradeEntry", back_populates="trade", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("ix_trades_user_created", "user_id", "created_at"),
+        Index("ix_trades_user_status_created", "user_id", "status", "created_at"),
+        Index("ix_trades_user_status_updated", "user_id", "status", "updated_at"),
+        Index("ix_trades_user_status_exit", "user_id", "status", "exit_datetime"),
+        Index("ux_trades_user_trade_number", "user_id", "trade_number", unique=True),
+    )
 
 class TradeEntry(Base):
     __tablename__ = "trade_entries"
@@ -72,6 +85,10 @@ class TradeEntry(Base):
     datetime = Column(DateTime, default=datetime.utcnow)
     
     trade = relationship("Trade", back_populates="entries")
+    
+    __table_args__ = (
+        Index("ix_trade_entries_trade_id", "trade_id"),
+    )
 
 class Expense(Base):
     __tablename__ = "expenses"
@@ -83,6 +100,7 @@ class Expense(Base):
     amount = Column(Float)
     billing_cycle = Column(String(20))
     next_due_date = Column(DateTime, nullable=True)
+    due_day = Column(Integer, nullable=True)  # day of month it falls due, clamped in shorter months
     auto_renew = Column(Boolean, default=True)
     notes = Column(Text, nullable=True)
     is_active = Column(Boolean, default=True)
@@ -90,6 +108,12 @@ class Expense(Base):
     
     user = relationship("User", back_populates="expenses")
     payments = relationship("ExpensePayment", back_populates="expense", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("ix_expenses_user_created", "user_id", "created_at"),
+        Index("ix_expenses_user_active", "user_id", "is_active"),
+        Index("ix_expenses_user_category", "user_id", "category", "created_at"),
+    )
 
 class ExpensePayment(Base):
     __tablename__ = "expense_payments"
@@ -101,6 +125,11 @@ class ExpensePayment(Base):
     payment_method = Column(String(50), nullable=True)
     
     expense = relationship("Expense", back_populates="payments")
+    
+    __table_args__ = (
+        Index("ix_expense_payments_expense_id", "expense_id"),
+        Index("ix_expense_payments_expense_date", "expense_id", "payment_date"),
+    )
 
 class Investment(Base):
     __tablename__ = "investments"
@@ -115,6 +144,10 @@ class Investment(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User", back_populates="investments")
+    
+    __table_args__ = (
+        Index("ix_investments_user_date", "user_id", "date"),
+    )
 
 class Withdrawal(Base):
     __tablename__ = "withdrawals"
@@ -127,17 +160,63 @@ class Withdrawal(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User", back_populates="withdrawals")
+    
+    __table_args__ = (
+        Index("ix_withdrawals_user_date", "user_id", "date"),
+    )
 
 class Holiday(Base):
     __tablename__ = "holidays"
     
     id = Column(Integer, primary_key=True, index=True)
-    date = Column(DateTime)
+    date = Column(DateTime, index=True)
     description = Column(String(200))
     type = Column(String(20))
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ux_holidays_date_type", "date", "type", unique=True),
+    )
+
+class LedgerSummary(Base):
+    __tablename__ = "user_ledger_summary"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total_invested = Column(Float, default=0)
+    total_withdrawn = Column(Float, default=0)
+    total_pl = Column(Float, default=0)
+    trade_count = Column(Integer, default=0)
+    open_count = Column(Integer, default=0)
+    closed_count = Column(Integer, default=0)
+    win_count = Column(Integer, default=0)
+    monthly_expenses = Column(Float, default=0)
+    active_subscriptions = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class TradeNumberSequence(Base):
+    """The last trade number handed out per user; numbers are never reused after a delete"""
+    __tablename__ = "trade_number_sequences"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    last_number = Column(Integer, default=0)
+
+class Blob(Base):
+    __tablename__ = "blobs"
+    
+    hash = Column(String(64), primary_key=True)
+    mime_type = Column(String(50))
+    size = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+    
+    version = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
 class PlanTrade(Base):
+    """The fixed 4% plan seeded by older versions; no longer read, see app.plan"""
     __tablename__ = "plan_trades"
     
     id = Column(Integer, primary_key=True, index=True)
@@ -147,3 +226,16 @@ class PlanTrade(Base):
     after_trade_close = Column(Float)
     no_of_lots = Column(Integer)
     capital_used = Column(Float)
+
+class ImportedFill(Base):
+    """A broker fill already imported, so re-importing the same CSV is a no-op"""
+    __tablename__ = "imported_fills"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    fill_hash = Column(String(64), primary_key=True)
+    trade_id = Column(Integer, ForeignKey("trades.id"), index=True)
+    side = Column(String(4))
+    quantity = Column(Integer)
+    price = Column(Float)
+    executed_at = Column(DateTime)
+    imported_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,22 @@
+"""Keyset pagination cursors.
+
+A cursor is the (datetime, id) of the last row on a page, base64-encoded so
+clients treat it as opaque. The next page continues strictly after that pair.
+"""
+import base64
+from datetime import datetime
+from typing import Tuple
+from fastapi import HTTPException
+
+def encode_cursor(at: datetime, row_id: int) -> str:
+    raw = f"{at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """The (datetime, id) in `cursor`; anything that isn't a cursor we issued is a 400"""
+    try:
+        at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(at), int(row_id)
+    except ValueError:
+        # Bad base64 (binascii.Error) and non-UTF-8 bytes (UnicodeDecodeError) are ValueErrors too
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,92 @@
+"""The compounding plan: what capital each trade should start from if every
+trade returns the user's target percent.
+
+The schedule is computed with NumPy from the user's settings rather than read
+from stored rows: trade n starts from initial_capital * (1 + r)^(n - 1), the
+closed form of the running product of growth factors, and the lots it can buy
+are that capital rounded down to whole lots costing LOT_COST each. Each user's
+default plan is memoized on the parameters it was computed from and dropped
+when their settings change.
+"""
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.models.models import Settings
+
+DEFAULT_LENGTH = 200
+MAX_LENGTH = 10000
+# Capital per lot when sizing trades, as in the original seeded plan; what-if
+# requests can override it
+LOT_COST = 1000.0
+
+@dataclass(frozen=True)
+class PlanParameters:
+    initial_capital: float
+    return_percent: float
+    lot_cost: float = LOT_COST
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Settings]) -> "PlanParameters":
+        return cls(
+            initial_capital=(settings.initial_capital if settings else None) or 40000,
+            return_percent=(settings.return_per_trade if settings else None) or 4
+        )
+
+def project(params: PlanParameters, length: int = DEFAULT_LENGTH, first: int = 1) -> List[dict]:
+    """Plan rows for trades first .. first + length - 1, in the /api/plan schema"""
+    numbers = np.arange(first, first + length)
+    growth = 1 + params.return_percent / 100
+    with np.errstate(over="ignore"):
+        capital = params.initial_capital * np.power(growth, numbers - 1.0)
+        after = capital * growth
+    # A long schedule at a high return overflows; stop where it does
+    finite = np.isfinite(after)
+    if not finite.all():
+        end = int(np.argmin(finite))
+        numbers, capital, after = numbers[:end], capital[:end], after[:end]
+    lots = np.floor(capital / params.lot_cost) if params.lot_cost > 0 else np.zeros(len(capital))
+    capital_used = lots * params.lot_cost
+    return [
+        {
+            "trade_number": number,
+            "initial_investment": start,
+            "profit_percent": params.return_percent,
+            "after_trade_close": end_capital,
+            "no_of_lots": int(lot_count),
+            "capital_used": used
+        }
+        for number, start, end_capital, lot_count, used in zip(
+            numbers.tolist(), capital.tolist(), after.tolist(), lots.tolist(), capital_used.tolist()
+        )
+    ]
+
+def plan_trade(params: PlanParameters, number: int) -> Optional[dict]:
+    rows = project(params, 1, number)
+    return rows[0] if rows else None
+
+class PlanEngine:
+    def __init__(self):
+        self._cache: Dict[int, Tuple[Tuple[PlanParameters, int], List[dict]]] = {}
+        self.computations = 0
+
+    def get(self, user_id: int, settings: Optional[Settings], length: int = DEFAULT_LENGTH,
+            **overrides) -> List[dict]:
+        """The user's plan; any non-None override is a what-if and isn't memoized"""
+        params = PlanParameters.from_settings(settings)
+        overrides = {name: value for name, value in overrides.items() if value is not None}
+        if overrides:
+            self.computations += 1
+            return project(replace(params, **overrides), length)
+        key = (params, length)
+        cached = self._cache.get(user_id)
+        if cached and cached[0] == key:
+            return cached[1]
+        self.computations += 1
+        rows = project(params, length)
+        self._cache[user_id] = (key, rows)
+        return rows
+
+    def invalidate(self, user_id: int):
+        self._cache.pop(user_id, None)
+
+plan_engine = PlanEngine()
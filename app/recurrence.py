@@ -0,0 +1,193 @@
+"""Calendar-correct recurrence for expenses.
+
+A recurring expense falls due every 1, 3 or 12 calendar months on its
+`due_day`, clamped to the length of shorter months: a bill due on the 31st is
+due on 28/29 February and back on 31 March, instead of drifting a few days
+every cycle the way fixed 30/365-day steps do.
+
+Due dates are computed in bulk with NumPy datetime64 month arithmetic, both
+for the forecast and for the rollover job, which moves every overdue
+auto-renew expense to its next due date on or after today in one batched
+UPDATE.
+"""
+import asyncio
+import calendar
+from datetime import date, datetime
+from typing import Optional
+import numpy as np
+from sqlalchemy import bindparam, case, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.models.models import Expense
+from app.ticks import IST
+
+CYCLE_MONTHS = {"MONTHLY": 1, "QUARTERLY": 3, "YEARLY": 12}
+
+def monthly_amount(amount: Optional[float], billing_cycle: Optional[str]) -> float:
+    """What a recurring expense costs per month; one-time expenses cost nothing recurring"""
+    months = CYCLE_MONTHS.get(billing_cycle)
+    return (amount or 0) / months if months else 0
+
+def monthly_amount_expression():
+    """monthly_amount() as SQL over Expense"""
+    return case(
+        *[(Expense.billing_cycle == cycle, Expense.amount / months) for cycle, months in CYCLE_MONTHS.items()],
+        else_=0
+    )
+
+def add_months(day: datetime, months: int, due_day: Optional[int] = None) -> datetime:
+    """`day` moved by whole calendar months onto `due_day` (default its own day), clamped to the month"""
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    last = calendar.monthrange(year, month + 1)[1]
+    return day.replace(year=year, month=month + 1, day=min(due_day or day.day, last))
+
+def next_due_date(due: datetime, billing_cycle: str, due_day: Optional[int] = None) -> Optional[datetime]:
+    months = CYCLE_MONTHS.get(billing_cycle)
+    return add_months(due, months, due_day) if months else None
+
+def due_dates(months: np.ndarray, due_day: np.ndarray) -> np.ndarray:
+    """datetime64[D] dates for datetime64[M] months on `due_day`, clamped to each month's length"""
+    first = months.astype("datetime64[D]")
+    length = ((months + 1).astype("datetime64[D]") - first).astype(np.int64)
+    return first + (np.minimum(due_day, length) - 1)
+
+def periods_until(due: np.ndarray, due_day: np.ndarray, cycle: np.ndarray, today: np.datetime64) -> np.ndarray:
+    """Cycles to add to each `due` (datetime64[D]) so it lands on or after `today`"""
+    month_gap = (today.astype("datetime64[M]") - due.astype("datetime64[M]")).astype(np.int64)
+    periods = np.maximum(-(-month_gap // cycle), 0)  # ceil
+    landed = due_dates(due.astype("datetime64[M]") + periods * cycle, due_day)
+    return periods + (landed < today)
+
+def roll_overdue(db: Session, today: date) -> int:
+    """Move every active auto-renew expense due before `today` to its next due date
+    on or after it. Returns the number of expenses moved."""
+    rows = db.execute(
+        select(Expense.id, Expense.next_due_date, Expense.due_day, Expense.billing_cycle).where(
+            Expense.is_active == True, Expense.auto_renew == True,
+            Expense.billing_cycle.in_(list(CYCLE_MONTHS)),
+            Expense.next_due_date < datetime.combine(today, datetime.min.time())
+        )
+    ).all()
+    if not rows:
+        return 0
+
+    ids = [row[0] for row in rows]
+    old = [row[1] for row in rows]
+    due = np.array([d.date() for d in old], dtype="datetime64[D]")
+    due_day = np.array([row[2] or d.day for row, d in zip(rows, old)], dtype=np.int64)
+    cycle = np.array([CYCLE_MONTHS[row[3]] for row in rows], dtype=np.int64)
+    periods = periods_until(due, due_day, cycle, np.datetime64(today, "D"))
+    rolled = due_dates(due.astype("datetime64[M]") + periods * cycle, due_day)
+
+    # One statement executed over the batch; matching on the old date skips a
+    # row that a payment moved in the meantime
+    result = db.execute(
+        update(Expense.__table__)
+        .where(Expense.__table__.c.id == bindparam("_id"),
+               Expense.__table__.c.next_due_date == bindparam("_old"))
+        .values(next_due_date=bindparam("_new")),
+        [
+            {"_id": expense_id, "_old": previous,
+             "_new": datetime.combine(new_date.item(), previous.time())}
+            for expense_id, previous, new_date in zip(ids, old, rolled)
+        ]
+    )
+    db.commit()
+    return result.rowcount
+
+def forecast(expenses, start: date, months: int) -> dict:
+    """Outflow per calendar month for `months` months from `start`'s month.
+
+    `expenses` are (amount, billing_cycle, next_due_date, due_day, auto_renew)
+    rows of active expenses. Auto-renew expenses already overdue are projected
+    from their next due date on or after `start`, as the rollover will move
+    them; other overdue bills are reported as `overdue`.
+    """
+    first_month = np.datetime64(start, "M")
+    labels = [str(m) for m in first_month + np.arange(months)]
+    totals = np.zeros(months)
+    counts = np.zeros(months, dtype=np.int64)
+    overdue = 0.0
+    today = np.datetime64(start, "D")
+
+    dated = [e for e in expenses if e[2] is not None]
+    if dated:
+        amount = np.array([e[0] or 0 for e in dated], dtype=np.float64)
+        due = np.array([e[2].date() for e in dated], dtype="datetime64[D]")
+        due_day = np.array([e[3] or e[2].day for e in dated], dtype=np.int64)
+        # One-time bills get a placeholder cycle; they fall due once, like any that don't renew
+        cycle = np.array([CYCLE_MONTHS.get(e[1], months + 1) for e in dated], dtype=np.int64)
+        recurring = np.array([e[1] in CYCLE_MONTHS for e in dated])
+        renews = np.array([bool(e[4]) for e in dated]) & recurring
+
+        late = (due < today) & ~renews
+        overdue = float(amount[late].sum())
+        # Late bills that don't renew are counted once, as overdue
+        keep = ~late
+        amount, due, due_day, cycle, renews = amount[keep], due[keep], due_day[keep], cycle[keep], renews[keep]
+        skip = np.where(renews, periods_until(due, due_day, cycle, today), 0)
+
+        # Every (expense, occurrence) pair in the horizon, as one flat array
+        occurrences = np.arange(months)
+        base = due.astype("datetime64[M]") + skip * cycle
+        month = base[:, None] + occurrences[None, :] * cycle[:, None]
+        offset = (month - first_month).astype(np.int64)
+        valid = (offset >= 0) & (offset < months)
+        # Bills that don't renew fall due once
+        valid &= (occurrences[None, :] == 0) | renews[:, None]
+        np.add.at(totals, offset[valid], np.broadcast_to(amount[:, None], offset.shape)[valid])
+        np.add.at(counts, offset[valid], 1)
+
+    return {
+        "start": labels[0],
+        "months": months,
+        "total": float(totals.sum()),
+        "overdue": overdue,
+        "series": [
+            {"month": label, "amount": float(total), "payments": int(count)}
+            for label, total, count in zip(labels, totals, counts)
+        ]
+    }
+
+class ExpenseRoller:
+    """Runs roll_overdue at startup and then every EXPENSE_ROLLOVER_INTERVAL_SECONDS"""
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+
+    def roll(self) -> int:
+        if self.session_factory is None:
+            from app.database import SessionLocal
+            self.session_factory = SessionLocal
+        db = self.session_factory()
+        try:
+            return roll_overdue(db, datetime.now(IST).date())
+        finally:
+            db.close()
+
+    def start(self):
+        if settings.EXPENSE_ROLLOVER_INTERVAL_SECONDS and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        while True:
+            try:
+                rolled = await run_in_threadpool(self.roll)
+                if rolled:
+                    print(f"Rolled {rolled} overdue expenses forward")
+            except Exception as e:
+                print(f"Expense rollover error: {e!r}")
+            await asyncio.sleep(settings.EXPENSE_ROLLOVER_INTERVAL_SECONDS)
+
+expense_roller = ExpenseRoller()
@@ -1 +1 @@
-from app.routers import auth, trades, expenses, investments, holidays, settings, dashboard, plan
+from app.routers import auth, trades, expenses, investments, holidays, settings, dashboard, plan, blobs
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
+from app.auth import get_current_user, CurrentUser
+from app.analytics import analytics_cache
+
+router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+
+@router.get("")
+async def get_analytics(
+    points: int = Query(500, ge=10, le=5000),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Performance statistics over closed trades; `points` caps the equity curve length"""
+    return await analytics_cache.get(db, user.id, points)
@@ -1,14 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional
 from app.database import get_db
 from app.models.models import User, Settings
 from app.auth import (
-    verify_password, get_password_hash, create_access_token,
-    generate_totp_secret, get_totp_uri, generate_qr_code, verify_totp,
-    get_current_user
+    verify_password_async, get_password_hash_async, create_access_token,
+    generate_totp_secret, get_totp_uri, generate_qr_code_async, verify_totp,
+    get_current_user, get_current_user_model, invalidate_user, CurrentUser,
+    login_throttle
 )
 from app.config import settings as app_settings
 
@@ -30,16 +32,40 @@ class SetupMFAResponse(BaseModel):
 class VerifyMFARequest(BaseModel):
     code: str
 
+def throttle_keys(request: LoginRequest, http_request: Request):
+    """Failed logins are limited per username and, more loosely, per client address"""
+    client = http_request.client.host if http_request.client else "unknown"
+    return (
+        (f"user:{request.username.lower()}", app_settings.LOGIN_MAX_FAILURES_PER_USER),
+        (f"ip:{client}", app_settings.LOGIN_MAX_FAILURES_PER_IP)
+    )
+
+def login_failed(keys, detail: str) -> HTTPException:
+    for key, _ in keys:
+        login_throttle.record_failure(key)
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
 @router.post("/login")
-async def login(request: LoginRequest, response: Response, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == request.username).first()
-    
-    if not user or not verify_password(request.password, user.password_hash):
+async def login(
+    request: LoginRequest,
+    http_request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db)
+):
+    keys = throttle_keys(request, http_request)
+    retry_after = max(login_throttle.retry_after(key, limit) for key, limit in keys)
+    if retry_after:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid username or password"
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts, try again later",
+            headers={"Retry-After": str(retry_after)}
         )
     
+    user = await db.scalar(select(User).where(User.username == request.username))
+    
+    if not user or not await verify_password_async(request.password, user.password_hash):
+        raise login_failed(keys, "Invalid username or password")
+    
     # Check MFA if enabled
     if user.mfa_enabled:
         if not request.totp_code:
@@ -49,11 +75,9 @@ async def login(request: LoginRequest, response: Response, db: Session = Depends
             )
         
         if not verify_totp(user.totp_secret, request.totp_code):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid MFA code"
-            )
+            raise login_failed(keys, "Invalid MFA code")
     
+    login_throttle.reset(keys[0][0])
     token = create_access_token(data={"sub": user.username})
     
     response = JSONResponse(content={
@@ -78,7 +102,7 @@ async def logout(response: Response):
     return response
 
 @router.get("/me")
-async def get_me(user: User = Depends(get_current_user)):
+async def get_me(user: CurrentUser = Depends(get_current_user)):
     return {
         "username": user.username,
         "mfa_enabled": user.mfa_enabled,
@@ -88,40 +112,41 @@ async def get_me(user: User = Depends(get_current_user)):
 @router.post("/change-password")
 async def change_password(
     request: ChangePasswordRequest,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: User = Depends(get_current_user_model),
+    db: AsyncSession = Depends(get_db)
 ):
-    if not verify_password(request.current_password, user.password_hash):
+    if not await verify_password_async(request.current_password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Current password is incorrect"
         )
     
-    user.password_hash = get_password_hash(request.new_password)
-    db.commit()
+    user.password_hash = await get_password_hash_async(request.new_password)
+    await db.commit()
+    invalidate_user(user.username)
     
     return {"message": "Password changed successfully"}
 
 @router.post("/setup-mfa", response_model=SetupMFAResponse)
 async def setup_mfa(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: User = Depends(get_current_user_model),
+    db: AsyncSession = Depends(get_db)
 ):
     secret = generate_totp_secret()
     uri = get_totp_uri(secret, user.username)
-    qr_code = generate_qr_code(uri)
+    qr_code = await generate_qr_code_async(uri)
     
     # Store secret temporarily (not enabled yet)
     user.totp_secret = secret
-    db.commit()
+    await db.commit()
     
     return {"qr_code": qr_code, "secret": secret}
 
 @router.post("/verify-mfa")
 async def verify_mfa(
     request: VerifyMFARequest,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: User = Depends(get_current_user_model),
+    db: AsyncSession = Depends(get_db)
 ):
     if not user.totp_secret:
         raise HTTPException(
@@ -136,15 +161,16 @@ async def verify_mfa(
         )
     
     user.mfa_enabled = True
-    db.commit()
+    await db.commit()
+    invalidate_user(user.username)
     
     return {"message": "MFA enabled successfully"}
 
 @router.post("/disable-mfa")
 async def disable_mfa(
     request: VerifyMFARequest,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: User = Depends(get_current_user_model),
+    db: AsyncSession = Depends(get_db)
 ):
     if not user.mfa_enabled:
         raise HTTPException(
@@ -160,6 +186,7 @@ async def disable_mfa(
     
     user.mfa_enabled = False
     user.totp_secret = None
-    db.commit()
+    await db.commit()
+    invalidate_user(user.username)
     
     return {"message": "MFA disabled successfully"}
@@ -0,0 +1,40 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
+from app.models.models import Trade, Blob
+from app.auth import get_current_user, CurrentUser
+from app.blobs import blob_path, IMAGE_TYPES
+
+router = APIRouter(prefix="/api/blobs", tags=["blobs"])
+
+# Blobs are content-addressed, so a given URL never changes
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+# Served same-origin with the session cookie: never sniff a type or run anything
+SECURITY_HEADERS = {"X-Content-Type-Options": "nosniff", "Content-Security-Policy": "default-src 'none'"}
+
+@router.get("/{blob_hash}")
+async def get_blob(
+    blob_hash: str,
+    request: Request,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    owned = await db.scalar(select(Trade.id).where(
+        Trade.user_id == user.id,
+        or_(Trade.screenshot_hash == blob_hash, Trade.screenshot_thumb_hash == blob_hash)
+    ).limit(1))
+    blob = await db.get(Blob, blob_hash) if owned else None
+    if not blob or not os.path.exists(blob_path(blob_hash)):
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    etag = f'"{blob_hash}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, **SECURITY_HEADERS}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    # Rows stored before types were checked may claim anything; serve those as plain bytes
+    media_type = blob.mime_type if blob.mime_type in IMAGE_TYPES else "application/octet-stream"
+    return FileResponse(blob_path(blob_hash), media_type=media_type, headers=headers)
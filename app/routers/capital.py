@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
+from app.auth import get_current_user, CurrentUser
+from app.capital import capital_engine
+
+router = APIRouter(prefix="/api/capital", tags=["capital"])
+
+@router.get("")
+async def get_capital(
+    days: int = Query(None, ge=1, le=36500),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Daily capital curve with time- and money-weighted returns and reserve usage.
+    `days` keeps only the last days of the curve; the returns always cover all history."""
+    result = await capital_engine.get(db, user.id)
+    if days is None:
+        return result
+    return {**result, "curve": result["curve"][-days:]}
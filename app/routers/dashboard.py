@@ -1,19 +1,27 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, datetime, timedelta
+from typing import Optional
 from app.database import get_db
-from app.models.models import User, Trade, Expense, Investment, Withdrawal, Holiday, Settings, PlanTrade
-from app.auth import get_current_user
+from app.models.models import Trade, Settings
+from app.auth import get_current_user, CurrentUser
+from app.ledger import get_ledger, next_trade_number
+from app.valuation import valuation_engine
+from app.analytics import pnl_series
+from app.plan import PlanParameters, plan_trade
+from app.ticks import IST, IST_NAME
+from app.trading_calendar import trading_calendar
 
 router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
 
 @router.get("")
 async def get_dashboard(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     # Settings
-    settings = db.query(Settings).filter(Settings.user_id == user.id).first()
+    settings = await db.scalar(select(Settings).where(Settings.user_id == user.id))
     if not settings:
         settings = Settings(
             user_id=user.id,
@@ -23,43 +31,50 @@ async def get_dashboard(
             reserve_amount=170000
         )
         db.add(settings)
-        db.commit()
+        await db.commit()
     
-    # Trades
-    trades = db.query(Trade).filter(Trade.user_id == user.id).all()
-    open_trades = [t for t in trades if t.status == "OPEN"]
-    closed_trades = [t for t in trades if t.status == "CLOSED"]
+    # Running totals maintained on every write
+    ledger = await db.run_sync(get_ledger, user.id)
+    closed_count = ledger.closed_count
+    winning_count = ledger.win_count
+    total_pl = ledger.total_pl
+    win_rate = (winning_count / closed_count * 100) if closed_count else 0
+    total_invested = ledger.total_invested
+    total_withdrawn = ledger.total_withdrawn
+    current_capital = total_invested + total_pl - total_withdrawn
     
-    total_pl = sum(t.return_amount or 0 for t in closed_trades)
-    winning_trades = [t for t in closed_trades if (t.return_amount or 0) > 0]
-    win_rate = (len(winning_trades) / len(closed_trades) * 100) if closed_trades else 0
+    # Unrealized P&L, cached per price tick
+    mtm = await valuation_engine.value_open_trades(db, user.id)
+    positions = {t["id"]: t for t in mtm["trades"]}
     
     # Weekly trades
     week_start = datetime.utcnow() - timedelta(days=7)
-    weekly_trades = [t for t in closed_trades if t.updated_at >= week_start]
-    weekly_pl = sum(t.return_amount or 0 for t in weekly_trades)
+    weekly = (await db.execute(select(
+        func.count(Trade.id).label("count"),
+        func.coalesce(func.sum(Trade.return_amount), 0).label("pl")
+    ).where(
+        Trade.user_id == user.id,
+        Trade.status == "CLOSED",
+        Trade.updated_at >= week_start
+    ))).one()
     
-    # Investments & Withdrawals
-    investments = db.query(Investment).filter(Investment.user_id == user.id).all()
-    withdrawals = db.query(Withdrawal).filter(Withdrawal.user_id == user.id).all()
-    total_invested = sum(i.amount for i in investments)
-    total_withdrawn = sum(w.amount for w in withdrawals)
-    current_capital = total_invested + total_pl - total_withdrawn
+    open_trades = (await db.execute(select(Trade.id, Trade.trade_number, Trade.symbol, Trade.avg_price).where(
+        Trade.user_id == user.id,
+        Trade.status == "OPEN"
+    ).order_by(Trade.created_at.asc()).limit(5))).all()
     
-    # Expenses
-    expenses = db.query(Expense).filter(Expense.user_id == user.id, Expense.is_active == True).all()
-    monthly_expenses = sum(e.amount for e in expenses if e.billing_cycle == "MONTHLY")
+    recent_trades = (await db.execute(select(Trade.id, Trade.trade_number, Trade.symbol, Trade.return_amount, Trade.updated_at).where(
+        Trade.user_id == user.id,
+        Trade.status == "CLOSED"
+    ).order_by(Trade.updated_at.desc()).limit(5))).all()
     
-    # Upcoming holidays
-    now = datetime.utcnow()
-    upcoming_holidays = db.query(Holiday).filter(
-        Holiday.date >= now,
-        Holiday.date <= now + timedelta(days=7)
-    ).order_by(Holiday.date.asc()).limit(3).all()
+    # Upcoming holidays, from the in-memory calendar
+    today = datetime.now(IST).date()
+    upcoming_holidays = trading_calendar.entries_between(today, today + timedelta(days=7))[:3]
     
     # Next plan trade
-    next_trade_number = len(trades) + 1
-    next_plan_trade = db.query(PlanTrade).filter(PlanTrade.trade_number == next_trade_number).first()
+    next_number = await db.run_sync(next_trade_number, user.id)
+    next_plan_trade = plan_trade(PlanParameters.from_settings(settings), next_number)
     
     # Goal progress
     goal_progress = ((current_capital - settings.initial_capital) / 
@@ -67,26 +82,26 @@ async def get_dashboard(
     
     return {
         "current_capital": current_capital,
+        "unrealized_pl": mtm["unrealized_pl"],
+        "current_capital_mtm": current_capital + mtm["unrealized_pl"],
         "total_invested": total_invested,
         "total_withdrawn": total_withdrawn,
         "total_pl": total_pl,
-        "weekly_pl": weekly_pl,
-        "weekly_trades_count": len(weekly_trades),
+        "weekly_pl": weekly.pl,
+        "weekly_trades_count": weekly.count,
         "win_rate": win_rate,
-        "winning_trades": len(winning_trades),
-        "total_closed_trades": len(closed_trades),
-        "open_trades_count": len(open_trades),
-        "monthly_expenses": monthly_expenses,
-        "active_subscriptions": len(expenses),
+        "winning_trades": winning_count,
+        "total_closed_trades": closed_count,
+        "open_trades_count": ledger.open_count,
+        "monthly_expenses": ledger.monthly_expenses,
+        "active_subscriptions": ledger.active_subscriptions,
         "goal_progress": goal_progress,
-        "trades_completed": len(closed_trades),
-        "trades_remaining": 200 - len(closed_trades),
+        "trades_completed": closed_count,
+        "trades_remaining": 200 - closed_count,
         "upcoming_holidays": [
             {
-                "id": h.id,
-                "date": h.date.isoformat(),
-                "description": h.description,
-                "days_until": (h.date - now).days
+                **h.as_dict(),
+                "days_until": (h.date - today).days
             }
             for h in upcoming_holidays
         ],
@@ -95,9 +110,11 @@ async def get_dashboard(
                 "id": t.id,
                 "trade_number": t.trade_number,
                 "symbol": t.symbol,
-                "avg_price": t.avg_price
+                "avg_price": t.avg_price,
+                "price": positions[t.id]["price"] if t.id in positions else None,
+                "unrealized_pl": positions[t.id]["unrealized_pl"] if t.id in positions else None
             }
-            for t in open_trades[:5]
+            for t in open_trades
         ],
         "recent_trades": [
             {
@@ -107,14 +124,16 @@ async def get_dashboard(
                 "return_amount": t.return_amount,
                 "updated_at": t.updated_at.isoformat()
             }
-            for t in sorted(closed_trades, key=lambda x: x.updated_at, reverse=True)[:5]
+            for t in recent_trades
         ],
         "next_plan_trade": {
-            "trade_number": next_plan_trade.trade_number,
-            "initial_investment": next_plan_trade.initial_investment,
-            "after_trade_close": next_plan_trade.after_trade_close,
-            "is_ahead": current_capital >= next_plan_trade.initial_investment
+            "trade_number": next_plan_trade["trade_number"],
+            "initial_investment": next_plan_trade["initial_investment"],
+            "after_trade_close": next_plan_trade["after_trade_close"],
+            "is_ahead": current_capital >= next_plan_trade["initial_investment"]
         } if next_plan_trade else None,
+        "next_weekly_expiry": trading_calendar.weekly_expiry(today, settings.nifty_expiry_day).isoformat(),
+        "next_monthly_expiry": trading_calendar.monthly_expiry(today, settings.nifty_expiry_day).isoformat(),
         "settings": {
             "initial_capital": settings.initial_capital,
             "target_capital": settings.target_capital,
@@ -123,29 +142,38 @@ async def get_dashboard(
         }
     }
 
+@router.get("/mark-to-market")
+async def get_mark_to_market(
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Unrealized P&L and distance to each target for every open trade"""
+    return await valuation_engine.value_open_trades(db, user.id)
+
+@router.get("/pnl-series")
+async def get_pnl_series(
+    bucket: str = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    tz: str = Query(IST_NAME, description="IANA timezone the buckets are cut in"),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Realized P&L per day, week or month between two local dates, empty buckets included"""
+    try:
+        return await pnl_series(db, user.id, bucket, start, end, tz)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/weekly-chart")
 async def get_weekly_chart(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    trades = db.query(Trade).filter(
-        Trade.user_id == user.id,
-        Trade.status == "CLOSED"
-    ).all()
-    
-    # Last 7 days
-    result = []
-    for i in range(6, -1, -1):
-        day = datetime.utcnow() - timedelta(days=i)
-        day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        
-        day_trades = [t for t in trades if day_start <= t.updated_at < day_end]
-        day_pl = sum(t.return_amount or 0 for t in day_trades)
-        
-        result.append({
-            "date": day_start.strftime("%a"),
-            "amount": day_pl
-        })
-    
-    return result
+    # The last 7 IST days
+    today = datetime.now(IST).date()
+    series = await pnl_series(db, user.id, "day", today - timedelta(days=6), today, IST_NAME)
+    return [
+        {"date": date.fromisoformat(b["start"]).strftime("%a"), "amount": b["amount"]}
+        for b in series["series"]
+    ]
@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, func, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 from app.database import get_db
-from app.models.models import User, Expense, ExpensePayment
-from app.auth import get_current_user
+from app.models.models import Expense, ExpensePayment
+from app.auth import get_current_user, CurrentUser
+from app.pagination import encode_cursor, decode_cursor
+from app.ledger import apply_ledger_delta, expense_state
+from app.recurrence import forecast, next_due_date
+from app.ticks import IST
 
 router = APIRouter(prefix="/api/expenses", tags=["expenses"])
 
@@ -28,57 +34,132 @@ class ExpenseUpdate(BaseModel):
     auto_renew: Optional[bool] = None
     notes: Optional[str] = None
 
+async def expenses_with_payments(db: AsyncSession, *conditions) -> list:
+    """Serialized expenses with their payment count, total and latest date, from one GROUP BY join"""
+    rows = (await db.execute(
+        select(
+            Expense,
+            func.count(ExpensePayment.id),
+            func.coalesce(func.sum(ExpensePayment.amount_paid), 0),
+            func.max(ExpensePayment.payment_date)
+        )
+        .outerjoin(ExpensePayment, ExpensePayment.expense_id == Expense.id)
+        .where(*conditions)
+        .group_by(Expense.id)
+        .order_by(Expense.created_at.desc(), Expense.id.desc())
+    )).all()
+    return [serialize_expense(expense, count, total, last) for expense, count, total, last in rows]
+
 @router.get("")
 async def get_expenses(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    category: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Served by ix_expenses_user_category or ix_expenses_user_active
+    conditions = [Expense.user_id == user.id]
+    if category:
+        conditions.append(Expense.category == category)
+    if is_active is not None:
+        conditions.append(Expense.is_active == is_active)
+    return await expenses_with_payments(db, *conditions)
+
+@router.get("/forecast")
+async def get_forecast(
+    months: int = Query(12, ge=1, le=120),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    expenses = db.query(Expense).filter(Expense.user_id == user.id).order_by(Expense.created_at.desc()).all()
-    return [serialize_expense(e) for e in expenses]
+    """Projected expense outflow per calendar month, starting with the current one"""
+    rows = (await db.execute(select(
+        Expense.amount, Expense.billing_cycle, Expense.next_due_date, Expense.due_day, Expense.auto_renew
+    ).where(Expense.user_id == user.id, Expense.is_active == True))).all()
+    return forecast(rows, datetime.now(IST).date(), months)
 
 @router.get("/{expense_id}")
 async def get_expense(
     expense_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    expense = db.query(Expense).filter(Expense.id == expense_id, Expense.user_id == user.id).first()
-    if not expense:
+    expenses = await expenses_with_payments(db, Expense.id == expense_id, Expense.user_id == user.id)
+    if not expenses:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    return expenses[0]
+
+@router.get("/{expense_id}/payments")
+async def get_payments(
+    expense_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Payment history, newest first, a page at a time"""
+    expense_id = await db.scalar(select(Expense.id).where(Expense.id == expense_id, Expense.user_id == user.id))
+    if expense_id is None:
         raise HTTPException(status_code=404, detail="Expense not found")
-    return serialize_expense(expense)
+    
+    total = await db.scalar(select(func.count(ExpensePayment.id)).where(ExpensePayment.expense_id == expense_id))
+    query = select(ExpensePayment).where(ExpensePayment.expense_id == expense_id)
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        query = query.where(or_(
+            ExpensePayment.payment_date < cursor_date,
+            and_(ExpensePayment.payment_date == cursor_date, ExpensePayment.id < cursor_id)
+        ))
+    
+    # Fetch one extra row to know whether another page exists
+    payments = (await db.scalars(query.order_by(
+        ExpensePayment.payment_date.desc(), ExpensePayment.id.desc()
+    ).limit(limit + 1))).all()
+    has_more = len(payments) > limit
+    payments = payments[:limit]
+    
+    return {
+        "items": [serialize_payment(p) for p in payments],
+        "total": total,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(payments[-1].payment_date, payments[-1].id) if has_more else None
+    }
 
 @router.post("")
 async def create_expense(
     data: ExpenseCreate,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
+    next_due = datetime.fromisoformat(data.next_due_date) if data.next_due_date else None
     expense = Expense(
         user_id=user.id,
         category=data.category,
         name=data.name,
         amount=data.amount,
         billing_cycle=data.billing_cycle,
-        next_due_date=datetime.fromisoformat(data.next_due_date) if data.next_due_date else None,
+        next_due_date=next_due,
+        due_day=next_due.day if next_due else None,
         auto_renew=data.auto_renew,
         notes=data.notes
     )
     db.add(expense)
-    db.commit()
-    db.refresh(expense)
-    return serialize_expense(expense)
+    await db.flush()
+    await db.run_sync(apply_ledger_delta, user.id, {}, expense_state(expense))
+    await db.commit()
+    return serialize_expense(expense, 0, 0, None)
 
 @router.patch("/{expense_id}")
 async def update_expense(
     expense_id: int,
     data: ExpenseUpdate,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    expense = db.query(Expense).filter(Expense.id == expense_id, Expense.user_id == user.id).first()
+    expense = await db.scalar(select(Expense).where(Expense.id == expense_id, Expense.user_id == user.id))
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
     
+    before = expense_state(expense)
     if data.category is not None:
         expense.category = data.category
     if data.name is not None:
@@ -91,36 +172,39 @@ async def update_expense(
         expense.billing_cycle = data.billing_cycle
     if data.next_due_date is not None:
         expense.next_due_date = datetime.fromisoformat(data.next_due_date) if data.next_due_date else None
+        expense.due_day = expense.next_due_date.day if expense.next_due_date else None
     if data.auto_renew is not None:
         expense.auto_renew = data.auto_renew
     if data.notes is not None:
         expense.notes = data.notes
     
-    db.commit()
-    db.refresh(expense)
-    return serialize_expense(expense)
+    await db.run_sync(apply_ledger_delta, user.id, before, expense_state(expense))
+    await db.commit()
+    return (await expenses_with_payments(db, Expense.id == expense.id))[0]
 
 @router.delete("/{expense_id}")
 async def delete_expense(
     expense_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    expense = db.query(Expense).filter(Expense.id == expense_id, Expense.user_id == user.id).first()
+    expense = await db.scalar(select(Expense).options(selectinload(Expense.payments)).where(Expense.id == expense_id, Expense.user_id == user.id))
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
     
-    db.delete(expense)
-    db.commit()
+    before = expense_state(expense)
+    await db.delete(expense)
+    await db.run_sync(apply_ledger_delta, user.id, before, {})
+    await db.commit()
     return {"message": "Expense deleted"}
 
 @router.post("/{expense_id}/payment")
 async def record_payment(
     expense_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    expense = db.query(Expense).filter(Expense.id == expense_id, Expense.user_id == user.id).first()
+    expense = await db.scalar(select(Expense).where(Expense.id == expense_id, Expense.user_id == user.id))
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
     
@@ -131,17 +215,25 @@ async def record_payment(
     )
     db.add(payment)
     
-    # Update next due date if auto-renew
+    # Move to the next due date if auto-renew, on the same day of the month
     if expense.auto_renew and expense.next_due_date:
-        if expense.billing_cycle == "MONTHLY":
-            expense.next_due_date = expense.next_due_date + timedelta(days=30)
-        elif expense.billing_cycle == "YEARLY":
-            expense.next_due_date = expense.next_due_date + timedelta(days=365)
+        expense.next_due_date = next_due_date(
+            expense.next_due_date, expense.billing_cycle, expense.due_day
+        ) or expense.next_due_date
     
-    db.commit()
+    await db.commit()
     return {"message": "Payment recorded"}
 
-def serialize_expense(expense: Expense) -> dict:
+def serialize_payment(payment: ExpensePayment) -> dict:
+    return {
+        "id": payment.id,
+        "amount_paid": payment.amount_paid,
+        "payment_date": payment.payment_date.isoformat(),
+        "payment_method": payment.payment_method
+    }
+
+def serialize_expense(expense: Expense, payment_count: int, total_paid: float,
+                      last_payment_date: Optional[datetime]) -> dict:
     return {
         "id": expense.id,
         "category": expense.category,
@@ -149,16 +241,12 @@ def serialize_expense(expense: Expense) -> dict:
         "amount": expense.amount,
         "billing_cycle": expense.billing_cycle,
         "next_due_date": expense.next_due_date.isoformat() if expense.next_due_date else None,
+        "due_day": expense.due_day,
         "auto_renew": expense.auto_renew,
         "notes": expense.notes,
         "is_active": expense.is_active,
         "created_at": expense.created_at.isoformat(),
-        "payments": [
-            {
-                "id": p.id,
-                "amount_paid": p.amount_paid,
-                "payment_date": p.payment_date.isoformat()
-            }
-            for p in expense.payments
-        ]
+        "payment_count": payment_count,
+        "total_paid": total_paid,
+        "last_payment_date": last_payment_date.isoformat() if last_payment_date else None
     }
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from app.database import AsyncSessionLocal
+from app.auth import get_current_user, CurrentUser
+from app.export import Export, DATASETS, FORMATS, COMPRESSIONS
+
+router = APIRouter(prefix="/api/export", tags=["export"])
+
+@router.get("")
+async def list_exports(user: CurrentUser = Depends(get_current_user)):
+    return {
+        "datasets": {name: dataset.names for name, dataset in DATASETS.items()},
+        "formats": list(FORMATS),
+        "compressions": list(COMPRESSIONS)
+    }
+
+@router.get("/{dataset}")
+async def export_dataset(
+    dataset: str,
+    format: str = "csv",
+    compression: str = "none",
+    user: CurrentUser = Depends(get_current_user)
+):
+    """Stream one dataset; screenshots are referenced by blob hash"""
+    try:
+        export = Export(dataset, format, compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def body():
+        # The session lives as long as the response body, not the request handler
+        async with AsyncSessionLocal() as db:
+            async for chunk in export.stream(db, user.id):
+                yield chunk
+
+    return StreamingResponse(body(), media_type=export.media_type, headers={
+        "Content-Disposition": f'attachment; filename="{export.filename}"'
+    })
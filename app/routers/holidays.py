@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
 from app.database import get_db
-from app.models.models import User, Holiday
-from app.auth import get_current_user
+from app.models.models import Holiday, Settings
+from app.auth import get_current_user, CurrentUser
+from app.ticks import IST
+from app.trading_calendar import trading_calendar, HolidayEntry
 
 router = APIRouter(prefix="/api/holidays", tags=["holidays"])
 
@@ -16,34 +20,58 @@ class HolidayCreate(BaseModel):
 
 @router.get("")
 async def get_holidays(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    year: Optional[int] = Query(None, ge=1, le=9999),
+    holiday_type: Optional[str] = Query(None, alias="type"),
+    user: CurrentUser = Depends(get_current_user)
 ):
-    holidays = db.query(Holiday).order_by(Holiday.date.asc()).all()
-    return [
-        {
-            "id": h.id,
-            "date": h.date.isoformat(),
-            "description": h.description,
-            "type": h.type
-        }
-        for h in holidays
-    ]
+    """Holidays in date order, from the calendar's sorted dates; `year` is a bisected slice"""
+    entries = (trading_calendar.entries_between(date(year, 1, 1), date(year, 12, 31)) if year
+               else trading_calendar.entries)
+    if holiday_type:
+        entries = [e for e in entries if e.type == holiday_type.upper()]
+    return [entry.as_dict() for entry in entries]
+
+@router.get("/calendar")
+async def get_calendar(
+    day: Optional[date] = None,
+    until: Optional[date] = None,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Trading-day facts for `day` (default today, IST); with `until`, the trading days from day to until"""
+    day = day or datetime.now(IST).date()
+    expiry_day = await db.scalar(select(Settings.nifty_expiry_day).where(Settings.user_id == user.id))
+    result = {
+        "date": day.isoformat(),
+        "is_trading_day": trading_calendar.is_trading_day(day),
+        "previous_trading_day": trading_calendar.previous_trading_day(day).isoformat(),
+        "next_trading_day": trading_calendar.next_trading_day(day).isoformat(),
+        "weekly_expiry": trading_calendar.weekly_expiry(day, expiry_day).isoformat(),
+        "monthly_expiry": trading_calendar.monthly_expiry(day, expiry_day).isoformat()
+    }
+    if until is not None:
+        result["until"] = until.isoformat()
+        result["trading_days"] = trading_calendar.trading_days_between(day, until)
+    return result
 
 @router.post("")
 async def create_holiday(
     data: HolidayCreate,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     holiday = Holiday(
         date=datetime.fromisoformat(data.date),
         description=data.description,
-        type=data.type
+        type=data.type.upper()
     )
     db.add(holiday)
-    db.commit()
-    db.refresh(holiday)
+    try:
+        await db.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="A holiday of this type already exists on that date")
+    await db.refresh(holiday)
+    trading_calendar.add(HolidayEntry(holiday.date.date(), holiday.id, holiday.description, holiday.type))
     return {
         "id": holiday.id,
         "date": holiday.date.isoformat(),
@@ -54,13 +82,14 @@ async def create_holiday(
 @router.delete("/{holiday_id}")
 async def delete_holiday(
     holiday_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    holiday = db.query(Holiday).filter(Holiday.id == holiday_id).first()
+    holiday = await db.scalar(select(Holiday).where(Holiday.id == holiday_id))
     if not holiday:
         raise HTTPException(status_code=404, detail="Holiday not found")
     
-    db.delete(holiday)
-    db.commit()
+    await db.delete(holiday)
+    await db.commit()
+    trading_calendar.remove(holiday_id)
     return {"message": "Holiday deleted"}
@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
 from app.database import get_db
-from app.models.models import User, Investment, Withdrawal
-from app.auth import get_current_user
+from app.models.models import Investment, Withdrawal
+from app.auth import get_current_user, CurrentUser
+from app.ledger import apply_ledger_delta, investment_state, withdrawal_state
 
 router = APIRouter(tags=["investments"])
 
@@ -30,10 +32,10 @@ class WithdrawalCreate(BaseModel):
 
 @router.get("/api/investments")
 async def get_investments(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    investments = db.query(Investment).filter(Investment.user_id == user.id).order_by(Investment.date.desc()).all()
+    investments = (await db.scalars(select(Investment).where(Investment.user_id == user.id).order_by(Investment.date.desc()))).all()
     return [
         {
             "id": i.id,
@@ -50,8 +52,8 @@ async def get_investments(
 @router.post("/api/investments")
 async def create_investment(
     data: InvestmentCreate,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     investment = Investment(
         user_id=user.id,
@@ -62,8 +64,9 @@ async def create_investment(
         notes=data.notes
     )
     db.add(investment)
-    db.commit()
-    db.refresh(investment)
+    await db.run_sync(apply_ledger_delta, user.id, {}, investment_state(investment))
+    await db.commit()
+    await db.refresh(investment)
     return {
         "id": investment.id,
         "type": investment.type,
@@ -75,10 +78,10 @@ async def create_investment(
 
 @router.get("/api/investments/withdrawals")
 async def get_withdrawals(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    withdrawals = db.query(Withdrawal).filter(Withdrawal.user_id == user.id).order_by(Withdrawal.date.desc()).all()
+    withdrawals = (await db.scalars(select(Withdrawal).where(Withdrawal.user_id == user.id).order_by(Withdrawal.date.desc()))).all()
     return [
         {
             "id": w.id,
@@ -93,8 +96,8 @@ async def get_withdrawals(
 @router.post("/api/investments/withdrawals")
 async def create_withdrawal(
     data: WithdrawalCreate,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     withdrawal = Withdrawal(
         user_id=user.id,
@@ -103,8 +106,9 @@ async def create_withdrawal(
         date=datetime.fromisoformat(data.date)
     )
     db.add(withdrawal)
-    db.commit()
-    db.refresh(withdrawal)
+    await db.run_sync(apply_ledger_delta, user.id, {}, withdrawal_state(withdrawal))
+    await db.commit()
+    await db.refresh(withdrawal)
     return {
         "id": withdrawal.id,
         "amount": withdrawal.amount,
@@ -115,23 +119,25 @@ async def create_withdrawal(
 @router.delete("/api/investments/withdrawals/{withdrawal_id}")
 async def delete_withdrawal(
     withdrawal_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    withdrawal = db.query(Withdrawal).filter(Withdrawal.id == withdrawal_id, Withdrawal.user_id == user.id).first()
+    withdrawal = await db.scalar(select(Withdrawal).where(Withdrawal.id == withdrawal_id, Withdrawal.user_id == user.id))
     if not withdrawal:
         raise HTTPException(status_code=404, detail="Withdrawal not found")
-    db.delete(withdrawal)
-    db.commit()
+    before = withdrawal_state(withdrawal)
+    await db.delete(withdrawal)
+    await db.run_sync(apply_ledger_delta, user.id, before, {})
+    await db.commit()
     return {"message": "Withdrawal deleted"}
 
 @router.get("/api/investments/{investment_id}")
 async def get_investment(
     investment_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    investment = db.query(Investment).filter(Investment.id == investment_id, Investment.user_id == user.id).first()
+    investment = await db.scalar(select(Investment).where(Investment.id == investment_id, Investment.user_id == user.id))
     if not investment:
         raise HTTPException(status_code=404, detail="Investment not found")
     return {
@@ -148,13 +154,14 @@ async def get_investment(
 async def update_investment(
     investment_id: int,
     data: InvestmentUpdate,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    investment = db.query(Investment).filter(Investment.id == investment_id, Investment.user_id == user.id).first()
+    investment = await db.scalar(select(Investment).where(Investment.id == investment_id, Investment.user_id == user.id))
     if not investment:
         raise HTTPException(status_code=404, detail="Investment not found")
     
+    before = investment_state(investment)
     if data.type is not None:
         investment.type = data.type
     if data.amount is not None:
@@ -166,8 +173,9 @@ async def update_investment(
     if data.notes is not None:
         investment.notes = data.notes
     
-    db.commit()
-    db.refresh(investment)
+    await db.run_sync(apply_ledger_delta, user.id, before, investment_state(investment))
+    await db.commit()
+    await db.refresh(investment)
     return {
         "id": investment.id,
         "type": investment.type,
@@ -180,12 +188,14 @@ async def update_investment(
 @router.delete("/api/investments/{investment_id}")
 async def delete_investment(
     investment_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    investment = db.query(Investment).filter(Investment.id == investment_id, Investment.user_id == user.id).first()
+    investment = await db.scalar(select(Investment).where(Investment.id == investment_id, Investment.user_id == user.id))
     if not investment:
         raise HTTPException(status_code=404, detail="Investment not found")
-    db.delete(investment)
-    db.commit()
+    before = investment_state(investment)
+    await db.delete(investment)
+    await db.run_sync(apply_ledger_delta, user.id, before, {})
+    await db.commit()
     return {"message": "Investment deleted"}
@@ -1,82 +1,55 @@
-from fastapi import APIRouter
-import httpx
-from datetime import datetime, timedelta
+import asyncio
+from datetime import date, datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.market import market_service, market_hub, format_quotes, sse_event, INDICES
+from app.ticks import tick_store, serialize_bars, RESOLUTIONS, IST
 
 router = APIRouter(prefix="/api/market", tags=["market"])
 
-# Cache to avoid too many requests
-cache = {
-    'sensex': {'price': 81234.50, 'prev': 80900, 'updated': None},
-    'nifty': {'price': 24856.50, 'prev': 24600, 'updated': None},
-    'banknifty': {'price': 52340.25, 'prev': 52000, 'updated': None}
-}
-
 @router.get("/indices")
 async def get_indices():
     """Fetch Sensex, NIFTY and Bank NIFTY data"""
-    global cache
-    
-    now = datetime.now()
-    # Update cache every 30 seconds
-    if cache['nifty']['updated'] and (now - cache['nifty']['updated']).seconds < 30:
-        return format_response()
-    
-    try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            # Try Yahoo Finance
-            for symbol, key in [("^BSESN", "sensex"), ("^NSEI", "nifty"), ("^NSEBANK", "banknifty")]:
+    return format_quotes(await market_service.get_quotes())
+
+@router.get("/stream")
+async def stream_indices():
+    """Server-Sent Events: the latest indices on connect, then every poller update"""
+    async def events():
+        queue = market_hub.subscribe()
+        try:
+            while True:
                 try:
-                    response = await client.get(
-                        f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}",
-                        params={"interval": "1d", "range": "1d"},
-                        headers={"User-Agent": "Mozilla/5.0"}
-                    )
-                    if response.status_code == 200:
-                        data = response.json()
-                        result = data.get("chart", {}).get("result", [{}])[0]
-                        meta = result.get("meta", {})
-                        price = meta.get("regularMarketPrice", cache[key]['price'])
-                        prev = meta.get("previousClose", meta.get("chartPreviousClose", cache[key]['prev']))
-                        cache[key] = {'price': price, 'prev': prev, 'updated': now}
-                except Exception as e:
-                    print(f"Yahoo fetch error for {symbol}: {e}")
-                    
-    except Exception as e:
-        print(f"Market data fetch error: {e}")
-    
-    return format_response()
+                    payload = await asyncio.wait_for(queue.get(), settings.MARKET_STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line: keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse_event(payload)
+        finally:
+            # Runs when the client disconnects and the response task is cancelled
+            market_hub.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
-def format_response():
-    sensex = cache['sensex']
-    nifty = cache['nifty']
-    bn = cache['banknifty']
-    
-    sensex_change = sensex['price'] - sensex['prev']
-    sensex_pct = (sensex_change / sensex['prev']) * 100 if sensex['prev'] else 0
-    
-    nifty_change = nifty['price'] - nifty['prev']
-    nifty_pct = (nifty_change / nifty['prev']) * 100 if nifty['prev'] else 0
-    
-    bn_change = bn['price'] - bn['prev']
-    bn_pct = (bn_change / bn['prev']) * 100 if bn['prev'] else 0
-    
+@router.get("/ohlc")
+async def get_ohlc(symbol: str = "nifty", day: Optional[date] = None, resolution: str = "5m"):
+    """Intraday OHLC bars for one index on one trading day (IST), today by default"""
+    if symbol not in INDICES:
+        raise HTTPException(status_code=400, detail=f"symbol must be one of {', '.join(INDICES)}")
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {', '.join(RESOLUTIONS)}")
+    day = day or datetime.now(IST).date()
+    bars = await run_in_threadpool(tick_store.ohlc, symbol, day, resolution)
     return {
-        "sensex": {
-            "price": round(sensex['price'], 2),
-            "change": round(sensex_change, 2),
-            "change_percent": round(sensex_pct, 2),
-            "is_up": sensex_change >= 0
-        },
-        "nifty": {
-            "price": round(nifty['price'], 2),
-            "change": round(nifty_change, 2),
-            "change_percent": round(nifty_pct, 2),
-            "is_up": nifty_change >= 0
-        },
-        "banknifty": {
-            "price": round(bn['price'], 2),
-            "change": round(bn_change, 2),
-            "change_percent": round(bn_pct, 2),
-            "is_up": bn_change >= 0
-        }
+        "symbol": symbol,
+        "day": day.isoformat(),
+        "resolution": resolution,
+        "bars": serialize_bars(bars)
     }
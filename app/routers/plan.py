@@ -1,25 +1,26 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 from app.database import get_db
-from app.models.models import User, PlanTrade
-from app.auth import get_current_user
+from app.models.models import Settings
+from app.auth import get_current_user, CurrentUser
+from app.plan import plan_engine, DEFAULT_LENGTH, MAX_LENGTH
 
 router = APIRouter(prefix="/api/plan", tags=["plan"])
 
 @router.get("")
 async def get_plan(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    trades: int = Query(DEFAULT_LENGTH, ge=1, le=MAX_LENGTH),
+    initial_capital: Optional[float] = Query(None, gt=0),
+    return_percent: Optional[float] = Query(None, gt=-100),
+    lot_cost: Optional[float] = Query(None, gt=0),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    plan_trades = db.query(PlanTrade).order_by(PlanTrade.trade_number.asc()).all()
-    return [
-        {
-            "trade_number": p.trade_number,
-            "initial_investment": p.initial_investment,
-            "profit_percent": p.profit_percent,
-            "after_trade_close": p.after_trade_close,
-            "no_of_lots": p.no_of_lots,
-            "capital_used": p.capital_used
-        }
-        for p in plan_trades
-    ]
+    """The compounding schedule from the user's settings; the optional parameters override them"""
+    settings = await db.scalar(select(Settings).where(Settings.user_id == user.id))
+    return plan_engine.get(
+        user.id, settings, trades,
+        initial_capital=initial_capital, return_percent=return_percent, lot_cost=lot_cost
+    )
@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional
 from app.database import get_db
-from app.models.models import User, Settings
-from app.auth import get_current_user
+from app.models.models import Settings
+from app.auth import get_current_user, CurrentUser
+from app.plan import plan_engine
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
 
@@ -20,10 +22,10 @@ class SettingsUpdate(BaseModel):
 
 @router.get("")
 async def get_settings(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    settings = db.query(Settings).filter(Settings.user_id == user.id).first()
+    settings = await db.scalar(select(Settings).where(Settings.user_id == user.id))
     if not settings:
         settings = Settings(
             user_id=user.id,
@@ -37,8 +39,8 @@ async def get_settings(
             nifty_expiry_day="TUESDAY"
         )
         db.add(settings)
-        db.commit()
-        db.refresh(settings)
+        await db.commit()
+        await db.refresh(settings)
     
     return {
         "initial_capital": settings.initial_capital,
@@ -54,10 +56,10 @@ async def get_settings(
 @router.patch("")
 async def update_settings(
     data: SettingsUpdate,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    settings = db.query(Settings).filter(Settings.user_id == user.id).first()
+    settings = await db.scalar(select(Settings).where(Settings.user_id == user.id))
     if not settings:
         settings = Settings(user_id=user.id)
         db.add(settings)
@@ -79,8 +81,9 @@ async def update_settings(
     if data.nifty_expiry_day is not None:
         settings.nifty_expiry_day = data.nifty_expiry_day
     
-    db.commit()
-    db.refresh(settings)
+    await db.commit()
+    await db.refresh(settings)
+    plan_engine.invalidate(user.id)
     return {
         "initial_capital": settings.initial_capital,
         "target_capital": settings.target_capital,
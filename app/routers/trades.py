@@ -1,18 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from sqlalchemy import select, and_, or_, case, delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, selectinload
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
-from app.database import get_db
-from app.models.models import User, Trade, TradeEntry
-from app.auth import get_current_user
+from starlette.concurrency import run_in_threadpool
+from app.database import get_db, SessionLocal
+from app.models.models import Trade, TradeEntry, ImportedFill
+from app.auth import get_current_user, CurrentUser
+from app.pagination import encode_cursor, decode_cursor
+from app.blobs import set_trade_screenshot, blob_url
+from app.ledger import apply_ledger_delta, get_ledger, trade_state, reserve_trade_numbers, add_fill
+from app.trade_import import import_trades
 
 router = APIRouter(prefix="/api/trades", tags=["trades"])
 
 class EntryCreate(BaseModel):
     price: float
-    lots: int
-    quantity: int
+    lots: int = Field(gt=0)
+    quantity: int = Field(gt=0)
 
 class TradeCreate(BaseModel):
     symbol: str
@@ -38,23 +45,67 @@ class TradeUpdate(BaseModel):
 
 class AddEntry(BaseModel):
     price: float
-    lots: int
+    lots: int = Field(gt=0)
 
 @router.get("")
 async def get_trades(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    status: Optional[str] = None,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    trades = db.query(Trade).filter(Trade.user_id == user.id).order_by(Trade.created_at.desc()).all()
-    return [serialize_trade(t) for t in trades]
+    try:
+        selected = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Counts come from the ledger rather than a count over the user's trades
+    ledger = await db.run_sync(get_ledger, user.id)
+    counts = {"OPEN": ledger.open_count, "CLOSED": ledger.closed_count}
+    conditions = [Trade.user_id == user.id]
+    if status:
+        conditions.append(Trade.status == status.upper())
+    total = counts.get(status.upper(), 0) if status else ledger.trade_count
+    
+    query = select(Trade).where(*conditions)
+
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.where(or_(
+            Trade.created_at < cursor_created_at,
+            and_(Trade.created_at == cursor_created_at, Trade.id < cursor_id)
+        ))
+    
+    columns = {"id", "created_at"}
+    for field in selected:
+        columns.update(TRADE_FIELD_COLUMNS.get(field, (field,)))
+    query = query.options(load_only(*[getattr(Trade, c) for c in columns]))
+    if "entries" in selected:
+        query = query.options(selectinload(Trade.entries))
+    
+    # Fetch one extra row to know whether another page exists
+    trades = (await db.scalars(query.order_by(Trade.created_at.desc(), Trade.id.desc()).limit(limit + 1))).all()
+    has_more = len(trades) > limit
+    trades = trades[:limit]
+    
+    return {
+        "items": [serialize_trade(t, selected) for t in trades],
+        "total": total,
+        "open_count": counts["OPEN"],
+        "closed_count": counts["CLOSED"],
+        "has_more": has_more,
+        "next_cursor": encode_cursor(trades[-1].created_at, trades[-1].id) if has_more else None
+    }
 
 @router.get("/{trade_id}")
 async def get_trade(
     trade_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    trade = db.query(Trade).filter(Trade.id == trade_id, Trade.user_id == user.id).first()
+    trade = await db.scalar(select(Trade).options(selectinload(Trade.entries)).where(Trade.id == trade_id, Trade.user_id == user.id))
     if not trade:
         raise HTTPException(status_code=404, detail="Trade not found")
     return serialize_trade(trade)
@@ -62,16 +113,10 @@ async def get_trade(
 @router.post("")
 async def create_trade(
     data: TradeCreate,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    trade_count = db.query(Trade).filter(Trade.user_id == user.id).count()
-    trade_number = trade_count + 1
-    
-    # Calculate average price
-    total_value = sum(e.price * e.quantity for e in data.entries)
-    total_qty = sum(e.quantity for e in data.entries)
-    avg_price = total_value / total_qty if total_qty > 0 else 0
+    trade_number = await db.run_sync(reserve_trade_numbers, user.id)
     
     trade = Trade(
         user_id=user.id,
@@ -79,11 +124,11 @@ async def create_trade(
         symbol=data.symbol.upper(),
         instrument_type=data.instrument_type,
         lot_size=data.lot_size,
-        avg_price=avg_price,
+        avg_price=0,
         status="OPEN"
     )
     db.add(trade)
-    db.flush()
+    await db.flush()
     
     for entry in data.entries:
         db.add(TradeEntry(
@@ -92,19 +137,43 @@ async def create_trade(
             lots=entry.lots,
             quantity=entry.quantity
         ))
+        add_fill(trade, entry.price, entry.quantity)
     
-    db.commit()
-    db.refresh(trade)
+    await db.run_sync(apply_ledger_delta, user.id, {}, trade_state(trade))
+    await db.commit()
+    await db.refresh(trade, ["entries"])
     return serialize_trade(trade)
 
+@router.post("/import")
+async def import_tradebook(
+    file: UploadFile = File(...),
+    chunk_size: int = Query(5000, ge=100, le=50000),
+    user: CurrentUser = Depends(get_current_user)
+):
+    """Import a broker tradebook CSV; bad rows are reported, not fatal, and re-imports are no-ops"""
+    def run():
+        # A large file would hold the event loop for seconds, so parse and insert
+        # on a sync session in a worker thread
+        db = SessionLocal()
+        try:
+            return import_trades(db, user.id, file.file, chunk_size=chunk_size)
+        finally:
+            db.close()
+
+    try:
+        report = await run_in_threadpool(run)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return report.as_dict()
+
 @router.post("/{trade_id}/entries")
 async def add_entry(
     trade_id: int,
     data: AddEntry,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    trade = db.query(Trade).filter(Trade.id == trade_id, Trade.user_id == user.id).first()
+    trade = await db.scalar(select(Trade).where(Trade.id == trade_id, Trade.user_id == user.id))
     if not trade:
         raise HTTPException(status_code=404, detail="Trade not found")
     
@@ -112,6 +181,7 @@ async def add_entry(
         raise HTTPException(status_code=400, detail="Cannot add entry to closed trade")
     
     quantity = data.lots * trade.lot_size
+    value = data.price * quantity
     db.add(TradeEntry(
         trade_id=trade.id,
         price=data.price,
@@ -119,31 +189,37 @@ async def add_entry(
         quantity=quantity
     ))
     
-    # Recalculate average
-    entries = db.query(TradeEntry).filter(TradeEntry.trade_id == trade.id).all()
-    total_value = sum(e.price * e.quantity for e in entries) + (data.price * quantity)
-    total_qty = sum(e.quantity for e in entries) + quantity
-    trade.avg_price = total_value / total_qty if total_qty > 0 else 0
+    # Fold the fill into the running totals in SQL, so two fills on the same
+    # trade can't overwrite each other's update
+    await db.execute(update(Trade).where(Trade.id == trade.id).values(
+        total_qty=Trade.total_qty + quantity,
+        total_value=Trade.total_value + value,
+        avg_price=case(
+            (Trade.total_qty + quantity > 0, (Trade.total_value + value) / (Trade.total_qty + quantity)),
+            else_=0
+        )
+    ).execution_options(synchronize_session=False))
     
-    db.commit()
-    db.refresh(trade)
+    await db.commit()
+    await db.refresh(trade, ["avg_price", "total_qty", "total_value", "updated_at", "entries"])
     return serialize_trade(trade)
 
 @router.post("/{trade_id}/close")
 async def close_trade(
     trade_id: int,
     data: TradeClose,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    trade = db.query(Trade).filter(Trade.id == trade_id, Trade.user_id == user.id).first()
+    trade = await db.scalar(select(Trade).options(selectinload(Trade.entries)).where(Trade.id == trade_id, Trade.user_id == user.id))
     if not trade:
         raise HTTPException(status_code=404, detail="Trade not found")
     
     if trade.status != "OPEN":
         raise HTTPException(status_code=400, detail="Trade is already closed")
     
-    total_qty = sum(e.quantity for e in trade.entries)
+    before = trade_state(trade)
+    total_qty = trade.total_qty or 0
     avg_price = trade.avg_price or 0
     
     return_amount = (data.exit_price - avg_price) * total_qty
@@ -158,23 +234,27 @@ async def close_trade(
     trade.outcome = data.outcome or ("WIN" if return_amount >= 0 else "LOSS")
     trade.learnings = data.learnings
     trade.feedback = data.feedback
-    trade.screenshot = data.screenshot
+    try:
+        await set_trade_screenshot(db, trade, data.screenshot)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    db.commit()
-    db.refresh(trade)
+    await db.run_sync(apply_ledger_delta, user.id, before, trade_state(trade))
+    await db.commit()
     return serialize_trade(trade)
 
 @router.patch("/{trade_id}")
 async def update_trade(
     trade_id: int,
     data: TradeUpdate,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    trade = db.query(Trade).filter(Trade.id == trade_id, Trade.user_id == user.id).first()
+    trade = await db.scalar(select(Trade).options(selectinload(Trade.entries)).where(Trade.id == trade_id, Trade.user_id == user.id))
     if not trade:
         raise HTTPException(status_code=404, detail="Trade not found")
     
+    before = trade_state(trade)
     if data.against_trend is not None:
         trade.against_trend = data.against_trend
     if data.learnings is not None:
@@ -182,62 +262,99 @@ async def update_trade(
     if data.feedback is not None:
         trade.feedback = data.feedback
     if data.screenshot is not None:
-        trade.screenshot = data.screenshot
+        try:
+            await set_trade_screenshot(db, trade, data.screenshot)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     if data.outcome is not None and trade.status == "CLOSED":
         trade.outcome = data.outcome
     if data.exit_price is not None and trade.status == "CLOSED":
-        total_qty = sum(e.quantity for e in trade.entries)
+        total_qty = trade.total_qty or 0
         avg_price = trade.avg_price or 0
         trade.exit_price = data.exit_price
         trade.return_amount = (data.exit_price - avg_price) * total_qty
         trade.return_percent = ((data.exit_price - avg_price) / avg_price * 100) if avg_price > 0 else 0
     
-    db.commit()
-    db.refresh(trade)
+    await db.run_sync(apply_ledger_delta, user.id, before, trade_state(trade))
+    await db.commit()
     return serialize_trade(trade)
 
 @router.delete("/{trade_id}")
 async def delete_trade(
     trade_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    trade = db.query(Trade).filter(Trade.id == trade_id, Trade.user_id == user.id).first()
+    trade = await db.scalar(select(Trade).options(selectinload(Trade.entries)).where(Trade.id == trade_id, Trade.user_id == user.id))
     if not trade:
         raise HTTPException(status_code=404, detail="Trade not found")
     
-    db.delete(trade)
-    db.commit()
+    before = trade_state(trade)
+    # Forget its imported fills so re-importing the tradebook can recreate it
+    await db.execute(delete(ImportedFill).where(ImportedFill.trade_id == trade.id))
+    await db.delete(trade)
+    await db.run_sync(apply_ledger_delta, user.id, before, {})
+    await db.commit()
     return {"message": "Trade deleted"}
 
-def serialize_trade(trade: Trade) -> dict:
+def serialize_entry(e: TradeEntry) -> dict:
     return {
-        "id": trade.id,
-        "trade_number": trade.trade_number,
-        "symbol": trade.symbol,
-        "instrument_type": trade.instrument_type,
-        "lot_size": trade.lot_size,
-        "avg_price": trade.avg_price,
-        "exit_price": trade.exit_price,
-        "exit_datetime": trade.exit_datetime.isoformat() if trade.exit_datetime else None,
-        "return_percent": trade.return_percent,
-        "return_amount": trade.return_amount,
-        "status": trade.status,
-        "against_trend": trade.against_trend,
-        "outcome": trade.outcome,
-        "learnings": trade.learnings,
-        "feedback": trade.feedback,
-        "screenshot": trade.screenshot,
-        "created_at": trade.created_at.isoformat(),
-        "updated_at": trade.updated_at.isoformat(),
-        "entries": [
-            {
-                "id": e.id,
-                "price": e.price,
-                "lots": e.lots,
-                "quantity": e.quantity,
-                "datetime": e.datetime.isoformat()
-            }
-            for e in trade.entries
-        ]
+        "id": e.id,
+        "price": e.price,
+        "lots": e.lots,
+        "quantity": e.quantity,
+        "datetime": e.datetime.isoformat()
     }
+
+TRADE_FIELDS = {
+    "id": lambda t: t.id,
+    "trade_number": lambda t: t.trade_number,
+    "symbol": lambda t: t.symbol,
+    "instrument_type": lambda t: t.instrument_type,
+    "lot_size": lambda t: t.lot_size,
+    "avg_price": lambda t: t.avg_price,
+    "total_qty": lambda t: t.total_qty,
+    "total_value": lambda t: t.total_value,
+    "exit_price": lambda t: t.exit_price,
+    "exit_datetime": lambda t: t.exit_datetime.isoformat() if t.exit_datetime else None,
+    "return_percent": lambda t: t.return_percent,
+    "return_amount": lambda t: t.return_amount,
+    "status": lambda t: t.status,
+    "against_trend": lambda t: t.against_trend,
+    "outcome": lambda t: t.outcome,
+    "learnings": lambda t: t.learnings,
+    "feedback": lambda t: t.feedback,
+    "screenshot": lambda t: blob_url(t.screenshot_hash) or t.screenshot,
+    "screenshot_thumb": lambda t: blob_url(t.screenshot_thumb_hash),
+    "created_at": lambda t: t.created_at.isoformat(),
+    "updated_at": lambda t: t.updated_at.isoformat(),
+    "entries": lambda t: [serialize_entry(e) for e in t.entries]
+}
+
+# Fields that are not backed by a Trade column of the same name
+TRADE_FIELD_COLUMNS = {
+    "screenshot": ("screenshot_hash", "screenshot"),
+    "screenshot_thumb": ("screenshot_thumb_hash",),
+    "entries": ()
+}
+
+# Columns the trade list and table views need
+SUMMARY_FIELDS = [
+    "id", "trade_number", "symbol", "instrument_type", "lot_size", "avg_price",
+    "total_qty", "exit_price", "exit_datetime", "return_percent", "return_amount", "status",
+    "against_trend", "outcome", "created_at", "updated_at", "entries"
+]
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(TRADE_FIELDS)
+    if fields == "summary":
+        return SUMMARY_FIELDS
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in TRADE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+def serialize_trade(trade: Trade, fields: Optional[List[str]] = None) -> dict:
+    return {f: TRADE_FIELDS[f](trade) for f in (fields or TRADE_FIELDS)}
@@ -0,0 +1,174 @@
+"""Intraday index history: one append-only file per symbol per IST day.
+
+Raw files (`<TICK_DIR>/<symbol>/<YYYY-MM-DD>.ticks`) hold fixed-width
+(epoch ms, price) records and are read through np.memmap, so a query only
+pages in the day it asks for. Once a day is older than TICK_COMPACT_AFTER_DAYS
+it is rewritten as 1-minute bars (`.1m`) and the raw file removed; days
+older than TICK_RETENTION_DAYS are deleted.
+"""
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+import numpy as np
+from app.config import settings
+
+# Days are split on the exchange's calendar; IST has no daylight saving
+IST = timezone(timedelta(hours=5, minutes=30))
+IST_NAME = "Asia/Kolkata"  # for APIs that take an IANA zone name
+
+TICK_DTYPE = np.dtype([("ts", "<i8"), ("price", "<f8")])
+BAR_DTYPE = np.dtype([("ts", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"),
+                      ("close", "<f8"), ("ticks", "<i8")])
+
+RESOLUTIONS = {"1m": 60, "5m": 300, "15m": 900}
+COMPACT_RESOLUTION = "1m"
+# A day is stored as <date>.ticks (raw) or <date>.1m (compacted)
+DAY_SUFFIXES = ("ticks", COMPACT_RESOLUTION)
+
+def trading_day(ts_ms: int) -> date:
+    return datetime.fromtimestamp(ts_ms / 1000, IST).date()
+
+def _read(path: str, dtype: np.dtype) -> np.ndarray:
+    if not os.path.exists(path):
+        return np.empty(0, dtype=dtype)
+    # A crash mid-append can leave a partial record at the end; ignore it
+    count = os.path.getsize(path) // dtype.itemsize
+    if not count:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+def _sorted(records: np.ndarray) -> np.ndarray:
+    if len(records) > 1 and np.any(np.diff(records["ts"]) < 0):
+        return records[np.argsort(records["ts"], kind="stable")]
+    return records
+
+def resample_ticks(ticks: np.ndarray, seconds: int) -> np.ndarray:
+    """Bucket (ts, price) ticks into OHLC bars aligned to `seconds`"""
+    if not len(ticks):
+        return np.empty(0, dtype=BAR_DTYPE)
+    ticks = _sorted(ticks)
+    buckets = ticks["ts"] // (seconds * 1000)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.concatenate((starts[1:], [len(ticks)]))
+    price = np.asarray(ticks["price"])
+
+    bars = np.empty(len(starts), dtype=BAR_DTYPE)
+    bars["ts"] = buckets[starts] * seconds * 1000
+    bars["open"] = price[starts]
+    bars["high"] = np.maximum.reduceat(price, starts)
+    bars["low"] = np.minimum.reduceat(price, starts)
+    bars["close"] = price[ends - 1]
+    bars["ticks"] = ends - starts
+    return bars
+
+def resample_bars(bars: np.ndarray, seconds: int) -> np.ndarray:
+    """Merge finer bars into coarser ones aligned to `seconds`"""
+    if not len(bars):
+        return np.empty(0, dtype=BAR_DTYPE)
+    bars = _sorted(bars)
+    buckets = bars["ts"] // (seconds * 1000)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.concatenate((starts[1:], [len(bars)]))
+
+    merged = np.empty(len(starts), dtype=BAR_DTYPE)
+    merged["ts"] = buckets[starts] * seconds * 1000
+    merged["open"] = bars["open"][starts]
+    merged["high"] = np.maximum.reduceat(bars["high"], starts)
+    merged["low"] = np.minimum.reduceat(bars["low"], starts)
+    merged["close"] = bars["close"][ends - 1]
+    merged["ticks"] = np.add.reduceat(bars["ticks"], starts)
+    return merged
+
+class TickStore:
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, symbol: str, day: date, suffix: str = "ticks") -> str:
+        return os.path.join(self.root, symbol, f"{day.isoformat()}.{suffix}")
+
+    def append(self, symbol: str, ts_ms: int, price: float):
+        path = self.path(symbol, trading_day(ts_ms))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        record = np.array([(ts_ms, price)], dtype=TICK_DTYPE)
+        with open(path, "ab") as f:
+            f.write(record.tobytes())
+
+    def append_quotes(self, prices: Dict[str, float], ts_ms: Optional[int] = None):
+        ts_ms = ts_ms or int(datetime.now(timezone.utc).timestamp() * 1000)
+        for symbol, price in prices.items():
+            self.append(symbol, ts_ms, price)
+
+    def ticks(self, symbol: str, day: date) -> np.ndarray:
+        return _read(self.path(symbol, day), TICK_DTYPE)
+
+    def ohlc(self, symbol: str, day: date, resolution: str) -> np.ndarray:
+        seconds = RESOLUTIONS[resolution]
+        raw = self.ticks(symbol, day)
+        if len(raw):
+            return resample_ticks(raw, seconds)
+        # Compacted day: only 1-minute bars are left
+        bars = _read(self.path(symbol, day, COMPACT_RESOLUTION), BAR_DTYPE)
+        if resolution == COMPACT_RESOLUTION:
+            return np.array(bars)
+        return resample_bars(bars, seconds)
+
+    def days(self, symbol: str) -> List[date]:
+        folder = os.path.join(self.root, symbol)
+        if not os.path.isdir(folder):
+            return []
+        days = set()
+        for name in os.listdir(folder):
+            # Skip anything else in the folder, like a .tmp left by an interrupted compaction
+            stem, _, suffix = name.partition(".")
+            if suffix not in DAY_SUFFIXES:
+                continue
+            try:
+                days.add(date.fromisoformat(stem))
+            except ValueError:
+                continue
+        return sorted(days)
+
+    def symbols(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def compact_day(self, symbol: str, day: date) -> bool:
+        raw_path = self.path(symbol, day)
+        if not os.path.exists(raw_path):
+            return False
+        bars = resample_ticks(self.ticks(symbol, day), RESOLUTIONS[COMPACT_RESOLUTION])
+        bar_path = self.path(symbol, day, COMPACT_RESOLUTION)
+        tmp_path = bar_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(bars.tobytes())
+        os.replace(tmp_path, bar_path)
+        os.remove(raw_path)
+        return True
+
+    def maintain(self, today: date, compact_after_days: int, retention_days: int) -> Dict[str, int]:
+        """Compact raw days older than `compact_after_days` and delete days older than `retention_days`"""
+        counts = {"compacted": 0, "deleted": 0}
+        for symbol in self.symbols():
+            for day in self.days(symbol):
+                age = (today - day).days
+                if retention_days and age > retention_days:
+                    for suffix in DAY_SUFFIXES:
+                        if os.path.exists(self.path(symbol, day, suffix)):
+                            os.remove(self.path(symbol, day, suffix))
+                    counts["deleted"] += 1
+                elif age > compact_after_days and self.compact_day(symbol, day):
+                    counts["compacted"] += 1
+        return counts
+
+def serialize_bars(bars: np.ndarray) -> List[dict]:
+    return [
+        {
+            "time": datetime.fromtimestamp(ts / 1000, IST).isoformat(),
+            "open": round(o, 2), "high": round(h, 2), "low": round(l, 2), "close": round(c, 2),
+            "ticks": int(n)
+        }
+        for ts, o, h, l, c, n in bars.tolist()
+    ]
+
+tick_store = TickStore(settings.TICK_DIR)
@@ -0,0 +1,341 @@
+"""Bulk import of broker tradebook CSVs.
+
+Fills are read in chunks and replayed per symbol in file order: buys open a
+trade or add an entry to it (averaged like create_trade/add_entry), sells
+reduce the position and close the trade once it is flat, at the
+quantity-weighted sell price. Every fill is recorded in imported_fills under
+a content hash, so importing the same file again changes nothing.
+
+The whole import is one transaction on a sync session; callers run it in a
+worker thread. Bad rows are reported and skipped without stopping the import.
+"""
+import csv
+import hashlib
+import io
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, IO, Iterator, List, Optional
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from app.models.models import Trade, TradeEntry, ImportedFill, Settings
+from app.ledger import rebuild_ledger, reserve_trade_numbers, add_fill
+
+# Header aliases, after lower-casing and replacing spaces with underscores
+COLUMNS = {
+    "symbol": ("symbol", "tradingsymbol", "trading_symbol", "scrip"),
+    "side": ("trade_type", "side", "transaction_type", "buy/sell", "type"),
+    "quantity": ("quantity", "qty"),
+    "price": ("price", "trade_price", "rate"),
+    "executed_at": ("order_execution_time", "execution_time", "trade_time", "datetime", "time",
+                    "trade_date", "date"),
+    "fill_id": ("trade_id", "trade_no", "fill_id"),
+    "exchange": ("exchange",),
+}
+REQUIRED = ("symbol", "side", "quantity", "price", "executed_at")
+
+TIME_FORMATS = ("%d-%m-%Y %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%d-%m-%Y", "%d/%m/%Y")
+
+# Reported individually; the rest only counted
+MAX_REPORTED_ERRORS = 200
+
+class RowError(ValueError):
+    pass
+
+@dataclass
+class Fill:
+    row: int
+    symbol: str
+    side: str
+    quantity: int
+    price: float
+    executed_at: datetime
+    fill_hash: str
+
+@dataclass
+class Position:
+    """An open trade; what was bought is its running entry totals"""
+    trade: Trade
+    sold_qty: int = 0
+    sold_value: float = 0.0
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    imported: int = 0
+    duplicates: int = 0
+    trades_created: int = 0
+    trades_closed: int = 0
+    open_positions: int = 0
+    error_count: int = 0
+    errors: List[dict] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def error(self, row: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "duplicates": self.duplicates,
+            "trades_created": self.trades_created,
+            "trades_closed": self.trades_closed,
+            "open_positions": self.open_positions,
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows / self.seconds, 1) if self.seconds else None
+        }
+
+def parse_time(value: str) -> datetime:
+    value = value.strip()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise RowError(f"Unrecognised time {value!r}")
+
+def map_header(header: List[str]) -> Dict[str, int]:
+    normalized = [h.strip().lower().replace(" ", "_") for h in header]
+    mapping = {}
+    for name, aliases in COLUMNS.items():
+        for alias in aliases:
+            if alias in normalized:
+                mapping[name] = normalized.index(alias)
+                break
+    missing = [name for name in REQUIRED if name not in mapping]
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(missing)}")
+    return mapping
+
+def parse_fill(row_number: int, values: List[str], columns: Dict[str, int],
+               occurrences: Optional[Counter] = None) -> Fill:
+    def get(name):
+        index = columns.get(name)
+        return values[index].strip() if index is not None and index < len(values) else ""
+
+    symbol = get("symbol").upper()
+    if not symbol:
+        raise RowError("Missing symbol")
+    side = get("side").upper()
+    side = {"B": "BUY", "S": "SELL"}.get(side, side)
+    if side not in ("BUY", "SELL"):
+        raise RowError(f"Unknown side {get('side')!r}")
+    try:
+        quantity = float(get("quantity"))
+        price = float(get("price").replace(",", ""))
+    except ValueError:
+        raise RowError("Quantity and price must be numbers")
+    if quantity <= 0 or quantity != int(quantity):
+        raise RowError("Quantity must be a positive whole number")
+    if price <= 0:
+        raise RowError("Price must be positive")
+    executed_at = parse_time(get("executed_at"))
+
+    # Broker fill ids are unique per exchange; without one, the fill's content is its identity
+    fill_id = get("fill_id")
+    if fill_id:
+        identity = f"{get('exchange')}|{fill_id}|{symbol}|{side}"
+    else:
+        identity = f"{symbol}|{side}|{int(quantity)}|{price}|{executed_at.isoformat()}"
+        # Partial fills of one order often repeat quantity, price and second. Number
+        # repeats by their occurrence in the file, so each is a fill of its own and
+        # importing the same file again still gives the same hashes
+        if occurrences is not None:
+            occurrence = occurrences[identity]
+            occurrences[identity] += 1
+            if occurrence:
+                identity = f"{identity}|{occurrence}"
+    return Fill(row_number, symbol, side, int(quantity), price, executed_at,
+                hashlib.sha256(identity.encode()).hexdigest())
+
+def read_chunks(stream: IO[str], chunk_size: int, report: ImportReport) -> Iterator[List[Fill]]:
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        raise ValueError("CSV is empty")
+    columns = map_header(header)
+    occurrences = Counter()
+    chunk = []
+    for values in reader:
+        if not any(v.strip() for v in values):
+            continue
+        report.rows += 1
+        row_number = reader.line_num
+        try:
+            chunk.append(parse_fill(row_number, values, columns, occurrences))
+        except RowError as e:
+            report.error(row_number, str(e))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def instrument_for(symbol: str, settings: Optional[Settings]):
+    """(instrument_type, lot_size) for a broker symbol such as NIFTY2611325750CE"""
+    if symbol.endswith(("CE", "PE")):
+        for prefix, instrument, attr, default in (
+            ("BANKNIFTY", "BANKNIFTY_OPTION", "banknifty_lot_size", 30),
+            ("FINNIFTY", "FINNIFTY_OPTION", "finnifty_lot_size", 60),
+            ("NIFTY", "NIFTY_OPTION", "nifty_lot_size", 65),
+        ):
+            if symbol.startswith(prefix):
+                return instrument, (getattr(settings, attr, None) if settings else None) or default
+    return "STOCK_SWING", 1
+
+class TradeImporter:
+    def __init__(self, db: Session, user_id: int):
+        self.db = db
+        self.user_id = user_id
+        self.settings = db.scalar(select(Settings).where(Settings.user_id == user_id))
+        self.positions: Dict[str, Position] = {}
+        # Symbols already looked up; from then on self.positions is authoritative
+        self.looked_up = set()
+        self.seen = set()
+        self.created: List[Trade] = []
+        self.report = ImportReport()
+
+    def open_position(self, symbol: str) -> Optional[Position]:
+        """The open trade for `symbol`, from this import or an earlier one"""
+        if symbol in self.positions or symbol in self.looked_up:
+            return self.positions.get(symbol)
+        self.looked_up.add(symbol)
+        trade = self.db.scalar(select(Trade).where(
+            Trade.user_id == self.user_id, Trade.symbol == symbol, Trade.status == "OPEN"
+        ).order_by(Trade.created_at.desc()).limit(1))
+        if trade is None:
+            return None
+        sold = self.db.execute(select(
+            func.coalesce(func.sum(ImportedFill.quantity), 0),
+            func.coalesce(func.sum(ImportedFill.quantity * ImportedFill.price), 0)
+        ).where(ImportedFill.trade_id == trade.id, ImportedFill.side == "SELL")).one()
+        position = Position(trade, sold[0], sold[1])
+        self.positions[symbol] = position
+        return position
+
+    def buy(self, fill: Fill) -> Position:
+        position = self.open_position(fill.symbol)
+        if position is None:
+            instrument, lot_size = instrument_for(fill.symbol, self.settings)
+            trade = Trade(
+                user_id=self.user_id,
+                symbol=fill.symbol,
+                instrument_type=instrument,
+                lot_size=lot_size,
+                avg_price=0,
+                total_qty=0,
+                total_value=0,
+                status="OPEN",
+                created_at=fill.executed_at
+            )
+            self.db.add(trade)
+            self.created.append(trade)
+            position = Position(trade)
+            self.positions[fill.symbol] = position
+            self.report.trades_created += 1
+
+        trade = position.trade
+        self.db.add(TradeEntry(
+            trade=trade,
+            price=fill.price,
+            lots=max(1, fill.quantity // (trade.lot_size or 1)),
+            quantity=fill.quantity,
+            datetime=fill.executed_at
+        ))
+        add_fill(trade, fill.price, fill.quantity)
+        trade.updated_at = fill.executed_at
+        return position
+
+    def sell(self, fill: Fill) -> Position:
+        position = self.open_position(fill.symbol)
+        if position is None:
+            raise RowError(f"Sell of {fill.symbol} without an open position")
+        trade = position.trade
+        remaining = trade.total_qty - position.sold_qty
+        if fill.quantity > remaining:
+            raise RowError(f"Sell of {fill.quantity} exceeds the open quantity {remaining}")
+        position.sold_qty += fill.quantity
+        position.sold_value += fill.quantity * fill.price
+
+        trade.updated_at = fill.executed_at
+        if position.sold_qty == trade.total_qty:
+            # Flat: close the way close_trade does, at the average exit price
+            total_qty = trade.total_qty
+            avg_price = trade.avg_price or 0
+            exit_price = position.sold_value / total_qty
+            trade.exit_price = exit_price
+            trade.exit_datetime = fill.executed_at
+            trade.return_amount = (exit_price - avg_price) * total_qty
+            trade.return_percent = ((exit_price - avg_price) / avg_price * 100) if avg_price > 0 else 0
+            trade.status = "CLOSED"
+            trade.outcome = "WIN" if trade.return_amount >= 0 else "LOSS"
+            del self.positions[fill.symbol]
+            self.report.trades_closed += 1
+        return position
+
+    def import_chunk(self, fills: List[Fill]):
+        hashes = [f.fill_hash for f in fills]
+        existing = set(self.db.scalars(select(ImportedFill.fill_hash).where(
+            ImportedFill.user_id == self.user_id, ImportedFill.fill_hash.in_(hashes)
+        )))
+
+        records = []
+        for fill in fills:
+            if fill.fill_hash in existing or fill.fill_hash in self.seen:
+                self.report.duplicates += 1
+                continue
+            try:
+                position = self.buy(fill) if fill.side == "BUY" else self.sell(fill)
+            except RowError as e:
+                self.report.error(fill.row, str(e))
+                continue
+            self.seen.add(fill.fill_hash)
+            records.append((fill, position.trade))
+            self.report.imported += 1
+
+        # Number the chunk's new trades from one reserved block, in the order they were opened
+        if self.created:
+            first = reserve_trade_numbers(self.db, self.user_id, len(self.created))
+            for offset, trade in enumerate(self.created):
+                trade.trade_number = first + offset
+            self.created = []
+
+        # One flush per chunk assigns ids to the new trades in a single batch
+        self.db.flush()
+        self.db.add_all([
+            ImportedFill(user_id=self.user_id, fill_hash=fill.fill_hash, trade_id=trade.id, side=fill.side,
+                         quantity=fill.quantity, price=fill.price, executed_at=fill.executed_at)
+            for fill, trade in records
+        ])
+        self.db.flush()
+
+    def run(self, stream: IO[str], chunk_size: int) -> ImportReport:
+        start = time.perf_counter()
+        for chunk in read_chunks(stream, chunk_size, self.report):
+            self.import_chunk(chunk)
+        self.report.open_positions = len(self.positions)
+        rebuild_ledger(self.db, self.user_id)
+        self.report.seconds = time.perf_counter() - start
+        return self.report
+
+def import_trades(db: Session, user_id: int, stream: IO, chunk_size: int = 5000) -> ImportReport:
+    """Import a tradebook CSV (text or binary stream) and commit; rolls back on a file-level error"""
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        report = TradeImporter(db, user_id).run(stream, chunk_size)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return report
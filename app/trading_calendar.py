@@ -0,0 +1,176 @@
+"""NSE trading calendar held in memory.
+
+Built from the holidays table at startup and kept current by the holiday
+endpoints. Each year is a bitset of trading days (weekdays that are not a
+TRADING holiday) with a running count, so is-trading-day and
+trading-days-between are array lookups and next/previous trading day a binary
+search. Only the year a holiday falls in is rebuilt when one is added or
+removed. Other workers pick up changes on the market poller's daily reload.
+"""
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models.models import Holiday
+
+WEEKDAY_NAMES = ["MONDAY", "TUESDAY", "WEDNESDAY", "THURSDAY", "FRIDAY", "SATURDAY", "SUNDAY"]
+
+@dataclass(frozen=True)
+class HolidayEntry:
+    date: date
+    id: int
+    description: str
+    type: str
+
+    def as_dict(self) -> dict:
+        # Stored as midnight datetimes; keep the API's isoformat unchanged
+        return {
+            "id": self.id,
+            "date": datetime.combine(self.date, datetime.min.time()).isoformat(),
+            "description": self.description,
+            "type": self.type
+        }
+
+def expiry_weekday(name: Optional[str]) -> int:
+    name = (name or "").upper()
+    return WEEKDAY_NAMES.index(name) if name in WEEKDAY_NAMES else WEEKDAY_NAMES.index("TUESDAY")
+
+class TradingYear:
+    def __init__(self, year: int, holidays: Iterable[date]):
+        self.start = date(year, 1, 1)
+        days = (date(year + 1, 1, 1) - self.start).days
+        weekday = (self.start.weekday() + np.arange(days)) % 7
+        trading = weekday < 5
+        for day in holidays:
+            trading[(day - self.start).days] = False
+        self.bits = np.packbits(trading)
+        # counts[i] = trading days before day i of the year
+        self.counts = np.concatenate(([0], np.cumsum(trading))).astype(np.int32)
+        self.days = np.flatnonzero(trading)
+
+    def index(self, day: date) -> int:
+        return (day - self.start).days
+
+    def is_trading_day(self, day: date) -> bool:
+        i = self.index(day)
+        return bool(self.bits[i >> 3] & (0x80 >> (i & 7)))
+
+    @property
+    def total(self) -> int:
+        return int(self.counts[-1])
+
+class TradingCalendar:
+    def __init__(self):
+        self.entries: List[HolidayEntry] = []
+        self.dates: List[date] = []  # parallel to entries, for bisect
+        self.closed: Dict[int, set] = {}  # year -> TRADING holiday dates
+        self.years: Dict[int, TradingYear] = {}
+
+    def load(self, db: Session):
+        rows = db.execute(select(Holiday.id, Holiday.date, Holiday.description, Holiday.type)).all()
+        entries = sorted((HolidayEntry(d.date(), i, desc, t) for i, d, desc, t in rows if d),
+                         key=lambda e: (e.date, e.id))
+        self.entries = entries
+        self.dates = [e.date for e in entries]
+        self.closed = {}
+        for entry in entries:
+            if entry.type == "TRADING":
+                self.closed.setdefault(entry.date.year, set()).add(entry.date)
+        self.years = {}
+
+    def year(self, year: int) -> TradingYear:
+        calendar = self.years.get(year)
+        if calendar is None:
+            calendar = self.years[year] = TradingYear(year, self.closed.get(year, ()))
+        return calendar
+
+    def add(self, entry: HolidayEntry):
+        position = bisect_right(self.dates, entry.date)
+        self.dates.insert(position, entry.date)
+        self.entries.insert(position, entry)
+        if entry.type == "TRADING":
+            self.closed.setdefault(entry.date.year, set()).add(entry.date)
+            self.years.pop(entry.date.year, None)
+
+    def remove(self, holiday_id: int):
+        for position, entry in enumerate(self.entries):
+            if entry.id == holiday_id:
+                del self.entries[position]
+                del self.dates[position]
+                if entry.type == "TRADING" and not any(
+                    e.date == entry.date and e.type == "TRADING" for e in self.entries_between(entry.date, entry.date)
+                ):
+                    self.closed.get(entry.date.year, set()).discard(entry.date)
+                    self.years.pop(entry.date.year, None)
+                return
+
+    def entries_between(self, start: date, end: date) -> List[HolidayEntry]:
+        """Holidays of any type from start to end, inclusive"""
+        return self.entries[bisect_left(self.dates, start):bisect_right(self.dates, end)]
+
+    def is_trading_day(self, day: date) -> bool:
+        return self.year(day.year).is_trading_day(day)
+
+    def next_trading_day(self, day: date) -> date:
+        """The first trading day after `day`"""
+        year = day.year
+        after = self.year(year).index(day) + 1
+        while True:
+            calendar = self.year(year)
+            position = np.searchsorted(calendar.days, after)
+            if position < len(calendar.days):
+                return calendar.start + timedelta(days=int(calendar.days[position]))
+            year, after = year + 1, 0
+
+    def previous_trading_day(self, day: date) -> date:
+        """The last trading day before `day`"""
+        year = day.year
+        before = self.year(year).index(day)
+        while True:
+            calendar = self.year(year)
+            position = np.searchsorted(calendar.days, before)
+            if position > 0:
+                return calendar.start + timedelta(days=int(calendar.days[position - 1]))
+            year, before = year - 1, 366
+
+    def trading_days_between(self, start: date, end: date) -> int:
+        """Trading days from start to end, both inclusive"""
+        if end < start:
+            return 0
+        first, last = self.year(start.year), self.year(end.year)
+        if start.year == end.year:
+            return int(first.counts[first.index(end) + 1] - first.counts[first.index(start)])
+        count = first.total - int(first.counts[first.index(start)]) + int(last.counts[last.index(end) + 1])
+        for year in range(start.year + 1, end.year):
+            count += self.year(year).total
+        return count
+
+    def expiry_on_or_before(self, day: date) -> date:
+        """An expiry that falls on a holiday moves to the previous trading day"""
+        return day if self.is_trading_day(day) else self.previous_trading_day(day)
+
+    def weekly_expiry(self, day: date, expiry_day: Optional[str]) -> date:
+        """The first weekly expiry on or after `day`"""
+        weekday = expiry_weekday(expiry_day)
+        scheduled = day + timedelta(days=(weekday - day.weekday()) % 7)
+        expiry = self.expiry_on_or_before(scheduled)
+        if expiry < day:
+            expiry = self.expiry_on_or_before(scheduled + timedelta(days=7))
+        return expiry
+
+    def monthly_expiry(self, day: date, expiry_day: Optional[str]) -> date:
+        """The first monthly expiry (last expiry weekday of a month) on or after `day`"""
+        weekday = expiry_weekday(expiry_day)
+        month = day.replace(day=1)
+        while True:
+            month_end = (month.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+            scheduled = month_end - timedelta(days=(month_end.weekday() - weekday) % 7)
+            expiry = self.expiry_on_or_before(scheduled)
+            if expiry >= day:
+                return expiry
+            month = month_end + timedelta(days=1)
+
+trading_calendar = TradingCalendar()
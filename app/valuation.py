@@ -0,0 +1,157 @@
+"""Mark-to-market valuation of open trades.
+
+A PriceFeed supplies the latest price per trade symbol together with a
+version that changes on every tick. Valuations are cached per user and keyed
+by that version plus a cheap revision of the user's open trades, so any
+number of dashboard polls between two ticks share one computation.
+"""
+import json
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models.models import Trade
+
+# The targets shown on open trade cards
+TARGET_PERCENTS = (3, 5, 10, 20)
+
+@dataclass
+class PriceSnapshot:
+    version: Hashable
+    prices: Dict[str, float]
+
+def normalize_symbol(symbol: Optional[str]) -> str:
+    return " ".join((symbol or "").upper().split())
+
+class PriceFeed(ABC):
+    @abstractmethod
+    def snapshot(self) -> PriceSnapshot:
+        ...
+
+class MarketPriceFeed(PriceFeed):
+    """Live index levels from the market service. Only trades whose symbol is an
+    index itself are priced; option contracts have no quote here."""
+
+    SYMBOLS = {"NIFTY": "nifty", "NIFTY 50": "nifty", "BANKNIFTY": "banknifty",
+               "NIFTY BANK": "banknifty", "SENSEX": "sensex"}
+
+    def __init__(self, service=None):
+        from app.market import market_service
+        self.service = service or market_service
+
+    def snapshot(self) -> PriceSnapshot:
+        if self.service.updated is None:
+            # Only the built-in placeholder quotes so far; don't value against them
+            return PriceSnapshot(None, {})
+        quotes = self.service.quotes
+        return PriceSnapshot(self.service.updated, {
+            symbol: quotes[key].price for symbol, key in self.SYMBOLS.items()
+        })
+
+class ReplayPriceFeed(PriceFeed):
+    """Replays a JSON Lines file, one {"SYMBOL": price, ...} object per tick. With an
+    interval it advances one tick every `interval` seconds and holds the last one;
+    without, call advance()."""
+
+    def __init__(self, path: str, interval: float = 0.0):
+        with open(path) as f:
+            self.ticks = [
+                {normalize_symbol(symbol): float(price) for symbol, price in json.loads(line).items()}
+                for line in f if line.strip()
+            ]
+        if not self.ticks:
+            raise ValueError(f"No ticks in {path}")
+        self.interval = interval
+        self.started = time.monotonic()
+        self.position = 0
+
+    def advance(self):
+        self.position = min(self.position + 1, len(self.ticks) - 1)
+
+    def snapshot(self) -> PriceSnapshot:
+        if self.interval:
+            elapsed = int((time.monotonic() - self.started) / self.interval)
+            self.position = min(elapsed, len(self.ticks) - 1)
+        return PriceSnapshot(self.position, self.ticks[self.position])
+
+def create_price_feed(spec: str) -> PriceFeed:
+    """"market", or "replay:<path>[@<seconds per tick>]" """
+    if spec == "market":
+        return MarketPriceFeed()
+    if spec.startswith("replay:"):
+        path, _, interval = spec[len("replay:"):].partition("@")
+        return ReplayPriceFeed(path, float(interval or 0))
+    raise ValueError(f"Unknown price feed: {spec}")
+
+def value_position(avg_price: Optional[float], quantity: int, price: Optional[float]) -> dict:
+    valued = price is not None and avg_price is not None
+    targets = []
+    for percent in TARGET_PERCENTS:
+        target = avg_price * (1 + percent / 100) if avg_price is not None else None
+        targets.append({
+            "percent": percent,
+            "price": target,
+            "pl": avg_price * percent / 100 * quantity if avg_price is not None else None,
+            "distance": target - price if valued else None,
+            "distance_percent": (target - price) / price * 100 if valued and price else None,
+            "reached": price >= target if valued else False
+        })
+    return {
+        "quantity": quantity,
+        "avg_price": avg_price,
+        "price": price,
+        "unrealized_pl": (price - avg_price) * quantity if valued else None,
+        "unrealized_percent": (price - avg_price) / avg_price * 100 if valued and avg_price else None,
+        "targets": targets
+    }
+
+class ValuationEngine:
+    def __init__(self, feed: Optional[PriceFeed] = None):
+        self.feed = feed
+        self._cache = {}
+        self.computations = 0
+
+    def get_feed(self) -> PriceFeed:
+        if self.feed is None:
+            self.feed = create_price_feed(settings.MTM_PRICE_FEED)
+        return self.feed
+
+    async def value_open_trades(self, db: AsyncSession, user_id: int) -> dict:
+        snapshot = self.get_feed().snapshot()
+        is_open = (Trade.user_id == user_id) & (Trade.status == "OPEN")
+        # Covered by ix_trades_user_status_updated; changes whenever an open trade
+        # is added, edited (entries bump updated_at), closed or deleted
+        revision = tuple((await db.execute(
+            select(func.count(Trade.id), func.max(Trade.updated_at)).where(is_open)
+        )).one())
+        key = (snapshot.version, revision)
+        cached = self._cache.get(user_id)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        rows = (await db.execute(
+            select(Trade.id, Trade.trade_number, Trade.symbol, Trade.avg_price, func.coalesce(Trade.total_qty, 0))
+            .where(is_open)
+            .order_by(Trade.created_at.asc())
+        )).all()
+        self.computations += 1
+
+        trades: List[dict] = []
+        for trade_id, trade_number, symbol, avg_price, quantity in rows:
+            position = value_position(avg_price, quantity, snapshot.prices.get(normalize_symbol(symbol)))
+            trades.append({"id": trade_id, "trade_number": trade_number, "symbol": symbol, **position})
+
+        priced = [t for t in trades if t["unrealized_pl"] is not None]
+        result = {
+            "unrealized_pl": sum(t["unrealized_pl"] for t in priced),
+            "priced_count": len(priced),
+            "unpriced_count": len(trades) - len(priced),
+            "trades": trades
+        }
+        self._cache[user_id] = (key, result)
+        return result
+
+valuation_engine = ValuationEngine()
@@ -0,0 +1,49 @@
+"""The app reads its settings at import time, so point it at a throwaway
+database, blob store and tick directory before anything from app is imported."""
+import os
+import sys
+import tempfile
+import uuid
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp(prefix="trade-diary-tests-")
+
+os.environ["DATABASE_URL"] = f"sqlite:///{TMP}/trade_diary.db"
+os.environ["BLOB_DIR"] = os.path.join(TMP, "blobs")
+os.environ["TICK_DIR"] = os.path.join(TMP, "ticks")
+os.environ["MARKET_PROVIDER"] = "fake"
+os.environ["EXPENSE_ROLLOVER_INTERVAL_SECONDS"] = "0"
+# static/, templates/ and calendars/ are resolved from the working directory
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def db(client):
+    from app.database import SessionLocal
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def user(client, db):
+    """A fresh user per test, so per-user state like trade numbers starts empty"""
+    from app.models.models import User
+    user = User(username=f"test-{uuid.uuid4().hex[:12]}", password_hash="unused")
+    db.add(user)
+    db.commit()
+    return user
+
+@pytest.fixture
+def auth(user):
+    from app.auth import create_access_token
+    return {"Authorization": f"Bearer {create_access_token({'sub': user.username})}"}
@@ -0,0 +1,38 @@
+"""Closed-trade statistics computed on columnar arrays."""
+from datetime import datetime, timezone
+import numpy as np
+from app.analytics import TradeArrays, compute_analytics
+
+def epoch(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+def arrays(closed_at, pnl):
+    n = len(pnl)
+    return TradeArrays(
+        closed_at=np.array(closed_at, dtype=np.float64),
+        opened_at=np.array(closed_at, dtype=np.float64),
+        pnl=np.array(pnl, dtype=np.float64),
+        returns=np.zeros(n),
+        symbol=np.array(["NIFTY"] * n, dtype=object),
+        instrument_type=np.array(["OPTION"] * n, dtype=object),
+        against_trend=np.zeros(n, dtype=bool)
+    )
+
+def test_best_worst_and_months_in_date_order():
+    # 20:00 UTC on 31 Jan is 1 Feb in IST
+    trades = arrays([epoch(2026, 1, 5, 4), epoch(2026, 1, 31, 20), epoch(2026, 3, 2, 4)], [500, -200, 300])
+    result = compute_analytics(trades, 1000, points=10)
+    assert (result["best_trade"], result["worst_trade"]) == (500, -200)
+    assert [(m["key"], m["trades"], m["pnl"]) for m in result["by_month"]] == [
+        ("2026-01", 1, 500), ("2026-02", 1, -200), ("2026-03", 1, 300)]
+    assert [(p["trade"], p["equity"]) for p in result["equity"]["curve"]] == [(1, 1500), (2, 1300), (3, 1600)]
+
+def test_curve_keeps_trade_numbers_when_downsampled():
+    trades = arrays(np.arange(100) * 3600.0, np.ones(100))
+    curve = compute_analytics(trades, 0, points=10)["equity"]["curve"]
+    assert curve[-1]["trade"] == 100
+    assert all(p["equity"] == p["trade"] for p in curve)
+
+def test_no_trades():
+    result = compute_analytics(arrays([], []), 1000)
+    assert result["best_trade"] is None and result["by_month"] == []
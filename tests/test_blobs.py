@@ -0,0 +1,69 @@
+"""Screenshots: only real images are stored, and blobs are served inertly."""
+import base64
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+import pytest
+from PIL import Image
+from sqlalchemy import func, select
+from app.blobs import blob_path, decode_data_url, register_blobs, write_blob
+from app.models.models import Blob
+
+def png_data_url(color=(200, 30, 30)) -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 30), color).save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+@pytest.fixture
+def trade(client, auth):
+    return client.post("/api/trades", headers=auth, json={
+        "symbol": "NIFTY", "instrument_type": "OPTION", "lot_size": 65, "entries": []
+    }).json()
+
+HTML = base64.b64encode(b"<script>alert(document.cookie)</script>").decode()
+
+@pytest.mark.parametrize("screenshot", [
+    f"data:text/html;base64,{HTML}",
+    f"data:image/svg+xml;base64,{HTML}",
+    f"data:;base64,{HTML}",
+    # Declared as an image, but the bytes are not one
+    f"data:image/png;base64,{HTML}",
+])
+def test_non_images_are_rejected(client, auth, trade, screenshot):
+    response = client.patch(f"/api/trades/{trade['id']}", headers=auth, json={"screenshot": screenshot})
+    assert response.status_code == 400
+    assert client.get(f"/api/trades/{trade['id']}", headers=auth).json()["screenshot"] is None
+
+def test_image_is_served_with_safe_headers(client, auth, trade):
+    response = client.patch(f"/api/trades/{trade['id']}", headers=auth, json={"screenshot": png_data_url()})
+    assert response.status_code == 200
+    url = response.json()["screenshot"]
+
+    response = client.get(url, headers=auth)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["x-content-type-options"] == "nosniff"
+    assert response.headers["content-security-policy"] == "default-src 'none'"
+
+def test_identical_pastes_written_concurrently(client, db):
+    data, _ = decode_data_url(png_data_url((10, 200, 90)))
+    barrier = Barrier(8)
+
+    def write(_):
+        barrier.wait()
+        return write_blob(data)
+
+    with ThreadPoolExecutor(8) as pool:
+        hashes = set(pool.map(write, range(8)))
+    assert len(hashes) == 1
+    blob_hash = hashes.pop()
+    with open(blob_path(blob_hash), "rb") as f:
+        assert f.read() == data
+    assert not [name for name in os.listdir(os.path.dirname(blob_path(blob_hash))) if name.endswith(".tmp")]
+
+    # Registering the same blob twice, as two racing trades would, keeps one row
+    register_blobs(db, [(blob_hash, "image/png", len(data))])
+    register_blobs(db, [(blob_hash, "image/png", len(data))])
+    db.commit()
+    assert db.scalar(select(func.count(Blob.hash)).where(Blob.hash == blob_hash)) == 1
@@ -0,0 +1,49 @@
+"""Keyset cursors on /api/trades and /api/expenses/{id}/payments."""
+import base64
+import pytest
+
+BAD_CURSORS = [
+    "not base64!",
+    "YWJj",  # "abc": no separator
+    base64.urlsafe_b64encode(b"2026-01-01T00:00:00|x").decode(),
+    base64.urlsafe_b64encode(b"yesterday|1").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe|1").decode(),
+    "YQ",  # bad padding
+]
+
+@pytest.mark.parametrize("cursor", BAD_CURSORS)
+def test_bad_cursor_is_a_400(client, auth, cursor):
+    response = client.get("/api/trades", headers=auth, params={"cursor": cursor})
+    assert response.status_code == 400
+
+    expense = client.post("/api/expenses", headers=auth, json={
+        "category": "OTHER", "name": "Data feed", "amount": 100, "billing_cycle": "MONTHLY"
+    }).json()
+    response = client.get(f"/api/expenses/{expense['id']}/payments", headers=auth, params={"cursor": cursor})
+    assert response.status_code == 400
+
+def test_trade_pages_cover_every_trade_once(client, auth):
+    for _ in range(7):
+        client.post("/api/trades", headers=auth, json={
+            "symbol": "NIFTY", "instrument_type": "OPTION", "lot_size": 65, "entries": []
+        })
+    seen, cursor = [], None
+    while True:
+        page = client.get("/api/trades", headers=auth, params={"limit": 3, "cursor": cursor}).json()
+        seen += [trade["id"] for trade in page["items"]]
+        cursor = page["next_cursor"]
+        if not page["has_more"]:
+            break
+    assert len(seen) == len(set(seen)) == page["total"] == 7
+
+def test_status_counts_cover_every_page(client, auth):
+    ids = [client.post("/api/trades", headers=auth, json={
+        "symbol": "NIFTY", "instrument_type": "OPTION", "lot_size": 65,
+        "entries": [{"price": 100, "lots": 1, "quantity": 65}]
+    }).json()["id"] for _ in range(5)]
+    for trade_id in ids[:2]:
+        client.post(f"/api/trades/{trade_id}/close", headers=auth, json={"exit_price": 110})
+    page = client.get("/api/trades", headers=auth, params={"limit": 1}).json()
+    assert (page["total"], page["open_count"], page["closed_count"]) == (5, 3, 2)
+    closed = client.get("/api/trades", headers=auth, params={"limit": 1, "status": "closed"}).json()
+    assert closed["total"] == 2
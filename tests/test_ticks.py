@@ -0,0 +1,17 @@
+"""The tick store only treats its own day files as days."""
+from datetime import date, datetime
+from app.ticks import TickStore, IST
+
+def test_stray_files_are_ignored(tmp_path):
+    store = TickStore(str(tmp_path))
+    ts = int(datetime(2026, 10, 1, 10, 0, tzinfo=IST).timestamp() * 1000)
+    store.append("nifty", ts, 25000.0)
+    store.append("nifty", ts + 60000, 25010.0)
+    folder = tmp_path / "nifty"
+    for name in ("2026-09-30.1m.tmp", ".DS_Store", "notes.txt", "2026-13-01.ticks"):
+        (folder / name).write_bytes(b"")
+
+    assert store.days("nifty") == [date(2026, 10, 1)]
+    assert store.maintain(date(2026, 10, 10), compact_after_days=2, retention_days=90) == {"compacted": 1, "deleted": 0}
+    assert store.days("nifty") == [date(2026, 10, 1)]
+    assert len(store.ohlc("nifty", date(2026, 10, 1), "1m")) == 2
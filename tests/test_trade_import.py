@@ -0,0 +1,62 @@
+"""Tradebook import: re-imports change nothing, and identical partial fills are not merged."""
+from sqlalchemy import select
+from app.models.models import Trade
+
+HEADER = "symbol,trade_type,quantity,price,order_execution_time"
+
+def upload(client, auth, rows, header=HEADER):
+    text = "\n".join([header, *rows]) + "\n"
+    response = client.post("/api/trades/import", headers=auth,
+                           files={"file": ("tradebook.csv", text.encode(), "text/csv")})
+    assert response.status_code == 200
+    return response.json()
+
+def user_trades(db, user):
+    db.expire_all()
+    return db.scalars(select(Trade).where(Trade.user_id == user.id).order_by(Trade.id)).all()
+
+def test_identical_partial_fills_are_separate(client, db, user, auth):
+    # One order filled in two identical parts in the same second, then sold
+    rows = [
+        "NIFTY2611325750CE,buy,65,100.5,2026-01-12 10:15:03",
+        "NIFTY2611325750CE,buy,65,100.5,2026-01-12 10:15:03",
+        "NIFTY2611325750CE,sell,130,110.5,2026-01-12 11:00:00",
+    ]
+    report = upload(client, auth, rows)
+    assert (report["imported"], report["duplicates"], report["error_count"]) == (3, 0, 0)
+
+    [trade] = user_trades(db, user)
+    assert trade.status == "CLOSED"
+    assert trade.total_qty == 130
+    assert trade.return_amount == 10 * 130
+
+def test_reimport_is_idempotent(client, db, user, auth):
+    rows = [
+        "NIFTY2611325750CE,buy,65,100.5,2026-01-12 10:15:03",
+        "NIFTY2611325750CE,buy,65,100.5,2026-01-12 10:15:03",
+        "NIFTY2611325750CE,sell,65,90,2026-01-12 11:00:00",
+        "BANKNIFTY2611352000PE,buy,30,250,2026-01-12 12:00:00",
+    ]
+    first = upload(client, auth, rows)
+    assert first["imported"] == 4
+    before = [(t.id, t.status, t.total_qty, t.total_value) for t in user_trades(db, user)]
+
+    again = upload(client, auth, rows)
+    assert (again["imported"], again["duplicates"]) == (0, 4)
+    assert [(t.id, t.status, t.total_qty, t.total_value) for t in user_trades(db, user)] == before
+
+    # A later export with one more fill imports only that fill
+    more = upload(client, auth, rows + ["NIFTY2611325750CE,sell,65,95,2026-01-12 14:00:00"])
+    assert (more["imported"], more["duplicates"]) == (1, 4)
+    assert [t.status for t in user_trades(db, user)] == ["CLOSED", "OPEN"]
+
+def test_repeated_broker_fill_id_is_a_duplicate(client, db, user, auth):
+    rows = [
+        "NIFTY2611325750CE,buy,65,100.5,2026-01-12 10:15:03,NSE,1001",
+        "NIFTY2611325750CE,buy,65,100.5,2026-01-12 10:15:03,NSE,1001",
+        "NIFTY2611325750CE,buy,65,100.5,2026-01-12 10:15:03,NSE,1002",
+    ]
+    report = upload(client, auth, rows, header=HEADER + ",exchange,trade_id")
+    assert (report["imported"], report["duplicates"]) == (2, 1)
+    [trade] = user_trades(db, user)
+    assert trade.total_qty == 130
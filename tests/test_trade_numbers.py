@@ -0,0 +1,67 @@
+"""Trade numbers allocated concurrently stay unique and contiguous per user."""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from app.database import SessionLocal
+from app.ledger import reserve_trade_numbers
+from app.models.models import Trade
+
+WORKERS = 8
+
+def trade_numbers(db, user_id):
+    return db.scalars(select(Trade.trade_number).where(Trade.user_id == user_id)
+                      .order_by(Trade.trade_number)).all()
+
+def test_parallel_reservations_are_unique_and_contiguous(db, user):
+    barrier = Barrier(WORKERS)
+
+    def reserve(count):
+        # Each worker has its own connection and transaction
+        session = SessionLocal()
+        try:
+            barrier.wait()
+            first = reserve_trade_numbers(session, user.id, count)
+            numbers = list(range(first, first + count))
+            session.add_all(Trade(user_id=user.id, trade_number=n, symbol="NIFTY", status="OPEN")
+                            for n in numbers)
+            session.commit()
+            return numbers
+        finally:
+            session.close()
+
+    counts = [1 + i % 3 for i in range(WORKERS * 3)]
+    with ThreadPoolExecutor(WORKERS) as pool:
+        reserved = list(pool.map(reserve, counts))
+
+    # Each reservation is a consecutive block, and the blocks tile 1..total
+    flat = sorted(n for numbers in reserved for n in numbers)
+    assert flat == list(range(1, sum(counts) + 1))
+    assert trade_numbers(db, user.id) == flat
+
+def test_parallel_creates_get_distinct_numbers(client, db, user, auth):
+    barrier = Barrier(WORKERS)
+
+    def create(_):
+        barrier.wait()
+        response = client.post("/api/trades", headers=auth, json={
+            "symbol": "NIFTY", "instrument_type": "OPTION", "lot_size": 65,
+            "entries": [{"price": 100, "lots": 1, "quantity": 65}]
+        })
+        assert response.status_code == 200
+        return response.json()["trade_number"]
+
+    with ThreadPoolExecutor(WORKERS) as pool:
+        numbers = list(pool.map(create, range(WORKERS * 4)))
+
+    assert sorted(numbers) == list(range(1, WORKERS * 4 + 1))
+    assert trade_numbers(db, user.id) == sorted(numbers)
+
+def test_duplicate_trade_number_is_rejected(db, user):
+    db.add(Trade(user_id=user.id, trade_number=1, symbol="NIFTY", status="OPEN"))
+    db.commit()
+    db.add(Trade(user_id=user.id, trade_number=1, symbol="NIFTY", status="OPEN"))
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
@@ -0,0 +1,61 @@
+"""Running entry totals on trades must always equal a full recompute from TradeEntry."""
+import pytest
+from hypothesis import HealthCheck, given, settings, strategies as st
+from app.ledger import rebuild_trade_totals, trade_totals_drift
+from app.models.models import Trade
+
+LOT_SIZE = 65
+
+# Prices in paise, so they are the two-decimal values a user would type
+fills = st.lists(
+    st.tuples(st.integers(5, 500000).map(lambda paise: paise / 100), st.integers(1, 20)),
+    min_size=1, max_size=12
+)
+
+@settings(max_examples=40, deadline=None, suppress_health_check=[HealthCheck.function_scoped_fixture])
+@given(fills=fills, split=st.integers(0, 12))
+def test_running_totals_match_recompute(client, db, user, auth, fills, split):
+    # The first `split` fills go through create_trade (add_fill), the rest through
+    # POST /entries (the SQL update)
+    opening, added = fills[:split], fills[split:]
+    response = client.post("/api/trades", headers=auth, json={
+        "symbol": "NIFTY", "instrument_type": "OPTION", "lot_size": LOT_SIZE,
+        "entries": [{"price": price, "lots": lots, "quantity": lots * LOT_SIZE} for price, lots in opening]
+    })
+    assert response.status_code == 200
+    trade_id = response.json()["id"]
+    for price, lots in added:
+        response = client.post(f"/api/trades/{trade_id}/entries", headers=auth, json={"price": price, "lots": lots})
+        assert response.status_code == 200
+
+    db.expire_all()
+    assert trade_id not in trade_totals_drift(db, user.id)
+
+    trade = db.get(Trade, trade_id)
+    stored = (trade.total_qty, trade.total_value, trade.avg_price)
+    rebuild_trade_totals(db, [trade_id])
+    assert stored[0] == trade.total_qty == sum(lots * LOT_SIZE for _, lots in fills)
+    assert stored[1] == pytest.approx(trade.total_value)
+    assert stored[2] == pytest.approx(trade.avg_price)
+    assert stored[2] == pytest.approx(trade.total_value / trade.total_qty)
+    db.rollback()
+
+@pytest.mark.parametrize("lots", [0, -1])
+def test_entry_lots_must_be_positive(client, auth, lots):
+    response = client.post("/api/trades", headers=auth, json={
+        "symbol": "NIFTY", "instrument_type": "OPTION", "lot_size": LOT_SIZE, "entries": []
+    })
+    trade = response.json()
+    response = client.post(f"/api/trades/{trade['id']}/entries", headers=auth, json={"price": 100, "lots": lots})
+    assert response.status_code == 422
+
+    response = client.get(f"/api/trades/{trade['id']}", headers=auth)
+    assert response.json()["avg_price"] == 0
+
+@pytest.mark.parametrize("lots, quantity", [(0, 65), (1, 0), (1, -650)])
+def test_opening_entries_must_be_positive(client, auth, lots, quantity):
+    response = client.post("/api/trades", headers=auth, json={
+        "symbol": "NIFTY", "instrument_type": "OPTION", "lot_size": LOT_SIZE,
+        "entries": [{"price": 10, "lots": lots, "quantity": quantity}]
+    })
+    assert response.status_code == 422